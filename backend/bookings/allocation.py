@@ -0,0 +1,137 @@
+# backend/bookings/allocation.py
+"""
+Транзакция подбора ресурсов: «выбрать свободное → создать брони».
+
+Без блокировки два параллельных запроса видят один и тот же свободный стол
+и оба его бронируют. Поэтому подбор выполняется внутри транзакции, которая
+сначала берёт advisory-блокировки Postgres на все затронутые типы ресурсов
+(в порядке возрастания id — чтобы не было взаимных блокировок). Запросы
+к разным типам не мешают друг другу, к одному типу — выстраиваются в очередь.
+
+Ошибки сериализации (40001), взаимоблокировки (40P01) и срабатывание
+exclusion-ограничения (23P01, например гонка с путём без блокировки)
+приводят к повтору всей транзакции с ограниченной экспоненциальной
+задержкой. Если попытки кончились — AllocationConflict (HTTP 409).
+
+Счётчики ожиданий блокировок и повторов лежат в Django cache
+и доступны администратору (BookingViewSet.allocation_stats).
+"""
+import random
+import time
+
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# старшие 32 бита ключа advisory-блокировки — «пространство имён» броней
+LOCK_NAMESPACE = 0x424B
+
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.05   # секунды
+BACKOFF_MAX = 0.5
+
+RETRYABLE_SQLSTATES = {
+    "40001",  # serialization_failure
+    "40P01",  # deadlock_detected
+    "23P01",  # exclusion_violation
+}
+
+STATS_KEY = "allocation:stats:{name}"
+STATS_NAMES = (
+    "transactions",
+    "lock_waits",
+    "lock_wait_ms",
+    "retries",
+    "conflicts",
+)
+
+
+class AllocationConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        "Не удалось забронировать ресурс из-за параллельных запросов. "
+        "Повторите попытку."
+    )
+    default_code = "allocation_conflict"
+
+
+def _count(name, delta=1):
+    key = STATS_KEY.format(name=name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def stats():
+    keys = [STATS_KEY.format(name=name) for name in STATS_NAMES]
+    values = cache.get_many(keys)
+    return {name: values.get(key, 0) for name, key in zip(STATS_NAMES, keys)}
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format(name=name) for name in STATS_NAMES])
+
+
+def _lock_key(type_id):
+    return (LOCK_NAMESPACE << 32) | int(type_id)
+
+
+def lock_resource_types(type_ids):
+    """
+    Берёт транзакционные advisory-блокировки на типы ресурсов.
+    Снимаются автоматически в конце транзакции.
+    """
+    with connection.cursor() as cursor:
+        for type_id in sorted({int(t) for t in type_ids if t is not None}):
+            key = _lock_key(type_id)
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", [key])
+            if cursor.fetchone()[0]:
+                continue
+
+            # блокировку держит другой запрос — ждём и считаем время ожидания
+            started = time.monotonic()
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [key])
+            _count("lock_waits")
+            _count("lock_wait_ms", int((time.monotonic() - started) * 1000))
+
+
+def _sqlstate(exc):
+    cause = exc.__cause__
+    # psycopg 3 — sqlstate, psycopg2 — pgcode
+    return getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+
+
+def _backoff(attempt):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+    time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def run_allocation(type_ids, func):
+    """
+    Выполняет func() в транзакции под блокировками типов type_ids
+    и возвращает её результат.
+
+    Внутри func нужно и выбирать свободные ресурсы, и создавать брони —
+    иначе блокировка ничего не защищает. Если вызов уже внутри чужой
+    транзакции, повторять нечего (откатится вся внешняя) — одна попытка.
+    """
+    attempts = 1 if connection.in_atomic_block else MAX_ATTEMPTS
+
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                _count("transactions")
+                lock_resource_types(type_ids)
+                return func()
+        except DatabaseError as exc:
+            if _sqlstate(exc) not in RETRYABLE_SQLSTATES:
+                raise
+            if attempt == attempts:
+                _count("conflicts")
+                raise AllocationConflict()
+            _count("retries")
+            _backoff(attempt)
@@ -0,0 +1,94 @@
+# backend/bookings/bulk.py
+"""
+Пакетные операции над дочерними бронями (оборудование к рабочему месту).
+
+bulk_create / bulk_update не вызывают save() и не шлют сигналы, поэтому
+всё, что для одиночных броней делают Booking.save() и bookings/signals.py,
+здесь выполняется явно и тоже пакетно:
+  - is_exclusive заполняется при создании объектов;
+  - слотовая загрузка (occupancy) пересчитывается одним rebuild;
+  - индекс интервалов и кэш доступности сбрасываются после коммита.
+"""
+from django.db import transaction
+
+from . import interval_index, occupancy
+from .models import Booking, is_exclusive_resource
+from resources import availability_cache
+
+
+def create_child_bookings(parent_booking, resources, start_dt, end_dt, time_format):
+    """
+    Создаёт брони оборудования resources, привязанные к parent_booking,
+    одним INSERT. Возвращает список Booking с заполненными id.
+    """
+    children = [
+        Booking(
+            user=parent_booking.user,
+            resource=res,
+            booking_type="equipment",
+            time_format=time_format,
+            start_datetime=start_dt,
+            end_datetime=end_dt,
+            status="active",
+            parent_booking=parent_booking,
+            parent_relation_type="equipment",
+            is_exclusive=is_exclusive_resource(res),
+        )
+        for res in resources
+    ]
+    if not children:
+        return []
+
+    created = Booking.objects.bulk_create(children)
+    sync_after_bulk_write(created)
+    return created
+
+
+def set_status(bookings, new_status):
+    """Меняет статус набора броней одним UPDATE."""
+    bookings = list(bookings)
+    if not bookings:
+        return []
+
+    for booking in bookings:
+        booking.status = new_status
+    Booking.objects.bulk_update(bookings, ["status"])
+    sync_after_bulk_write(bookings)
+    return bookings
+
+
+def sync_after_bulk_write(bookings, previous_resources=()):
+    """
+    Аналог сигналов post_save для пакета броней.
+    У броней должен быть загружен resource (нужен type_id).
+
+    previous_resources — ресурсы, с которых брони пакета были перенесены:
+    их загрузку и кэши тоже нужно пересчитать.
+    """
+    bookings = list(bookings)
+    if not bookings:
+        return
+
+    previous_resources = list(previous_resources)
+    resource_ids = {b.resource_id for b in bookings}
+    resource_ids.update(res.id for res in previous_resources)
+    days = set()
+    for b in bookings:
+        days.update(occupancy.days_between(b.start_datetime, b.end_datetime))
+    occupancy.rebuild(resource_ids, days)
+
+    intervals = {
+        (b.resource.type_id, b.start_datetime, b.end_datetime) for b in bookings
+    }
+    previous_type_ids = {res.type_id for res in previous_resources}
+    for b in bookings:
+        for type_id in previous_type_ids:
+            intervals.add((type_id, b.start_datetime, b.end_datetime))
+    type_ids = {type_id for type_id, _, _ in intervals}
+
+    def publish():
+        interval_index.invalidate_types(type_ids)
+        for item in intervals:
+            availability_cache.invalidate(*item)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,245 @@
+# backend/bookings/extension.py
+"""
+Цепочки продления брони по нескольким ресурсам.
+
+Если на своём месте бронь можно продлить только частично, остаток
+интервала можно «добрать» на других местах той же категории: например,
+тот же стол до 15:00, затем стол 7 до 18:00.
+
+План строится жадно по in-memory индексу интервалов (interval_index):
+на каждом шаге из ресурсов, свободных в текущий момент, берётся тот,
+у которого ближайшее насыщение (бронь или outage, забирающие всю
+вместимость) наступает позже всех. Для покрытия отрезка интервалами
+такая стратегия даёт минимальное число переходов. Число переходов
+ограничено MAX_CHAIN_HOPS.
+"""
+import datetime
+from typing import NamedTuple
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import allocation
+from .interval_index import get_type_indexes
+from .models import Booking, BookingChangeLog
+from resources import catalog
+from resources.availability import (
+    AvailabilityQuery,
+    availability_service,
+    base_capacity_of,
+    first_saturation,
+)
+from resources.models import Resource
+
+
+# сколько раз бронь может «переехать» на другое место в одной цепочке
+MAX_CHAIN_HOPS = 3
+
+
+class ChainSegment(NamedTuple):
+    """Отрезок цепочки: ресурс и интервал [start, end) на нём."""
+
+    resource: Resource
+    start: datetime.datetime
+    end: datetime.datetime
+
+    def as_dict(self):
+        return {
+            "resource_id": self.resource.id,
+            "resource_name": self.resource.name,
+            "start": self.start,
+            "end": self.end,
+        }
+
+
+def chain_candidates(resource):
+    """Активные ресурсы той же категории, что и resource (включая его самого)."""
+    rtype = catalog.get_type(resource.type_id)
+    return list(
+        Resource.objects.filter(
+            type__category_id=rtype.category_id,
+            status="active",
+        ).order_by("id")
+    )
+
+
+def _free_until(index, resource, start, end, exclude_booking_id):
+    """
+    До какого момента resource свободен начиная со start (не дальше end) —
+    по индексу интервалов его типа (index), с учётом вместимости и outage.
+    """
+    bookings = [
+        (b_start, b_end)
+        for b_start, b_end, _, _ in index.booking_timeline(resource.id).overlapping(
+            start, end, exclude_key=exclude_booking_id
+        )
+    ]
+    outages = [
+        (o_start, o_end, weight)
+        for o_start, o_end, _, weight in index.outage_timeline(resource.id).overlapping(
+            start, end
+        )
+    ]
+    saturated_at = first_saturation(
+        base_capacity_of(resource), bookings, outages, start, end
+    )
+    return end if saturated_at is None else saturated_at
+
+
+def chain_plan(booking, desired_end, candidates=None, max_hops=MAX_CHAIN_HOPS):
+    """
+    Жадный план продления booking до desired_end.
+
+    Первый отрезок — продление на своём ресурсе (если там есть хоть
+    сколько-то свободного времени), дальше — не больше max_hops переходов
+    на другие ресурсы из candidates.
+
+    Возвращает список ChainSegment; последний end < desired_end означает,
+    что полностью покрыть интервал не удалось.
+    """
+    if candidates is None:
+        candidates = chain_candidates(booking.resource)
+
+    # индексы типов — один раз на план: каждое обращение сверяет версию
+    # с общим кэшем, а дальше всё считается в памяти
+    indexes = get_type_indexes(
+        [booking.resource.type_id, *(res.type_id for res in candidates)]
+    )
+
+    cursor = booking.end_datetime
+    current = booking.resource
+    segments = []
+
+    own_until = _free_until(
+        indexes[current.type_id], current, cursor, desired_end, booking.id
+    )
+    if own_until > cursor:
+        segments.append(ChainSegment(current, cursor, own_until))
+        cursor = own_until
+
+    hops = 0
+    while cursor < desired_end and hops < max_hops:
+        best = None
+        best_until = cursor
+        for res in candidates:
+            if res.id == current.id:
+                continue
+            until = _free_until(
+                indexes[res.type_id], res, cursor, desired_end, booking.id
+            )
+            if until > best_until:
+                best, best_until = res, until
+
+        if best is None:
+            break
+
+        segments.append(ChainSegment(best, cursor, best_until))
+        cursor = best_until
+        current = best
+        hops += 1
+
+    return segments
+
+
+def chain_end(booking, segments):
+    """Момент, до которого цепочка покрывает продление."""
+    return segments[-1].end if segments else booking.end_datetime
+
+
+class ChainUnavailable(APIException):
+    """Цепочка больше не выполнима (место заняли, пока пользователь думал)."""
+
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Цепочка продления больше недоступна."
+    default_code = "chain_unavailable"
+
+
+def confirm_chain(booking, desired_end, expected_resource_ids=None):
+    """
+    Строит и сохраняет цепочку продления атомарно, под блокировками типов
+    ресурсов категории (см. allocation.run_allocation).
+
+    expected_resource_ids — последовательность id ресурсов (int) из показанного
+    пользователю плана; если план изменился, бросаем ChainUnavailable.
+
+    Возвращает (booking, [созданные брони-отрезки]).
+    """
+    candidates = chain_candidates(booking.resource)
+    type_ids = {res.type_id for res in candidates}
+
+    return allocation.run_allocation(
+        type_ids,
+        lambda: _confirm_chain_locked(
+            booking, desired_end, candidates, expected_resource_ids
+        ),
+    )
+
+
+def _confirm_chain_locked(booking, desired_end, candidates, expected_resource_ids):
+    booking.refresh_from_db()
+
+    segments = chain_plan(booking, desired_end, candidates)
+    if not segments or chain_end(booking, segments) < desired_end:
+        raise ChainUnavailable(
+            "Не удалось составить цепочку продления до указанного времени."
+        )
+
+    if expected_resource_ids is not None and [
+        seg.resource.id for seg in segments
+    ] != list(expected_resource_ids):
+        raise ChainUnavailable(
+            "План продления изменился. Запросите варианты продления заново."
+        )
+
+    # индекс мог отстать от БД — перепроверяем каждый отрезок одним пакетом
+    results = availability_service.evaluate(
+        [
+            AvailabilityQuery(seg.resource, seg.start, seg.end, booking.id)
+            for seg in segments
+        ]
+    )
+    if not all(result.available for result in results):
+        raise ChainUnavailable(
+            "Одно из мест цепочки уже занято. Запросите варианты продления заново."
+        )
+
+    old_start = booking.start_datetime
+    old_end = booking.end_datetime
+
+    if segments[0].resource.id == booking.resource_id:
+        booking.end_datetime = segments[0].end
+        booking.save(update_fields=["end_datetime"])
+        BookingChangeLog.objects.create(
+            booking=booking,
+            change_type="extend",
+            old_start=old_start,
+            old_end=old_end,
+            new_start=booking.start_datetime,
+            new_end=booking.end_datetime,
+        )
+        segments = segments[1:]
+
+    created = []
+    for seg in segments:
+        part = Booking.objects.create(
+            user=booking.user,
+            resource=seg.resource,
+            booking_type=booking.booking_type,
+            time_format=booking.time_format,
+            start_datetime=seg.start,
+            end_datetime=seg.end,
+            status="active",
+            parent_booking=booking,
+            parent_relation_type="extension",
+        )
+        BookingChangeLog.objects.create(
+            booking=part,
+            change_type="extend",
+            old_start=None,
+            old_end=None,
+            new_start=part.start_datetime,
+            new_end=part.end_datetime,
+        )
+        created.append(part)
+
+    return booking, created
@@ -0,0 +1,247 @@
+# backend/bookings/interval_index.py
+"""
+In-memory индекс интервалов по ресурсам.
+
+Для каждого типа ресурса лениво загружаем активные/конфликтные брони
+и outage его ресурсов, дальше запросы вида «есть ли пересечение»,
+«следующая бронь», «предыдущая бронь» отвечаются из памяти за O(log n).
+
+У каждого типа есть версия в общем кэше (resources/versions.py).
+Сигналы post_save/post_delete броней и outage (bookings/signals.py)
+после коммита ставят новую версию, и любой процесс — включая
+записавший — при следующем чтении видит расхождение со своей версией
+и перезагружает индекс типа целиком. Правка индекса «на месте» была бы
+корректна только при атомарном инкременте версии, которого у общего
+DatabaseCache нет.
+
+Где используется: проверка продления (extend_booking) и цепочки продления
+(bookings/extension.py); Timeline отдельно — в решателе перераспределения
+(issues/redistribution.py), который заменил поштучные проверки пересечений
+в issues/views.py. Оставшиеся фильтры по интервалу в issues/views.py
+выбирают сами брони для изменения (их нужно прочитать и заблокировать
+в БД), поэтому идут запросом, а не через индекс.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+
+from django.utils import timezone
+
+from resources import versions
+
+
+BUSY_STATUSES = ("active", "conflicted")
+
+# насколько в прошлое загружаем интервалы: индекс нужен для текущих
+# и будущих проверок, старая история в память не попадает
+INDEX_HISTORY = timedelta(days=1)
+
+VERSION_KEY = "interval_index:type:{type_id}:version"
+
+
+# заглушка «бесконечно большого» второго элемента для bisect по кортежам
+class _MaxDatetime:
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, _MaxDatetime)
+
+
+_MAX_DT = _MaxDatetime()
+
+
+class Timeline:
+    """
+    Интервалы одного ресурса (брони или outage).
+
+    Храним два отсортированных списка — по началу и по окончанию.
+    Число пересечений с [start, end) = #(начало < end) - #(окончание <= start),
+    т.е. два бинарных поиска.
+    """
+
+    def __init__(self):
+        self._by_start = []   # (start, end, key, weight)
+        self._by_end = []     # (end, start, key, weight)
+        self._items = {}      # key -> (start, end, weight)
+        self._max_length = timedelta(0)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, key, start, end, weight=1):
+        if key in self._items:
+            self.remove(key)
+        self._items[key] = (start, end, weight)
+        insort(self._by_start, (start, end, key, weight))
+        insort(self._by_end, (end, start, key, weight))
+        # только растёт: верхняя граница длины для поиска пересечений
+        self._max_length = max(self._max_length, end - start)
+
+    def remove(self, key):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        start, end, weight = item
+        self._by_start.remove((start, end, key, weight))
+        self._by_end.remove((end, start, key, weight))
+
+    def overlap_count(self, start, end):
+        """Сколько интервалов пересекает [start, end)."""
+        started_before_end = bisect_left(self._by_start, (end,))
+        ended_before_start = bisect_right(self._by_end, (start, _MAX_DT))
+        return started_before_end - ended_before_start
+
+    def overlapping(self, start, end, exclude_key=None):
+        """
+        Интервалы, пересекающие [start, end): список (start, end, key, weight).
+        Кандидаты ограничены началами в (start - max_length, end).
+        """
+        lo = bisect_left(self._by_start, (start - self._max_length,))
+        hi = bisect_left(self._by_start, (end,))
+        return [
+            item
+            for item in self._by_start[lo:hi]
+            if item[1] > start and item[2] != exclude_key
+        ]
+
+    def next_after(self, moment, exclude_key=None):
+        """Первый интервал с началом >= moment (или None)."""
+        idx = bisect_left(self._by_start, (moment,))
+        while idx < len(self._by_start):
+            item = self._by_start[idx]
+            if item[2] != exclude_key:
+                return item
+            idx += 1
+        return None
+
+    def previous_before(self, moment, exclude_key=None):
+        """Интервал с максимальным окончанием <= moment (или None)."""
+        idx = bisect_right(self._by_end, (moment, _MAX_DT)) - 1
+        while idx >= 0:
+            end, start, key, weight = self._by_end[idx]
+            if key != exclude_key:
+                return start, end, key, weight
+            idx -= 1
+        return None
+
+
+class ResourceTypeIndex:
+    """Индекс броней и outage всех ресурсов одного типа."""
+
+    def __init__(self, type_id, version):
+        self.type_id = type_id
+        self.version = version
+        self.bookings = {}   # resource_id -> Timeline
+        self.outages = {}    # resource_id -> Timeline
+        self._booking_resource = {}   # booking_id -> resource_id
+        self._outage_resource = {}    # outage_id -> resource_id
+
+    def booking_timeline(self, resource_id):
+        return self.bookings.get(resource_id) or Timeline()
+
+    def outage_timeline(self, resource_id):
+        return self.outages.get(resource_id) or Timeline()
+
+    def put_booking(self, booking_id, resource_id, start, end, status):
+        self.drop_booking(booking_id)
+        if status not in BUSY_STATUSES:
+            return
+        self.bookings.setdefault(resource_id, Timeline()).add(booking_id, start, end)
+        self._booking_resource[booking_id] = resource_id
+
+    def drop_booking(self, booking_id):
+        resource_id = self._booking_resource.pop(booking_id, None)
+        if resource_id is not None:
+            self.bookings[resource_id].remove(booking_id)
+
+    def put_outage(self, outage_id, resource_id, start, end, reduction):
+        self.drop_outage(outage_id)
+        self.outages.setdefault(resource_id, Timeline()).add(
+            outage_id, start, end, reduction or 0
+        )
+        self._outage_resource[outage_id] = resource_id
+
+    def drop_outage(self, outage_id):
+        resource_id = self._outage_resource.pop(outage_id, None)
+        if resource_id is not None:
+            self.outages[resource_id].remove(outage_id)
+
+    @classmethod
+    def load(cls, type_id, version):
+        from .models import Booking
+        from issues.models import ResourceOutage
+
+        index = cls(type_id, version)
+        horizon = timezone.now() - INDEX_HISTORY
+
+        bookings = Booking.objects.filter(
+            resource__type_id=type_id,
+            status__in=BUSY_STATUSES,
+            end_datetime__gt=horizon,
+        ).values_list("id", "resource_id", "start_datetime", "end_datetime", "status")
+        for booking_id, resource_id, start, end, status in bookings:
+            index.put_booking(booking_id, resource_id, start, end, status)
+
+        outages = ResourceOutage.objects.filter(
+            resource__type_id=type_id,
+            end_datetime__gt=horizon,
+        ).values_list(
+            "id", "resource_id", "start_datetime", "end_datetime", "capacity_reduction"
+        )
+        for outage_id, resource_id, start, end, reduction in outages:
+            index.put_outage(outage_id, resource_id, start, end, reduction)
+
+        return index
+
+
+_indexes = {}
+_lock = threading.RLock()
+
+
+def get_type_index(type_id):
+    """
+    Актуальный индекс для типа ресурса.
+    Перезагружается, если версия в общем кэше отличается от локальной.
+    """
+    return get_type_indexes([type_id])[type_id]
+
+
+def get_type_indexes(type_ids):
+    """
+    Актуальные индексы набора типов: {type_id: ResourceTypeIndex}.
+    Версии всех типов читаются из общего кэша одним запросом.
+    """
+    type_ids = sorted(set(type_ids))
+    current = versions.current_many(
+        [VERSION_KEY.format(type_id=type_id) for type_id in type_ids]
+    )
+    result = {}
+    with _lock:
+        for type_id, version in zip(type_ids, current):
+            index = _indexes.get(type_id)
+            if index is None or index.version != version:
+                index = ResourceTypeIndex.load(type_id, version)
+                _indexes[type_id] = index
+            result[type_id] = index
+    return result
+
+
+def get_resource_index(resource):
+    """(timeline броней, timeline outage) конкретного ресурса."""
+    index = get_type_index(resource.type_id)
+    return index.booking_timeline(resource.id), index.outage_timeline(resource.id)
+
+
+def invalidate_types(type_ids):
+    """Новая версия индексов типов для всех процессов (после коммита записи)."""
+    type_ids = {type_id for type_id in type_ids if type_id is not None}
+    if not type_ids:
+        return
+    versions.bump_many([VERSION_KEY.format(type_id=type_id) for type_id in type_ids])
+    with _lock:
+        for type_id in type_ids:
+            _indexes.pop(type_id, None)
@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bookings import occupancy
+from resources.models import Resource
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает 15-минутную загрузку ресурсов (ResourceDayOccupancy) "
+        "на диапазон дней. По умолчанию — с сегодняшнего дня на 60 дней вперёд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="Первый день, YYYY-MM-DD")
+        parser.add_argument("--days", type=int, default=60, help="Сколько дней пересчитать")
+
+    def handle(self, *args, **options):
+        if options["date_from"]:
+            first_day = datetime.date.fromisoformat(options["date_from"])
+        else:
+            first_day = timezone.localdate()
+
+        days = [
+            first_day + datetime.timedelta(days=offset)
+            for offset in range(options["days"])
+        ]
+        resource_ids = list(Resource.objects.values_list("id", flat=True))
+
+        # по неделе за раз, чтобы не держать в памяти всё сразу
+        for offset in range(0, len(days), 7):
+            occupancy.rebuild(resource_ids, days[offset:offset + 7])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Загрузка пересчитана: {len(resource_ids)} ресурсов × {len(days)} дней."
+            )
+        )
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bookings", "0001_initial"),
+        ("resources", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceDayOccupancy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("counts", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "resource",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="day_occupancy",
+                        to="resources.resource",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("resource", "day")},
+            },
+        ),
+    ]
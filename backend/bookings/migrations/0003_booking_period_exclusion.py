@@ -0,0 +1,91 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:00
+
+import bookings.models
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+def fill_is_exclusive(apps, schema_editor):
+    Booking = apps.get_model("bookings", "Booking")
+    Booking.objects.filter(resource__capacity__gt=1).update(is_exclusive=False)
+
+
+def check_no_overlaps(apps, schema_editor):
+    """
+    Ограничение не создастся, если в базе уже есть пересекающиеся брони
+    одного места. Вместо невнятной ошибки Postgres показываем список пар,
+    которые нужно разобрать вручную.
+    """
+    Booking = apps.get_model("bookings", "Booking")
+    busy = Booking.objects.filter(
+        status__in=["active", "conflicted"], is_exclusive=True
+    ).order_by("resource_id", "start_datetime")
+
+    conflicts = []
+    last_by_resource = {}
+    for booking_id, resource_id, start, end in busy.values_list(
+        "id", "resource_id", "start_datetime", "end_datetime"
+    ):
+        last = last_by_resource.get(resource_id)
+        if last is not None and last[1] > start:
+            conflicts.append((resource_id, last[0], booking_id))
+        if last is None or end > last[1]:
+            last_by_resource[resource_id] = (booking_id, end)
+
+    if conflicts:
+        lines = "\n".join(
+            f"  resource={resource_id}: booking #{a} пересекается с #{b}"
+            for resource_id, a, b in conflicts[:50]
+        )
+        raise RuntimeError(
+            "Найдены пересекающиеся активные брони одноместных ресурсов "
+            f"({len(conflicts)} шт.), исправьте их перед миграцией:\n{lines}"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bookings", "0002_resourcedayoccupancy"),
+        ("resources", "0001_initial"),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name="booking",
+            name="is_exclusive",
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.RunPython(fill_is_exclusive, migrations.RunPython.noop),
+        migrations.RunPython(check_no_overlaps, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="booking",
+            name="period",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=bookings.models.TsTzRange(
+                    "start_datetime", "end_datetime"
+                ),
+                output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=["period"], name="booking_period_gist"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="booking",
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(
+                condition=models.Q(
+                    ("status__in", ["active", "conflicted"]), ("is_exclusive", True)
+                ),
+                expressions=[("resource", "="), ("period", "&&")],
+                name="booking_exclusive_no_overlap",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:00
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bookings", "0003_booking_period_exclusion"),
+        ("resources", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=django.contrib.postgres.indexes.GistIndex(
+                condition=models.Q(("status__in", ["active", "conflicted"])),
+                fields=["resource", "period"],
+                name="booking_live_res_period_gist",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                condition=models.Q(("status__in", ["active", "conflicted"])),
+                fields=["resource", "start_datetime"],
+                name="booking_live_res_start_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                condition=models.Q(("status__in", ["active", "conflicted"])),
+                fields=["resource", "end_datetime"],
+                name="booking_live_res_end_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["user", "-start_datetime"], name="booking_user_start_idx"
+            ),
+        ),
+    ]
@@ -1,7 +1,29 @@
 from django.db import models
+from django.db.models import Func, Q
 from django.contrib.auth.models import User
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeOperators
+from django.contrib.postgres.indexes import GistIndex
 from resources.models import Resource
 
+from .utils import OVERLAP_CONSTRAINT
+
+
+# брони, которые занимают ресурс
+LIVE_STATUSES = ["active", "conflicted"]
+
+
+class TsTzRange(Func):
+    """tstzrange(start, end) — полуоткрытый диапазон [start, end)."""
+
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
+
+
+def is_exclusive_resource(resource):
+    """Ресурс на одного человека (фиксированное место, оборудование, переговорка)."""
+    return resource.capacity is None or resource.capacity <= 1
+
 
 class Booking(models.Model):
     BOOKING_TYPE_CHOICES = [
@@ -46,11 +68,66 @@ class Booking(models.Model):
         max_length=50, blank=True, null=True, help_text="Тип связи с родительской бронью"
     )
 
+    # [start_datetime, end_datetime) в виде tstzrange — для индексного оператора &&
+    period = models.GeneratedField(
+        expression=TsTzRange("start_datetime", "end_datetime"),
+        output_field=DateTimeRangeField(),
+        db_persist=True,
+    )
+    # копия признака «ресурс на одного» — нужна условию exclusion-ограничения
+    is_exclusive = models.BooleanField(default=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            GistIndex(fields=["period"], name="booking_period_gist"),
+            # проверки занятости: resource_id IN (...) AND period && [start, end)
+            # по живым броням (для общих залов; одноместные покрывает constraint)
+            GistIndex(
+                fields=["resource", "period"],
+                name="booking_live_res_period_gist",
+                condition=Q(status__in=LIVE_STATUSES),
+            ),
+            # «предыдущая» / «следующая» бронь ресурса (продление, best-fit)
+            models.Index(
+                fields=["resource", "start_datetime"],
+                name="booking_live_res_start_idx",
+                condition=Q(status__in=LIVE_STATUSES),
+            ),
+            models.Index(
+                fields=["resource", "end_datetime"],
+                name="booking_live_res_end_idx",
+                condition=Q(status__in=LIVE_STATUSES),
+            ),
+            # «мои брони» отсортированные по началу
+            models.Index(
+                fields=["user", "-start_datetime"],
+                name="booking_user_start_idx",
+            ),
+        ]
+        constraints = [
+            # одно место — одна активная бронь на любой момент времени
+            ExclusionConstraint(
+                name=OVERLAP_CONSTRAINT,
+                expressions=[
+                    ("resource", RangeOperators.EQUAL),
+                    ("period", RangeOperators.OVERLAPS),
+                ],
+                condition=Q(status__in=LIVE_STATUSES, is_exclusive=True),
+            ),
+        ]
+
     def __str__(self):
         return f"Booking #{self.id} by {self.user} for {self.resource}"
 
+    def save(self, *args, **kwargs):
+        self.is_exclusive = is_exclusive_resource(self.resource)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "resource" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "is_exclusive"}
+        super().save(*args, **kwargs)
+
 
 class BookingChangeLog(models.Model):
     CHANGE_TYPE_CHOICES = [
@@ -72,3 +149,25 @@ class BookingChangeLog(models.Model):
 
     def __str__(self):
         return f"Change {self.change_type} for booking #{self.booking_id}"
+
+
+class ResourceDayOccupancy(models.Model):
+    """
+    Загрузка ресурса за один день по 15-минутным слотам рабочего времени
+    (06:00–23:00 → 68 слотов). counts — упакованный массив uint16:
+    сколько активных броней занимает каждый слот.
+    Пересчитывается при записи броней (bookings/occupancy.py).
+    """
+
+    resource = models.ForeignKey(
+        Resource, on_delete=models.CASCADE, related_name="day_occupancy"
+    )
+    day = models.DateField()
+    counts = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("resource", "day")
+
+    def __str__(self):
+        return f"Occupancy of {self.resource_id} on {self.day}"
@@ -0,0 +1,303 @@
+# backend/bookings/occupancy.py
+"""
+Загрузка ресурсов по 15-минутным слотам рабочего дня.
+
+Рабочий день 06:00–23:00 — это 68 слотов. Для каждой пары (ресурс, день)
+храним компактный массив uint16 со счётчиком броней в каждом слоте
+(модель ResourceDayOccupancy). По таким массивам проверки свободной
+вместимости, поиск окон и тепловые карты считаются без SQL-сканов броней.
+"""
+import datetime
+import sys
+from array import array
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
+
+from .utils import WORKDAY_START_HOUR, WORKDAY_END_HOUR
+
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = (WORKDAY_END_HOUR - WORKDAY_START_HOUR) * 60 // SLOT_MINUTES
+
+BUSY_STATUSES = ["active", "conflicted"]
+
+
+# --------------------------------------------------------------------------
+# сетка слотов
+# --------------------------------------------------------------------------
+
+def day_start(day: datetime.date) -> datetime.datetime:
+    """Начало рабочего дня (первый слот) в текущей таймзоне."""
+    return timezone.make_aware(
+        datetime.datetime.combine(day, datetime.time(hour=WORKDAY_START_HOUR)),
+        timezone.get_current_timezone(),
+    )
+
+
+def slot_start(day: datetime.date, slot: int) -> datetime.datetime:
+    return day_start(day) + datetime.timedelta(minutes=SLOT_MINUTES * slot)
+
+
+def slot_span(day: datetime.date, start_dt, end_dt):
+    """
+    Слоты дня day, которые задевает интервал [start_dt, end_dt):
+    (first, last) — полуоткрытый диапазон индексов, first == last если не задевает.
+    Частично занятый слот считается занятым.
+    """
+    base = day_start(day)
+    slot = datetime.timedelta(minutes=SLOT_MINUTES)
+
+    first = (start_dt - base) // slot
+    # ceil для окончания
+    last = -((base - end_dt) // slot)
+
+    first = min(max(first, 0), SLOTS_PER_DAY)
+    last = min(max(last, 0), SLOTS_PER_DAY)
+    return first, max(first, last)
+
+
+def first_slot_from(day: datetime.date, moment) -> int:
+    """Первый слот дня, начинающийся не раньше moment (SLOTS_PER_DAY, если таких нет)."""
+    slot = datetime.timedelta(minutes=SLOT_MINUTES)
+    first = -((day_start(day) - moment) // slot)
+    return min(max(first, 0), SLOTS_PER_DAY)
+
+
+def days_between(start_dt, end_dt):
+    """Локальные даты, которые задевает интервал [start_dt, end_dt)."""
+    first = timezone.localtime(start_dt).date()
+    last = timezone.localtime(end_dt - datetime.timedelta(microseconds=1)).date()
+    days = []
+    day = first
+    while day <= last:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+# --------------------------------------------------------------------------
+# массивы счётчиков
+# --------------------------------------------------------------------------
+
+def empty_counts():
+    return array("H", bytes(2 * SLOTS_PER_DAY))
+
+
+def pack_counts(counts) -> bytes:
+    # в БД всегда little-endian, независимо от платформы
+    if sys.byteorder == "big":
+        counts = array("H", counts)
+        counts.byteswap()
+    return counts.tobytes()
+
+
+def unpack_counts(raw) -> array:
+    counts = array("H")
+    counts.frombytes(bytes(raw))
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return counts
+
+
+def build_counts(day, intervals, weights=None):
+    """
+    Массив загрузки дня по списку интервалов [(start, end), ...].
+    weights — необязательный вес каждого интервала (по умолчанию 1).
+
+    Считается разностным массивом: +w в первом слоте, -w после последнего,
+    затем префиксная сумма.
+    """
+    diff = [0] * (SLOTS_PER_DAY + 1)
+    for idx, (start_dt, end_dt) in enumerate(intervals):
+        first, last = slot_span(day, start_dt, end_dt)
+        if first == last:
+            continue
+        weight = weights[idx] if weights is not None else 1
+        diff[first] += weight
+        diff[last] -= weight
+
+    counts = empty_counts()
+    running = 0
+    for slot in range(SLOTS_PER_DAY):
+        running += diff[slot]
+        counts[slot] = min(max(running, 0), 0xFFFF)
+    return counts
+
+
+def max_in_span(counts, first, last) -> int:
+    """Максимальное значение счётчика в слотах [first, last)."""
+    if first >= last:
+        return 0
+    return max(counts[first:last])
+
+
+def free_runs(free, min_length=1, from_slot=0):
+    """
+    Отсортированный список свободных окон дня: [(first, last), ...],
+    где free[slot] > 0 для всех слотов [first, last) и last - first >= min_length.
+    Слоты раньше from_slot не рассматриваются.
+    """
+    runs = []
+    run_start = None
+    for slot in range(from_slot, len(free) + 1):
+        is_free = slot < len(free) and free[slot] > 0
+        if is_free and run_start is None:
+            run_start = slot
+        elif not is_free and run_start is not None:
+            if slot - run_start >= min_length:
+                runs.append((run_start, slot))
+            run_start = None
+    return runs
+
+
+# --------------------------------------------------------------------------
+# хранение и пересчёт
+# --------------------------------------------------------------------------
+
+def compute(resource_ids, days):
+    """
+    Строит массивы для всех пар (ресурс, день) одним запросом броней,
+    ничего не сохраняя. Возвращает dict {(resource_id, day): counts}.
+    """
+    from .models import Booking
+
+    resource_ids = sorted(set(resource_ids))
+    days = sorted(set(days))
+    if not resource_ids or not days:
+        return {}
+
+    range_start = day_start(days[0])
+    range_end = day_start(days[-1]) + datetime.timedelta(
+        minutes=SLOT_MINUTES * SLOTS_PER_DAY
+    )
+
+    intervals = defaultdict(list)
+    bookings = Booking.objects.filter(
+        resource_id__in=resource_ids,
+        status__in=BUSY_STATUSES,
+        period__overlap=DateTimeTZRange(range_start, range_end),
+    ).values_list("resource_id", "start_datetime", "end_datetime")
+    for resource_id, start_dt, end_dt in bookings:
+        for day in days_between(start_dt, end_dt):
+            intervals[(resource_id, day)].append((start_dt, end_dt))
+
+    return {
+        (resource_id, day): build_counts(day, intervals.get((resource_id, day), []))
+        for resource_id in resource_ids
+        for day in days
+    }
+
+
+def rebuild(resource_ids, days):
+    """
+    Пересчитывает и сохраняет массивы для всех пар (ресурс, день).
+
+    Пересчёты одной пары выстраиваются в очередь: строки сначала
+    создаются (если их нет) и блокируются SELECT ... FOR UPDATE в порядке
+    (resource_id, day), и только потом читаются брони. Блокировка держится
+    до конца транзакции вызывающего кода, поэтому параллельный пересчёт
+    дождётся её коммита и прочитает уже новые брони — более медленный
+    пересчёт со старым снимком не перезапишет свежий.
+
+    Возвращает dict {(resource_id, day): counts}.
+    """
+    from .models import ResourceDayOccupancy
+
+    resource_ids = sorted(set(resource_ids))
+    days = sorted(set(days))
+    if not resource_ids or not days:
+        return {}
+
+    with transaction.atomic():
+        ResourceDayOccupancy.objects.bulk_create(
+            [
+                ResourceDayOccupancy(
+                    resource_id=resource_id, day=day, counts=pack_counts(empty_counts())
+                )
+                for resource_id in resource_ids
+                for day in days
+            ],
+            ignore_conflicts=True,
+        )
+        list(
+            ResourceDayOccupancy.objects.select_for_update()
+            .filter(resource_id__in=resource_ids, day__in=days)
+            .order_by("resource_id", "day")
+            .values_list("id", flat=True)
+        )
+
+        result = compute(resource_ids, days)
+
+        now = timezone.now()
+        ResourceDayOccupancy.objects.bulk_create(
+            [
+                ResourceDayOccupancy(
+                    resource_id=resource_id,
+                    day=day,
+                    counts=pack_counts(counts),
+                    updated_at=now,
+                )
+                for (resource_id, day), counts in result.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["resource", "day"],
+            update_fields=["counts", "updated_at"],
+        )
+    return result
+
+
+def rebuild_for_interval(resource_id, start_dt, end_dt):
+    """Пересчёт всех дней, которые задевает интервал брони."""
+    return rebuild([resource_id], days_between(start_dt, end_dt))
+
+
+def forget_interval(resource_id, start_dt, end_dt):
+    """
+    Удаляет сохранённые массивы дней интервала — они будут построены заново
+    при следующем чтении. Используется при удалении броней (в том числе
+    каскадном вместе с ресурсом, когда вставлять новые строки нельзя).
+    """
+    from .models import ResourceDayOccupancy
+
+    ResourceDayOccupancy.objects.filter(
+        resource_id=resource_id,
+        day__in=days_between(start_dt, end_dt),
+    ).delete()
+
+
+def get_counts(resource_ids, days):
+    """
+    Массивы загрузки для всех пар (ресурс, день).
+    Отсутствующие строки строятся на лету, но не сохраняются: путь чтения
+    ничего не пишет, сохранённые массивы обновляют только пересчёты
+    при записи броней и команда rebuild_occupancy.
+    """
+    from .models import ResourceDayOccupancy
+
+    resource_ids = set(resource_ids)
+    days = set(days)
+
+    result = {}
+    rows = ResourceDayOccupancy.objects.filter(
+        resource_id__in=resource_ids,
+        day__in=days,
+    ).values_list("resource_id", "day", "counts")
+    for resource_id, day, raw in rows:
+        result[(resource_id, day)] = unpack_counts(raw)
+
+    missing_resources = set()
+    missing_days = set()
+    for resource_id in resource_ids:
+        for day in days:
+            if (resource_id, day) not in result:
+                missing_resources.add(resource_id)
+                missing_days.add(day)
+
+    if missing_resources:
+        for key, counts in compute(missing_resources, missing_days).items():
+            result.setdefault(key, counts)
+
+    return result
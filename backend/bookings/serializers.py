@@ -1,10 +1,13 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import IntegrityError, transaction
 
-from .models import Booking
+from .models import Booking, is_exclusive_resource
+from .utils import is_overlap_violation
 from resources.models import Resource
 from resources.serializers import ResourceSerializer
+from resources.availability import availability_service
 from issues.models import Issue
 from issues.serializers import IssueSerializer
 
@@ -15,6 +18,12 @@ class UserShortSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email"]
 
 
+OVERLAP_MESSAGE = (
+    "На указанный интервал ресурс уже забронирован. "
+    "Пожалуйста, выберите другое время."
+)
+
+
 class BookingSerializer(serializers.ModelSerializer):
     user = UserShortSerializer(read_only=True)     # user только read-only
 
@@ -49,7 +58,7 @@ class BookingSerializer(serializers.ModelSerializer):
         - end > start
         - для почасовой брони время кратно 15 минутам
         - пересечения по ресурсу
-        - учёт capacity (общие зоны)
+        - учёт capacity (общие зоны) по пиковой одновременной загрузке
         """
         instance = getattr(self, "instance", None)
 
@@ -89,38 +98,55 @@ class BookingSerializer(serializers.ModelSerializer):
         if not resource or not start or not end:
             return attrs
 
-        # пересечения
-        qs = Booking.objects.filter(
-            resource=resource,
-            status__in=["active", "conflicted"],
+        availability = availability_service.evaluate_one(
+            resource,
+            start,
+            end,
+            exclude_booking_id=instance.id if instance else None,
         )
-        if instance:
-            qs = qs.exclude(id=instance.id)
 
-        overlapping_qs = qs.filter(
-            Q(start_datetime__lt=end) & Q(end_datetime__gt=start)
-        )
+        if availability.reason == "outage":
+            raise serializers.ValidationError(
+                "Ресурс на указанный интервал выведен из работы. "
+                "Пожалуйста, выберите другое время."
+            )
 
-        # ресурс без capacity — фиксированное место / переговорка
-        if resource.capacity is None:
-            if overlapping_qs.exists():
-                raise serializers.ValidationError(
-                    "На указанный интервал ресурс уже забронирован. "
-                    "Пожалуйста, выберите другое время."
-                )
+        # ресурс на одного (фиксированное место / переговорка) — пересечения
+        # отсекает exclusion-ограничение в БД при вставке, см. create/update
+        if is_exclusive_resource(resource):
             return attrs
 
         # ресурс с capacity — общий зал
-        current_count = overlapping_qs.count()
-        if current_count >= resource.capacity:
+        if not availability.available:
             raise serializers.ValidationError(
                 f"На указанный интервал достигнут лимит по количеству "
-                f"одновременных бронирований ({resource.capacity}). "
+                f"одновременных бронирований ({availability.effective_capacity}). "
                 f"Пожалуйста, выберите другое время."
             )
 
         return attrs
 
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError as exc:
+            if not is_overlap_violation(exc):
+                raise
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [OVERLAP_MESSAGE]}
+            )
+
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError as exc:
+            if not is_overlap_violation(exc):
+                raise
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [OVERLAP_MESSAGE]}
+            )
 
 
 class BookingChildSerializer(serializers.ModelSerializer):
@@ -0,0 +1,140 @@
+# backend/bookings/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Booking, is_exclusive_resource
+from . import interval_index, occupancy
+from issues.models import ResourceOutage
+from resources import availability_cache
+from resources.models import Resource
+
+
+def _type_id_of(instance):
+    # ресурс обычно уже загружен во view — тогда обходимся без запроса
+    if instance.__class__.resource.is_cached(instance):
+        return instance.resource.type_id
+    return (
+        Resource.objects.filter(id=instance.resource_id)
+        .values_list("type_id", flat=True)
+        .first()
+    )
+
+
+def _publish(*type_ids):
+    # новая версия индекса — только после коммита: иначе другой процесс
+    # успеет перечитать индекс без этой записи под новой версией
+    transaction.on_commit(lambda: interval_index.invalidate_types(type_ids))
+
+
+def _invalidate_availability(instance, type_id):
+    """
+    Сброс кэша доступности для типа и дней объекта (и его прежнего места).
+    Тоже после коммита: иначе параллельный запрос успеет закэшировать
+    ещё не изменённое состояние под новым поколением.
+    """
+    intervals = [(type_id, instance.start_datetime, instance.end_datetime)]
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None:
+        old_type_id, _, old_start, old_end = previous
+        intervals.append((old_type_id, old_start, old_end))
+
+    def invalidate():
+        for item in set(intervals):
+            availability_cache.invalidate(*item)
+
+    transaction.on_commit(invalidate)
+
+
+def _remember_previous(sender, instance):
+    """
+    Перед сохранением запоминаем, где объект лежал до этого:
+    (type_id, resource_id, start, end). При переносе брони на другой ресурс
+    или время нужно обновить и старое, и новое место.
+    """
+    instance._previous_state = None
+    if instance.pk is None:
+        return
+    instance._previous_state = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("resource__type_id", "resource_id", "start_datetime", "end_datetime")
+        .first()
+    )
+
+
+@receiver(pre_save, sender=Booking)
+def booking_pre_save(sender, instance, **kwargs):
+    _remember_previous(sender, instance)
+
+
+@receiver(pre_save, sender=ResourceOutage)
+def outage_pre_save(sender, instance, **kwargs):
+    _remember_previous(sender, instance)
+
+
+def _refresh_occupancy(instance):
+    """Пересчёт слотовой загрузки для нового и (если отличается) старого места брони."""
+    occupancy.rebuild_for_interval(
+        instance.resource_id, instance.start_datetime, instance.end_datetime
+    )
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None:
+        _, old_resource_id, old_start, old_end = previous
+        if (old_resource_id, old_start, old_end) != (
+            instance.resource_id,
+            instance.start_datetime,
+            instance.end_datetime,
+        ):
+            occupancy.rebuild_for_interval(old_resource_id, old_start, old_end)
+
+
+def _old_type_id(instance):
+    previous = getattr(instance, "_previous_state", None)
+    return previous[0] if previous is not None else None
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, **kwargs):
+    _refresh_occupancy(instance)
+
+    type_id = _type_id_of(instance)
+    _invalidate_availability(instance, type_id)
+    _publish(type_id, _old_type_id(instance))
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    occupancy.forget_interval(
+        instance.resource_id, instance.start_datetime, instance.end_datetime
+    )
+    type_id = _type_id_of(instance)
+    _invalidate_availability(instance, type_id)
+    _publish(type_id)
+
+
+@receiver(post_save, sender=ResourceOutage)
+def outage_saved(sender, instance, **kwargs):
+    type_id = _type_id_of(instance)
+    _invalidate_availability(instance, type_id)
+    _publish(type_id, _old_type_id(instance))
+
+
+@receiver(post_delete, sender=ResourceOutage)
+def outage_deleted(sender, instance, **kwargs):
+    type_id = _type_id_of(instance)
+    _invalidate_availability(instance, type_id)
+    _publish(type_id)
+
+
+@receiver(post_save, sender=Resource)
+def resource_saved(sender, instance, created, **kwargs):
+    """
+    Booking.is_exclusive — копия признака ресурса для условия
+    exclusion-ограничения; при смене capacity пересинхронизируем брони.
+    """
+    if created:
+        return
+    exclusive = is_exclusive_resource(instance)
+    Booking.objects.filter(resource=instance).exclude(is_exclusive=exclusive).update(
+        is_exclusive=exclusive
+    )
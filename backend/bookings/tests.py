@@ -1,3 +1,996 @@
-from django.test import TestCase
+import datetime
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import allocation, occupancy
+from .bulk import create_child_bookings, set_status
+from .extension import ChainSegment, ChainUnavailable, chain_plan, confirm_chain
+from .interval_index import Timeline, get_type_index
+from .models import Booking, ResourceDayOccupancy
+from .serializers import OVERLAP_MESSAGE
+from .utils import WORKDAY_START_HOUR, is_overlap_violation
+from .views import BookingViewSet
+from issues.models import ResourceOutage
+from notifications.models import Notification
+from resources.availability import AvailabilityResult, availability_service
+from resources.models import Resource, ResourceCategory, ResourceType
+from resources.versions import shared_cache
+from resources.views import get_effective_capacity
+
+
+def _at(hour, minute=0):
+    return datetime.datetime(2030, 1, 10, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+class TimelineTests(SimpleTestCase):
+    def setUp(self):
+        self.timeline = Timeline()
+        self.timeline.add(1, _at(9), _at(10))
+        self.timeline.add(2, _at(10), _at(12))
+        self.timeline.add(3, _at(11), _at(11, 30), weight=2)
+        # длинный интервал: поиск кандидатов должен учитывать max_length
+        self.timeline.add(4, _at(6), _at(18))
+
+    def keys(self, items):
+        return sorted(item[2] for item in items)
+
+    def test_overlapping_is_half_open(self):
+        self.assertEqual(self.keys(self.timeline.overlapping(_at(10), _at(11))), [2, 4])
+        self.assertEqual(self.keys(self.timeline.overlapping(_at(8), _at(9))), [4])
+        self.assertEqual(
+            self.keys(self.timeline.overlapping(_at(9, 30), _at(11, 15))), [1, 2, 3, 4]
+        )
+
+    def test_overlapping_excludes_key_and_keeps_weight(self):
+        items = self.timeline.overlapping(_at(11), _at(12), exclude_key=4)
+        self.assertEqual(self.keys(items), [2, 3])
+        self.assertIn((_at(11), _at(11, 30), 3, 2), items)
+
+    def test_overlap_count_matches_overlapping(self):
+        for start, end in ((_at(10), _at(11)), (_at(12), _at(13)), (_at(18), _at(19))):
+            self.assertEqual(
+                self.timeline.overlap_count(start, end),
+                len(self.timeline.overlapping(start, end)),
+            )
+
+    def test_next_after(self):
+        self.assertEqual(self.timeline.next_after(_at(10))[2], 2)
+        self.assertEqual(self.timeline.next_after(_at(10, 1))[2], 3)
+        self.assertEqual(self.timeline.next_after(_at(10), exclude_key=2)[2], 3)
+        self.assertIsNone(self.timeline.next_after(_at(11, 1)))
+
+    def test_previous_before(self):
+        self.assertEqual(self.timeline.previous_before(_at(10))[2], 1)
+        self.assertEqual(self.timeline.previous_before(_at(12))[2], 2)
+        self.assertIsNone(self.timeline.previous_before(_at(9, 59)))
+
+    def test_readd_and_remove(self):
+        self.timeline.add(2, _at(13), _at(14))
+        self.assertEqual(self.keys(self.timeline.overlapping(_at(10), _at(11))), [4])
+        self.timeline.remove(4)
+        self.timeline.remove(99)
+        self.assertEqual(self.keys(self.timeline.overlapping(_at(6), _at(18))), [1, 2, 3])
+        self.assertEqual(len(self.timeline), 3)
+
+
+class OccupancyCountsTests(SimpleTestCase):
+    def setUp(self):
+        self.day = datetime.date(2030, 1, 10)
+
+    def at(self, hour, minute=0, days=0):
+        return occupancy.day_start(self.day + datetime.timedelta(days=days)) + (
+            datetime.timedelta(hours=hour - WORKDAY_START_HOUR, minutes=minute)
+        )
+
+    def test_partial_slots_count_as_busy(self):
+        counts = occupancy.build_counts(self.day, [(self.at(9, 10), self.at(9, 20))])
+        busy = [slot for slot, value in enumerate(counts) if value]
+        self.assertEqual(busy, [12, 13])
+
+    def test_day_edges_are_clipped(self):
+        counts = occupancy.build_counts(
+            self.day,
+            [
+                (self.at(5), self.at(6, 15)),
+                (self.at(22, 50), self.at(23, 30)),
+                (self.at(23), self.at(23, 30)),
+                (self.at(22, days=-1), self.at(5)),
+            ],
+        )
+        self.assertEqual(len(counts), occupancy.SLOTS_PER_DAY)
+        busy = [slot for slot, value in enumerate(counts) if value]
+        self.assertEqual(busy, [0, occupancy.SLOTS_PER_DAY - 1])
+
+    def test_touching_intervals_and_weights(self):
+        counts = occupancy.build_counts(
+            self.day,
+            [(self.at(9), self.at(10)), (self.at(10), self.at(11)), (self.at(9), self.at(11))],
+            weights=[1, 1, 3],
+        )
+        self.assertEqual(set(counts[12:20]), {4})
+        self.assertEqual((counts[11], counts[20]), (0, 0))
+
+    def test_free_runs(self):
+        free = [1, 1, 0, 2, 2, 2, 0, 1]
+        self.assertEqual(occupancy.free_runs(free), [(0, 2), (3, 6), (7, 8)])
+        self.assertEqual(occupancy.free_runs(free, min_length=2), [(0, 2), (3, 6)])
+        self.assertEqual(occupancy.free_runs(free, from_slot=4), [(4, 6), (7, 8)])
+        self.assertEqual(occupancy.free_runs([0, 0]), [])
+
+
+class OccupancyRebuildTests(TestCase):
+    """Сохранённые массивы загрузки совпадают с подсчётом «в лоб»."""
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        self.hall = Resource.objects.create(type=hall_type, name="Зал 1", capacity=5)
+        self.other_hall = Resource.objects.create(type=hall_type, name="Зал 2", capacity=5)
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.next_day = self.day + datetime.timedelta(days=1)
+
+    def at(self, hour, minute=0, days=0):
+        return occupancy.day_start(self.day + datetime.timedelta(days=days)) + (
+            datetime.timedelta(hours=hour - WORKDAY_START_HOUR, minutes=minute)
+        )
+
+    def book(self, resource, start_dt, end_dt):
+        return Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=start_dt,
+            end_datetime=end_dt,
+            status="active",
+        )
+
+    def brute_force(self, resource, day):
+        bookings = Booking.objects.filter(
+            resource=resource, status__in=occupancy.BUSY_STATUSES
+        )
+        slot = datetime.timedelta(minutes=occupancy.SLOT_MINUTES)
+        counts = []
+        for index in range(occupancy.SLOTS_PER_DAY):
+            start = occupancy.slot_start(day, index)
+            counts.append(
+                sum(
+                    b.start_datetime < start + slot and start < b.end_datetime
+                    for b in bookings
+                )
+            )
+        return counts
+
+    def stored(self, resource, day):
+        row = ResourceDayOccupancy.objects.get(resource=resource, day=day)
+        return list(occupancy.unpack_counts(row.counts))
+
+    def assertMatchesBruteForce(self, *pairs):
+        for resource, day in pairs:
+            with self.subTest(resource=resource.name, day=day):
+                self.assertEqual(self.stored(resource, day), self.brute_force(resource, day))
+
+    def test_create_move_cancel(self):
+        self.book(self.hall, self.at(6), self.at(9, 10))
+        self.book(self.hall, self.at(8, 50), self.at(10))
+        late = self.book(self.hall, self.at(21), self.at(7, days=1))
+        self.assertMatchesBruteForce((self.hall, self.day), (self.hall, self.next_day))
+        self.assertTrue(any(self.stored(self.hall, self.next_day)))
+
+        # перенос на другой ресурс и в пределах одного дня: пересчитаны
+        # и старое, и новое место
+        late.resource = self.other_hall
+        late.start_datetime = self.at(22, 45)
+        late.end_datetime = self.at(23)
+        late.save()
+        self.assertMatchesBruteForce(
+            (self.hall, self.day),
+            (self.hall, self.next_day),
+            (self.other_hall, self.day),
+        )
+        self.assertEqual(self.stored(self.other_hall, self.day)[-1], 1)
+        self.assertFalse(any(self.stored(self.hall, self.next_day)))
+
+        late.status = "cancelled"
+        late.save()
+        self.assertMatchesBruteForce((self.other_hall, self.day))
+        self.assertFalse(any(self.stored(self.other_hall, self.day)))
+
+    def test_rebuild_returns_saved_counts(self):
+        self.book(self.hall, self.at(12), self.at(13))
+        ResourceDayOccupancy.objects.all().delete()
+
+        result = occupancy.rebuild([self.hall.id, self.other_hall.id], [self.day])
+
+        self.assertEqual(ResourceDayOccupancy.objects.count(), 2)
+        self.assertEqual(
+            list(result[(self.hall.id, self.day)]), self.brute_force(self.hall, self.day)
+        )
+        self.assertMatchesBruteForce((self.hall, self.day), (self.other_hall, self.day))
+
+    def test_get_counts_computes_missing_rows_without_saving(self):
+        booking = self.book(self.hall, self.at(12), self.at(13))
+        occupancy.forget_interval(self.hall.id, booking.start_datetime, booking.end_datetime)
+        self.assertFalse(ResourceDayOccupancy.objects.filter(resource=self.hall).exists())
+
+        counts = occupancy.get_counts([self.hall.id, self.other_hall.id], [self.day])
+
+        self.assertEqual(
+            list(counts[(self.hall.id, self.day)]), self.brute_force(self.hall, self.day)
+        )
+        self.assertFalse(any(counts[(self.other_hall.id, self.day)]))
+        self.assertFalse(ResourceDayOccupancy.objects.filter(resource=self.hall).exists())
+
+    def test_delete_forgets_rows(self):
+        booking = self.book(self.hall, self.at(12), self.at(13))
+        booking.delete()
+
+        self.assertFalse(ResourceDayOccupancy.objects.filter(resource=self.hall).exists())
+        counts = occupancy.get_counts([self.hall.id], [self.day])
+        self.assertFalse(any(counts[(self.hall.id, self.day)]))
+
+
+class QueryPlanTests(TestCase):
+    """
+    Регрессия планов запросов: ключевые запросы горячих путей должны
+    идти по индексам из миграций bookings 0004, issues 0006 и
+    notifications 0004, а не по Seq Scan или индексам внешних ключей.
+
+    Данные засеваются заранее, после ANALYZE в каждом тесте выключаем
+    seqscan (SET LOCAL enable_seqscan = off), чтобы маленькая тестовая
+    таблица не решала исход. Проверяем имена индексов в EXPLAIN: без
+    новых индексов планировщик возьмёт индекс по resource_id/user_id,
+    и тест упадёт.
+    """
+
+    DESKS = 40
+    EQUIPMENT = 40
+    HALLS = 5
+    DAYS = 30
+    USERS = 20
+    NOTIFICATIONS_PER_USER = 100
+
+    BOOKING_TABLE = Booking._meta.db_table
+    OUTAGE_TABLE = ResourceOutage._meta.db_table
+    NOTIFICATION_TABLE = Notification._meta.db_table
+
+    # индексы, которые должны встречаться в планах по каждой таблице
+    EXPECTED_INDEXES = {
+        BOOKING_TABLE: (
+            "booking_live_res_period_gist",
+            "booking_live_res_start_idx",
+            "booking_live_res_end_idx",
+            "booking_user_start_idx",
+        ),
+        OUTAGE_TABLE: ("outage_res_period_gist", "outage_res_time_idx"),
+        NOTIFICATION_TABLE: ("notif_user_created_idx", "notif_created_idx"),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            [User(username=f"user{i}") for i in range(cls.USERS)]
+        )
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        cls.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        cls.hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        cls.equipment_type = ResourceType.objects.create(category=equipment, name="Монитор")
+
+        resources = (
+            [Resource(type=cls.desk_type, name=f"Стол {i}") for i in range(cls.DESKS)]
+            + [
+                Resource(type=cls.equipment_type, name=f"Монитор {i}")
+                for i in range(cls.EQUIPMENT)
+            ]
+            + [
+                Resource(type=cls.hall_type, name=f"Зал {i}", capacity=20)
+                for i in range(cls.HALLS)
+            ]
+        )
+        Resource.objects.bulk_create(resources)
+        cls.desks = list(Resource.objects.filter(type=cls.desk_type))
+        cls.halls = list(Resource.objects.filter(type=cls.hall_type))
+
+        cls.day = timezone.localdate() + datetime.timedelta(days=1)
+        first_day = cls.day - datetime.timedelta(days=cls.DAYS // 2)
+
+        def at(day, hour):
+            return timezone.make_aware(
+                datetime.datetime.combine(day, datetime.time(hour=hour)),
+                timezone.get_current_timezone(),
+            )
+
+        # по ресурсу: несколько непересекающихся броней в день,
+        # часть — отменённые/завершённые (не попадают в частичные индексы)
+        bookings = []
+        for idx, res in enumerate(Resource.objects.all()):
+            for offset in range(cls.DAYS):
+                day = first_day + datetime.timedelta(days=offset)
+                for n, (h_start, h_end) in enumerate(((8, 10), (11, 13), (14, 17))):
+                    status = "active"
+                    if (idx + offset + n) % 5 == 0:
+                        status = "cancelled"
+                    elif day < cls.day - datetime.timedelta(days=2):
+                        status = "finished"
+                    bookings.append(
+                        Booking(
+                            user=cls.users[(idx + n) % cls.USERS],
+                            resource=res,
+                            booking_type="workspace",
+                            time_format="hour",
+                            start_datetime=at(day, h_start),
+                            end_datetime=at(day, h_end),
+                            status=status,
+                            # bulk_create не вызывает save()
+                            is_exclusive=res.capacity is None or res.capacity <= 1,
+                        )
+                    )
+        Booking.objects.bulk_create(bookings)
+
+        ResourceOutage.objects.bulk_create(
+            [
+                ResourceOutage(
+                    resource=res,
+                    start_datetime=at(first_day + datetime.timedelta(days=offset), 18),
+                    end_datetime=at(first_day + datetime.timedelta(days=offset), 20),
+                    capacity_reduction=1,
+                )
+                for res in cls.desks + cls.halls
+                for offset in range(0, cls.DAYS, 3)
+            ]
+        )
+
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    user=user,
+                    event_type="booking_created",
+                    title="Бронирование создано",
+                    message="Ваше бронирование создано.",
+                )
+                for user in cls.users
+                for _ in range(cls.NOTIFICATIONS_PER_USER)
+            ]
+        )
+
+        with connection.cursor() as cursor:
+            for table in (cls.BOOKING_TABLE, cls.OUTAGE_TABLE, cls.NOTIFICATION_TABLE):
+                cursor.execute(f"ANALYZE {table}")
+
+        cls.start_dt = at(cls.day, 9)
+        cls.end_dt = at(cls.day, 12)
+
+    def setUp(self):
+        # снимок каталога мог остаться от других тестов
+        cache.clear()
+        shared_cache().clear()
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesNewIndexes(self, tables, func):
+        """
+        Выполняет func, перехватывает её SELECT-запросы к tables
+        и проверяет EXPLAIN каждого из них: нет Seq Scan, и по каждой
+        затронутой таблице используется один из EXPECTED_INDEXES.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            touched = [t for t in tables if f'"{t}"' in sql]
+            if not touched:
+                continue
+
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN " + sql)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+
+            for table in touched:
+                self.assertNotIn(
+                    f"Seq Scan on {table}",
+                    plan,
+                    msg=f"Seq Scan по {table}:\n{sql}\n\n{plan}",
+                )
+                self.assertTrue(
+                    any(name in plan for name in self.EXPECTED_INDEXES[table]),
+                    msg=f"по {table} не используется ни один из новых индексов:\n"
+                    f"{sql}\n\n{plan}",
+                )
+            checked += 1
+
+        self.assertGreater(checked, 0, "не перехвачено ни одного запроса к таблицам")
+
+    def test_effective_capacity_uses_indexes(self):
+        for res in (self.desks[0], self.halls[0]):
+            self.assertUsesNewIndexes(
+                [self.BOOKING_TABLE, self.OUTAGE_TABLE],
+                lambda: get_effective_capacity(res, self.start_dt, self.end_dt),
+            )
+
+    def test_allocate_equipment_uses_indexes(self):
+        items = [{"resource_type_id": self.equipment_type.id, "quantity": 2}]
+        self.assertUsesNewIndexes(
+            [self.BOOKING_TABLE, self.OUTAGE_TABLE],
+            lambda: BookingViewSet()._allocate_equipment_resources(
+                self.start_dt, self.end_dt, items
+            ),
+        )
+
+    def test_notification_list_uses_indexes(self):
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+
+        def fetch():
+            response = client.get("/api/notifications/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), self.NOTIFICATIONS_PER_USER)
+
+        self.assertUsesNewIndexes([self.NOTIFICATION_TABLE], fetch)
+
+
+class CreateFixedTests(TestCase):
+    URL = "/api/bookings/create-fixed/"
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        self.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.desk_a = Resource.objects.create(type=self.desk_type, name="Стол A")
+        self.desk_b = Resource.objects.create(type=self.desk_type, name="Стол B")
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+    def local(self, hour, days=0):
+        return timezone.make_aware(
+            datetime.datetime.combine(
+                self.day + datetime.timedelta(days=days), datetime.time(hour=hour)
+            ),
+            timezone.get_current_timezone(),
+        )
+
+    def create(self, start_dt, end_dt):
+        return self.client.post(
+            self.URL,
+            {
+                "resource_type_id": self.desk_type.id,
+                "time_format": "day",
+                "start_datetime": start_dt.isoformat(),
+                "end_datetime": end_dt.isoformat(),
+            },
+            format="json",
+        )
+
+    def test_multi_day_skips_desk_busy_after_first_day(self):
+        # стол A свободен в первый день, но занят на второй
+        Booking.objects.create(
+            user=self.user,
+            resource=self.desk_a,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(10, days=1),
+            end_datetime=self.local(12, days=1),
+            status="active",
+        )
+
+        response = self.create(self.local(9), self.local(18, days=2))
+        self.assertEqual(response.status_code, 201, response.data)
+        booking = Booking.objects.get(user=self.user, resource=self.desk_b)
+        self.assertEqual(booking.start_datetime, self.local(9))
+        self.assertEqual(booking.end_datetime, self.local(18, days=2))
+
+    def test_multi_day_without_free_desk_is_rejected(self):
+        for desk, days in ((self.desk_a, 1), (self.desk_b, 2)):
+            ResourceOutage.objects.create(
+                resource=desk,
+                start_datetime=self.local(6, days=days),
+                end_datetime=self.local(8, days=days),
+            )
+
+        response = self.create(self.local(9), self.local(18, days=2))
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertEqual(Booking.objects.count(), 0)
+
+
+class ApplyChangeOverlapTests(TestCase):
+    """Перенос остатка брони на одноместный ресурс, который успели занять."""
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.other = User.objects.create(username="other")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.desk_a = Resource.objects.create(type=desk_type, name="Стол A")
+        self.desk_b = Resource.objects.create(type=desk_type, name="Стол B")
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.booking = self.book(self.user, self.desk_a, 9, 12)
+        self.book(self.other, self.desk_b, 10, 11)
+
+    def local(self, hour):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time(hour=hour)),
+            timezone.get_current_timezone(),
+        )
+
+    def book(self, user, resource, start_hour, end_hour):
+        return Booking.objects.create(
+            user=user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(start_hour),
+            end_datetime=self.local(end_hour),
+            status="active",
+        )
+
+    def apply_change(self):
+        return self.client.post(
+            f"/api/bookings/{self.booking.id}/apply-change/",
+            {"resource_id": self.desk_b.id},
+            format="json",
+        )
+
+    def test_constraint_rejects_overlapping_insert(self):
+        with self.assertRaises(IntegrityError) as ctx, transaction.atomic():
+            self.book(self.user, self.desk_b, 9, 12)
+        self.assertTrue(is_overlap_violation(ctx.exception))
+
+    def test_busy_resource_is_rejected_by_check(self):
+        response = self.apply_change()
+        self.assertEqual(response.status_code, 409, response.data)
+
+    def test_race_with_constraint_maps_to_conflict(self):
+        # проверка доступности «не увидела» чужую бронь — как при гонке
+        # с параллельным запросом; вставку отсекает exclusion-ограничение
+        free = AvailabilityResult(1, 1, 0, "ok")
+        with mock.patch.object(
+            availability_service,
+            "evaluate",
+            side_effect=lambda queries: [free] * len(queries),
+        ):
+            response = self.apply_change()
+
+        self.assertEqual(response.status_code, 409, response.data)
+        self.assertEqual(response.data["detail"], OVERLAP_MESSAGE)
+        self.booking.refresh_from_db()
+        self.assertEqual(
+            (self.booking.status, self.booking.end_datetime), ("active", self.local(12))
+        )
+        self.assertEqual(Booking.objects.filter(resource=self.desk_b).count(), 1)
+
+
+class BulkSyncTests(TestCase):
+    """Пакетная запись броней видна в occupancy, индексе интервалов и /available/."""
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.monitor_type = ResourceType.objects.create(category=equipment, name="Монитор")
+        desk = Resource.objects.create(type=desk_type, name="Стол")
+        self.monitors = [
+            Resource.objects.create(type=self.monitor_type, name=f"Монитор {i}")
+            for i in (1, 2)
+        ]
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.parent = Booking.objects.create(
+            user=self.user,
+            resource=desk,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(9),
+            end_datetime=self.local(12),
+            status="active",
+        )
+
+    def local(self, hour):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time(hour=hour)),
+            timezone.get_current_timezone(),
+        )
+
+    def available_ids(self):
+        response = self.client.get(
+            "/api/resources/available/",
+            {
+                "booking_type": "equipment",
+                "start_datetime": self.local(10).isoformat(),
+                "end_datetime": self.local(11).isoformat(),
+            },
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(item["id"] for item in response.data)
+
+    def index_load(self, resource):
+        timeline = get_type_index(self.monitor_type.id).booking_timeline(resource.id)
+        return timeline.overlap_count(self.local(10), self.local(11))
+
+    def stored_counts(self, resource):
+        row = ResourceDayOccupancy.objects.get(resource=resource, day=self.day)
+        return occupancy.unpack_counts(row.counts)
+
+    def test_create_and_cancel_children(self):
+        monitor = self.monitors[0]
+        # прогреваем кэш доступности и индекс интервалов
+        self.assertEqual(self.available_ids(), [m.id for m in self.monitors])
+        self.assertEqual(self.index_load(monitor), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            children = create_child_bookings(
+                self.parent, [monitor], self.local(9), self.local(12), "hour"
+            )
+
+        self.assertEqual(
+            self.stored_counts(monitor),
+            occupancy.build_counts(self.day, [(self.local(9), self.local(12))]),
+        )
+        self.assertEqual(self.index_load(monitor), 1)
+        self.assertEqual(self.available_ids(), [self.monitors[1].id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_status(children, "cancelled")
+
+        self.assertFalse(any(self.stored_counts(monitor)))
+        self.assertEqual(self.index_load(monitor), 0)
+        self.assertEqual(self.available_ids(), [m.id for m in self.monitors])
+
+
+class ExtensionChainTests(TestCase):
+    """
+    Продление цепочкой: план, подтверждение и каскадная отмена отрезков.
+
+    Стол 1 (свой) занят другим клиентом с 14:00, стол 2 — с 16:00,
+    стол 3 свободен: продление 12:00 → 18:00 идёт столом 1 до 14:00
+    и столом 3 до 18:00.
+    """
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.other = User.objects.create(username="other")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        monitor_type = ResourceType.objects.create(category=equipment, name="Монитор")
+        self.desks = [
+            Resource.objects.create(type=desk_type, name=f"Стол {i}") for i in (1, 2, 3)
+        ]
+        self.monitor = Resource.objects.create(type=monitor_type, name="Монитор")
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.booking = self.book(self.user, self.desks[0], 9, 12)
+        self.equipment = self.book(
+            self.user,
+            self.monitor,
+            9,
+            12,
+            booking_type="equipment",
+            parent_booking=self.booking,
+            parent_relation_type="equipment",
+        )
+        self.foreign = [
+            self.book(self.other, self.desks[0], 14, 18),
+            self.book(self.other, self.desks[1], 16, 17),
+        ]
+
+    def local(self, hour):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time(hour=hour)),
+            timezone.get_current_timezone(),
+        )
+
+    def book(self, user, resource, start_hour, end_hour, **extra):
+        extra.setdefault("booking_type", "workspace")
+        return Booking.objects.create(
+            user=user,
+            resource=resource,
+            time_format="hour",
+            start_datetime=self.local(start_hour),
+            end_datetime=self.local(end_hour),
+            status="active",
+            **extra,
+        )
+
+    def test_chain_plan_prefers_latest_saturation(self):
+        segments = chain_plan(self.booking, self.local(18))
+        self.assertEqual(
+            segments,
+            [
+                ChainSegment(self.desks[0], self.local(12), self.local(14)),
+                ChainSegment(self.desks[2], self.local(14), self.local(18)),
+            ],
+        )
+
+    def test_chain_plan_respects_max_hops(self):
+        segments = chain_plan(self.booking, self.local(18), max_hops=0)
+        self.assertEqual(
+            segments, [ChainSegment(self.desks[0], self.local(12), self.local(14))]
+        )
+
+    def test_confirm_chain_extends_and_creates_segments(self):
+        booking, parts = confirm_chain(
+            self.booking,
+            self.local(18),
+            [self.desks[0].id, self.desks[2].id],
+        )
+
+        self.assertEqual(booking.end_datetime, self.local(14))
+        self.assertEqual(len(parts), 1)
+        part = Booking.objects.get(pk=parts[0].pk)
+        self.assertEqual(
+            (part.resource_id, part.start_datetime, part.end_datetime),
+            (self.desks[2].id, self.local(14), self.local(18)),
+        )
+        self.assertEqual(
+            (part.parent_booking_id, part.parent_relation_type),
+            (self.booking.id, "extension"),
+        )
+
+    def test_chain_plan_reads_index_versions_once(self):
+        candidates = list(self.desks)
+        chain_plan(self.booking, self.local(18), candidates)  # прогрев индекса
+
+        # одно чтение версий всех типов, дальше — только память,
+        # сколько бы ни было кандидатов и переходов
+        with self.assertNumQueries(1):
+            segments = chain_plan(self.booking, self.local(18), candidates)
+        self.assertEqual(len(segments), 2)
+
+    def extend_chain(self, resource_ids):
+        return self.client.post(
+            f"/api/bookings/{self.booking.id}/extend-confirm/",
+            {
+                "new_end_datetime": self.local(18).isoformat(),
+                "mode": "chain",
+                "resource_ids": resource_ids,
+            },
+            format="json",
+        )
+
+    def test_extend_confirm_validates_resource_ids(self):
+        for resource_ids in (["x"], [None], [True], "1,2", {"id": 1}):
+            with self.subTest(resource_ids=resource_ids):
+                response = self.extend_chain(resource_ids)
+                self.assertEqual(response.status_code, 400, response.data)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_datetime, self.local(12))
+
+    def test_extend_confirm_accepts_numeric_strings(self):
+        response = self.extend_chain([str(self.desks[0].id), str(self.desks[2].id)])
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data["segments"]), 1)
+
+    def test_confirm_chain_rejects_changed_plan(self):
+        with self.assertRaises(ChainUnavailable):
+            confirm_chain(
+                self.booking, self.local(18), [self.desks[0].id, self.desks[1].id]
+            )
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_datetime, self.local(12))
+        self.assertFalse(
+            Booking.objects.filter(parent_relation_type="extension").exists()
+        )
+
+    def test_cancel_cascades_to_extension_segments(self):
+        _, parts = confirm_chain(self.booking, self.local(18))
+
+        response = self.client.post(f"/api/bookings/{self.booking.id}/cancel/")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        cancelled = [self.booking, self.equipment, *parts]
+        for booking in cancelled:
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, "cancelled", booking)
+        for booking in self.foreign:
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, "active", booking)
+
+        self.assertEqual(
+            Notification.objects.filter(
+                user=self.user, event_type="booking_cancelled"
+            ).count(),
+            len(cancelled),
+        )
+
+
+class AllocationStressTests(TransactionTestCase):
+    """
+    Параллельные create_fixed / add-equipment-interval на один интервал:
+    ни один стол и ни одна единица оборудования не должны быть выданы дважды.
+    """
+
+    DESKS = 3
+    MONITORS = 4
+    CLIENTS = 12
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        self.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.monitor_type = ResourceType.objects.create(category=equipment, name="Монитор")
+
+        for i in range(self.DESKS):
+            Resource.objects.create(type=self.desk_type, name=f"Стол {i}")
+        for i in range(self.MONITORS):
+            Resource.objects.create(type=self.monitor_type, name=f"Монитор {i}")
+
+        self.users = [
+            User.objects.create(username=f"client{i}") for i in range(self.CLIENTS)
+        ]
+
+        day = timezone.localdate() + datetime.timedelta(days=1)
+        self.start_dt = timezone.make_aware(
+            datetime.datetime.combine(day, datetime.time(hour=10)),
+            timezone.get_current_timezone(),
+        )
+        self.end_dt = self.start_dt + datetime.timedelta(hours=2)
+
+        allocation.reset_stats()
+
+    def run_concurrently(self, calls):
+        """Запускает calls одновременно в отдельных потоках, возвращает ответы."""
+        barrier = threading.Barrier(len(calls))
+        responses = [None] * len(calls)
+        errors = []
+
+        def worker(idx, call):
+            try:
+                barrier.wait()
+                responses[idx] = call()
+            except Exception as exc:  # noqa: BLE001 — покажем в assert
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(idx, call))
+            for idx, call in enumerate(calls)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        return responses
+
+    def assertNoDoubleBookings(self):
+        live = list(
+            Booking.objects.filter(status__in=["active", "conflicted"]).order_by(
+                "resource_id", "start_datetime"
+            )
+        )
+        for prev, cur in zip(live, live[1:]):
+            if prev.resource_id == cur.resource_id:
+                self.assertLessEqual(
+                    prev.end_datetime,
+                    cur.start_datetime,
+                    msg=f"двойная бронь ресурса {cur.resource_id}: #{prev.id} и #{cur.id}",
+                )
+
+    def create_fixed_call(self, user, with_monitor):
+        def call():
+            client = APIClient()
+            client.force_authenticate(user=user)
+            payload = {
+                "resource_type_id": self.desk_type.id,
+                "time_format": "hour",
+                "start_datetime": self.start_dt.isoformat(),
+                "end_datetime": self.end_dt.isoformat(),
+            }
+            if with_monitor:
+                payload["equipment"] = [
+                    {"resource_type_id": self.monitor_type.id, "quantity": 1}
+                ]
+            return client.post("/api/bookings/create-fixed/", payload, format="json")
+
+        return call
+
+    def test_create_fixed_never_double_books(self):
+        responses = self.run_concurrently(
+            [
+                self.create_fixed_call(user, with_monitor=idx % 2 == 0)
+                for idx, user in enumerate(self.users)
+            ]
+        )
+
+        codes = [r.status_code for r in responses]
+        self.assertEqual(codes.count(201), self.DESKS, codes)
+        self.assertTrue(all(code in (201, 400) for code in codes), codes)
+
+        self.assertNoDoubleBookings()
+        self.assertEqual(
+            Booking.objects.filter(resource__type=self.desk_type).count(), self.DESKS
+        )
+        self.assertGreaterEqual(allocation.stats()["transactions"], self.CLIENTS)
+
+    def test_add_equipment_interval_never_double_books(self):
+        parents = [
+            Booking.objects.create(
+                user=user,
+                resource=desk,
+                booking_type="workspace",
+                time_format="hour",
+                start_datetime=self.start_dt,
+                end_datetime=self.end_dt,
+                status="active",
+            )
+            for user, desk in zip(
+                self.users, Resource.objects.filter(type=self.desk_type)
+            )
+        ]
+
+        def add_monitors(parent):
+            def call():
+                client = APIClient()
+                client.force_authenticate(user=parent.user)
+                return client.post(
+                    f"/api/bookings/{parent.id}/add-equipment-interval/",
+                    {
+                        "resource_type_id": self.monitor_type.id,
+                        "quantity": 2,
+                        "start_datetime": self.start_dt.isoformat(),
+                        "end_datetime": self.end_dt.isoformat(),
+                    },
+                    format="json",
+                )
+
+            return call
+
+        # каждый родитель просит по 2 монитора несколько раз подряд
+        responses = self.run_concurrently(
+            [add_monitors(parent) for parent in parents for _ in range(3)]
+        )
+
+        codes = [r.status_code for r in responses]
+        self.assertEqual(codes.count(201), self.MONITORS // 2, codes)
+
+        self.assertNoDoubleBookings()
+        self.assertEqual(
+            Booking.objects.filter(resource__type=self.monitor_type).count(),
+            self.MONITORS,
+        )
@@ -1,6 +1,14 @@
 # backend/bookings/utils.py
 from datetime import timedelta
 
+# рабочие часы коворкинга
+WORKDAY_START_HOUR = 6   # 06:00
+WORKDAY_END_HOUR = 23    # 23:00
+
+# exclusion-ограничение на пересечение броней одноместного ресурса
+OVERLAP_CONSTRAINT = "booking_exclusive_no_overlap"
+
+
 def round_to_next_15(dt):
     """
     Округляем datetime вверх до следующего 15-минутного интервала.
@@ -14,3 +22,9 @@ def round_to_next_15(dt):
     else:
         dt = dt.replace(minute=minute_block, second=0, microsecond=0)
     return dt
+
+
+def is_overlap_violation(exc):
+    """IntegrityError вызван именно пересечением броней (OVERLAP_CONSTRAINT)?"""
+    diag = getattr(exc.__cause__, "diag", None)
+    return getattr(diag, "constraint_name", None) == OVERLAP_CONSTRAINT
@@ -1,7 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.exceptions import ValidationError
 
 from django.utils import timezone
@@ -11,20 +11,39 @@ import datetime
 from datetime import timedelta
 
 from .models import Booking, BookingChangeLog
-from resources.models import Resource, ResourceType
-from issues.models import ResourceOutage
-from .serializers import BookingSerializer, BookingDetailSerializer
-
-from notifications.utils import create_notification, format_dt
-from .utils import round_to_next_15
-from django.db import transaction
+from resources import catalog
+from resources.models import Resource
+from resources.availability import (
+    AvailabilityQuery,
+    availability_service,
+    best_fit_resource,
+    compute_capacities,
+    extension_limits,
+    find_free_slots,
+    free_units_by_type,
+    plan_equipment,
+)
+from .serializers import OVERLAP_MESSAGE, BookingSerializer, BookingDetailSerializer
+
+from notifications.utils import (
+    create_notification,
+    create_notifications_bulk,
+    format_dt,
+)
+from .utils import (
+    is_overlap_violation,
+    round_to_next_15,
+    WORKDAY_START_HOUR,
+    WORKDAY_END_HOUR,
+)
+from . import allocation
+from .bulk import create_child_bookings, set_status
+from .extension import chain_end, chain_plan, confirm_chain
+from .interval_index import get_resource_index
+from django.db import IntegrityError, transaction
 
 from issues.models import Issue
 
-# рабочие часы коворкинга
-WORKDAY_START_HOUR = 6   # 06:00
-WORKDAY_END_HOUR = 23    # 23:00
-
 
 def check_working_hours(start_dt: datetime.datetime, end_dt: datetime.datetime):
     """
@@ -52,6 +71,27 @@ def check_working_hours(start_dt: datetime.datetime, end_dt: datetime.datetime):
         raise ValueError("Окончание бронирования возможно не позднее 23:00.")
 
 
+def _equipment_type_ids(equipment_items):
+    """
+    id типов из списка оборудования (для блокировок).
+    Некорректные элементы пропускаем — их отклонит основная валидация.
+    """
+    if isinstance(equipment_items, dict):
+        equipment_items = [equipment_items]
+    if not isinstance(equipment_items, list):
+        return []
+
+    type_ids = []
+    for item in equipment_items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            type_ids.append(int(item.get("resource_type_id")))
+        except (TypeError, ValueError):
+            continue
+    return type_ids
+
+
 class BookingViewSet(viewsets.ModelViewSet):
     """
     Бронирования рабочих мест, оборудования, услуг и т.д.
@@ -145,7 +185,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         Возвращает список структур:
         [
           {
-            "type": <ResourceType>,
+            "type": <catalog.TypeInfo>,
             "resources": [<Resource>, <Resource>, ...]  # длиной quantity
           },
           ...
@@ -161,18 +201,17 @@ class BookingViewSet(viewsets.ModelViewSet):
             # допустим формат {"resource_type_id": 5, "quantity": 2}
             equipment_items = [equipment_items]
 
-        allocated = []
-
         if timezone.is_naive(start_dt):
             start_dt = timezone.make_aware(start_dt, timezone.get_current_timezone())
         if timezone.is_naive(end_dt):
             end_dt = timezone.make_aware(end_dt, timezone.get_current_timezone())
 
+        requests = []
         for item in equipment_items:
             try:
                 rtype_id = int(item.get("resource_type_id"))
                 quantity = int(item.get("quantity", 0))
-            except (TypeError, ValueError):
+            except (TypeError, ValueError, AttributeError):
                 raise ValidationError(
                     {"detail": "Неверный формат списка оборудования."}
                 )
@@ -182,89 +221,58 @@ class BookingViewSet(viewsets.ModelViewSet):
                     {"detail": "Количество оборудования должно быть больше нуля."}
                 )
 
-            try:
-                equipment_type = ResourceType.objects.get(id=rtype_id)
-            except ResourceType.DoesNotExist:
+            equipment_type = catalog.get_type(rtype_id)
+            if equipment_type is None:
                 raise ValidationError(
                     {"detail": f"Тип оборудования с id={rtype_id} не найден."}
                 )
 
-            candidates = Resource.objects.filter(
-                type=equipment_type,
-                status="active",
-            )
+            requests.append((equipment_type, quantity))
 
-            if not candidates.exists():
-                raise ValidationError(
-                    {
-                        "detail": (
-                            f"Нет доступных ресурсов для типа оборудования "
-                            f"'{equipment_type.name}'."
-                        )
-                    }
-                )
+        # все типы корзины — за фиксированное число запросов
+        plan, shortage = plan_equipment(requests, start_dt, end_dt)
 
-            # ресурсы, занятые пересекающимися бронированиями 
-            busy_ids = set(
-                Booking.objects.filter(
-                    resource__in=candidates,
-                    status__in=["active", "conflicted"],
-                    start_datetime__lt=end_dt,
-                    end_datetime__gt=start_dt,
-                )
-                .values_list("resource_id", flat=True)
-                .distinct()
-            )
-
-            # ресурсы, выведенные из работы outage'ами 
-            outages = ResourceOutage.objects.filter(
-                resource__in=candidates,
-                start_datetime__lt=end_dt,
-                end_datetime__gt=start_dt,
-            )
-
-            reduction_by_resource: dict[int, int] = {}
-            for o in outages:
-                reduction_by_resource[o.resource_id] = (
-                    reduction_by_resource.get(o.resource_id, 0)
-                    + (o.capacity_reduction or 0)
-                )
-
-            fully_unavailable_ids = set()
-            for res in candidates:
-                base_capacity = res.capacity if res.capacity is not None else 1
-                total_reduction = reduction_by_resource.get(res.id, 0)
-                effective_capacity = base_capacity - total_reduction
-                # если effective_capacity <= 0 — ресурс на этот период полностью недоступен
-                if effective_capacity <= 0:
-                    fully_unavailable_ids.add(res.id)
-
-            busy_ids.update(fully_unavailable_ids)
-
-            free_qs = candidates.exclude(id__in=busy_ids)
-
-            if free_qs.count() < quantity:
+        if shortage:
+            item = shortage[0]
+            if item["total"] == 0:
                 raise ValidationError(
                     {
                         "detail": (
-                            f"Недостаточно свободного оборудования типа "
-                            f"'{equipment_type.name}'. "
-                            f"Запрошено: {quantity}, доступно: {free_qs.count()}."
+                            f"Нет доступных ресурсов для типа оборудования "
+                            f"'{item['type'].name}'."
                         )
                     }
                 )
-
-            allocated.append(
+            raise ValidationError(
                 {
-                    "type": equipment_type,
-                    "resources": list(free_qs[:quantity]),
+                    "detail": (
+                        f"Недостаточно свободного оборудования типа "
+                        f"'{item['type'].name}'. "
+                        f"Запрошено: {item['needed']}, доступно: {item['available']}."
+                    )
                 }
             )
 
-        return allocated
+        return plan
 
 
 
+    @action(
+        detail=False,
+        methods=["get", "delete"],
+        url_path="allocation-stats",
+        permission_classes=[IsAdminUser],
+    )
+    def allocation_stats(self, request):
+        """
+        Счётчики транзакций подбора (только админ): ожидания блокировок,
+        суммарное время ожидания, повторы и конфликты после всех попыток.
+        DELETE — обнулить счётчики.
+        """
+        if request.method == "DELETE":
+            allocation.reset_stats()
+        return Response(allocation.stats())
+
     # -------------------------------------------------------------------------
     # УМНОЕ БРОНИРОВАНИЕ ФИКСИРОВАННЫХ МЕСТ (+ ОПЦИОНАЛЬНОЕ ОБОРУДОВАНИЕ)
     # -------------------------------------------------------------------------
@@ -297,7 +305,8 @@ class BookingViewSet(viewsets.ModelViewSet):
         1) Валидируем даты + рабочие часы.
         2) Находим свободные ресурсы заданного типа.
         3) Для каждого свободного стола считаем "окно" вокруг интервала
-           и выбираем стол с МИНИМАЛЬНЫМ окном.
+           и выбираем стол с МИНИМАЛЬНЫМ окном (при равенстве — меньший id);
+           всё это — один SQL-запрос (best_fit_resource).
         4) Если передано "equipment" — проверяем доступность ВСЕГО оборудования
            через _allocate_equipment_resources (без создания броней).
         5) В одной транзакции:
@@ -348,16 +357,31 @@ class BookingViewSet(viewsets.ModelViewSet):
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # тип фиксированного рабочего места
-        try:
-            rtype = ResourceType.objects.get(id=resource_type_id)
-        except ResourceType.DoesNotExist:
+        rtype = catalog.get_type(resource_type_id)
+        if rtype is None:
             return Response(
                 {"detail": "Тип ресурса с указанным ID не найден."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # подбор и создание — под блокировкой типа стола и типов оборудования,
+        # иначе параллельные запросы получат один и тот же стол
+        return allocation.run_allocation(
+            [rtype.id, *_equipment_type_ids(equipment_items)],
+            lambda: self._allocate_fixed(
+                request, rtype, time_format, start_dt, end_dt, equipment_items
+            ),
+        )
+
+    def _allocate_fixed(
+        self, request, rtype, time_format, start_dt, end_dt, equipment_items
+    ):
+        """
+        Шаги 2–5 create_fixed. Вызывается внутри allocation.run_allocation:
+        выбор стола и оборудования и вставка броней идут под одной блокировкой.
+        """
         # кандидаты – все активные ресурсы этого типа
-        candidates = Resource.objects.filter(type=rtype, status="active")
+        candidates = Resource.objects.filter(type_id=rtype.id, status="active")
 
         if not candidates.exists():
             return Response(
@@ -365,27 +389,6 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # ресурсы, СВОБОДНЫЕ в указанный интервал
-        free_resources = []
-        for res in candidates:
-            overlapping = Booking.objects.filter(
-                resource=res,
-                status__in=["active", "conflicted"],
-                start_datetime__lt=end_dt,
-                end_datetime__gt=start_dt,
-            )
-            if overlapping.exists():
-                continue
-            free_resources.append(res)
-
-        if not free_resources:
-            return Response(
-                {
-                    "detail": "Нет свободных фиксированных рабочих мест на указанный интервал."
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
         # рабочий день по дате начала
         day_date = start_dt.date()
         work_start = timezone.make_aware(
@@ -401,59 +404,36 @@ class BookingViewSet(viewsets.ModelViewSet):
             timezone.get_current_timezone(),
         )
 
-        def free_window_around_interval(res: Resource) -> float:
-            """
-            Окно свободного времени вокруг [start_dt, end_dt) для ресурса res.
-            Чем меньше окно, тем "плотнее" упаковано бронирование.
-            """
-            prev_booking = (
-                Booking.objects.filter(
-                    resource=res,
-                    status__in=["active", "conflicted"],
-                    end_datetime__lte=start_dt,
-                    end_datetime__gt=work_start,
-                )
-                .order_by("-end_datetime")
-                .first()
-            )
-
-            next_booking = (
-                Booking.objects.filter(
-                    resource=res,
-                    status__in=["active", "conflicted"],
-                    start_datetime__gte=end_dt,
-                    start_datetime__lt=work_end,
-                )
-                .order_by("start_datetime")
-                .first()
-            )
-
-            window_start = work_start
-            if prev_booking:
-                window_start = max(window_start, prev_booking.end_datetime)
-
-            window_end = work_end
-            if next_booking:
-                window_end = min(window_end, next_booking.start_datetime)
-
-            if window_end <= window_start:
-                return float("inf")
-
-            return (window_end - window_start).total_seconds()
-
-        # выбираем стол с минимальным свободным окном
-        best_resource = None
-        best_window = float("inf")
-
-        for res in free_resources:
-            window = free_window_around_interval(res)
-            if window < best_window:
-                best_window = window
-                best_resource = res
+        # свободный стол с минимальным окном вокруг интервала — один запрос
+        best_resource = best_fit_resource(
+            candidates, start_dt, end_dt, work_start, work_end
+        )
 
         if best_resource is None:
+            # подсказываем ближайшие свободные старты той же длительности
+            alternatives = []
+            if time_format == "hour":
+                alternatives = [
+                    {
+                        "resource_id": res.id,
+                        "resource_name": res.name,
+                        "start_datetime": alt_start,
+                        "end_datetime": alt_end,
+                    }
+                    for alt_start, alt_end, res in find_free_slots(
+                        candidates,
+                        start_dt,
+                        end_dt - start_dt,
+                        horizon_days=7,
+                        limit=3,
+                    )
+                ]
+
             return Response(
-                {"detail": "Не удалось подобрать подходящее рабочее место."},
+                {
+                    "detail": "Нет свободных фиксированных рабочих мест на указанный интервал.",
+                    "alternatives": alternatives,
+                },
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
@@ -466,7 +446,20 @@ class BookingViewSet(viewsets.ModelViewSet):
             # НИ одной брони ещё не создано — просто возвращаем ошибку
             return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
 
-        # всё ок: создаём основную бронь и дочерние брони оборудования в одной транзакции
+        # всё ок: создаём основную бронь и дочерние брони оборудования
+        booking = self._create_fixed_bookings(
+            request, best_resource, time_format, start_dt, end_dt, allocated_equipment
+        )
+
+        return Response(
+            BookingDetailSerializer(booking).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def _create_fixed_bookings(
+        self, request, best_resource, time_format, start_dt, end_dt, allocated_equipment
+    ):
+        """Основная бронь стола + дочерние брони оборудования (одна транзакция)."""
         with transaction.atomic():
             payload = {
                 "resource_id": best_resource.id,
@@ -483,20 +476,14 @@ class BookingViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             booking = serializer.save(user=request.user)
 
-            # создаём дочерние брони на оборудование
-            for item in allocated_equipment:
-                for res in item["resources"]:
-                    Booking.objects.create(
-                        user=request.user,
-                        resource=res,
-                        booking_type="equipment",
-                        time_format=booking.time_format,
-                        start_datetime=booking.start_datetime,
-                        end_datetime=booking.end_datetime,
-                        status="active",
-                        parent_booking=booking,
-                        parent_relation_type="equipment",
-                    )
+            # создаём дочерние брони на оборудование — одним INSERT
+            create_child_bookings(
+                booking,
+                [res for item in allocated_equipment for res in item["resources"]],
+                booking.start_datetime,
+                booking.end_datetime,
+                booking.time_format,
+            )
 
             create_notification(
                 user=request.user,
@@ -509,10 +496,7 @@ class BookingViewSet(viewsets.ModelViewSet):
                 booking=booking,
             )
 
-        return Response(
-            BookingDetailSerializer(booking).data,
-            status=status.HTTP_201_CREATED,
-        )
+        return booking
 
     # -------------------------------------------------------------------------
     # ПРОДЛЕНИЕ БРОНИ
@@ -576,15 +560,10 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_200_OK,
             )
 
-        next_booking = (
-            Booking.objects.filter(
-                resource=resource,
-                status__in=["active", "conflicted"],
-                start_datetime__gte=booking.end_datetime,
-            )
-            .exclude(id=booking.id)
-            .order_by("start_datetime")
-            .first()
+        # ближайшая следующая бронь — из in-memory индекса интервалов
+        bookings_timeline, _ = get_resource_index(resource)
+        next_booking = bookings_timeline.next_after(
+            booking.end_datetime, exclude_key=booking.id
         )
 
         if next_booking is None:
@@ -597,7 +576,9 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_200_OK,
             )
 
-        if next_booking.start_datetime >= desired_end_dt:
+        next_start = next_booking[0]
+
+        if next_start >= desired_end_dt:
             return Response(
                 {
                     "can_extend": True,
@@ -607,7 +588,7 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_200_OK,
             )
 
-        max_end = next_booking.start_datetime
+        max_end = next_start
 
         if max_end <= booking.end_datetime:
             return Response(
@@ -633,6 +614,8 @@ class BookingViewSet(viewsets.ModelViewSet):
         """
         Подтверждение продления:
         - new_end_datetime
+        - mode: "chain" — продлить цепочкой по нескольким местам
+          (план из extend-options, поле chain), опционально resource_ids
         - валидация + рабочие часы + логирование.
         """
         booking = self.get_object()
@@ -678,6 +661,9 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        if request.data.get("mode") == "chain":
+            return self._extend_confirm_chain(request, booking, new_end_dt)
+
         data = {"end_datetime": new_end_dt}
         serializer = self.get_serializer(instance=booking, data=data, partial=True)
         serializer.is_valid(raise_exception=True)
@@ -713,51 +699,71 @@ class BookingViewSet(viewsets.ModelViewSet):
         )
 
 
-    
-        # ===== ВНУТРЕННИЙ ХЕЛПЕР ДЛЯ ПРОДЛЕНИЯ НА КОНКРЕТНОМ РЕСУРСЕ =====
-    def _compute_extension_for_resource(self, resource, base_start, desired_end):
+    def _extend_confirm_chain(self, request, booking, new_end_dt):
         """
-        Считает, до какого момента максимум можно продлить интервал
-        [base_start, desired_end) на указанном ресурсе, учитывая другие брони.
+        extend-confirm с mode="chain": продление цепочкой по нескольким местам
+        (см. bookings/extension.py). Необязательное поле resource_ids —
+        последовательность мест из показанного плана (chain.segments).
+        """
+        expected_resource_ids = request.data.get("resource_ids")
+        if expected_resource_ids is not None:
+            # проверяем до блокировок: мусор от клиента — 400, а не 500
+            try:
+                if not isinstance(expected_resource_ids, list) or any(
+                    isinstance(rid, bool) for rid in expected_resource_ids
+                ):
+                    raise TypeError
+                expected_resource_ids = [int(rid) for rid in expected_resource_ids]
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": "Поле resource_ids должно быть списком id ресурсов."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        updated_booking, parts = confirm_chain(
+            booking, new_end_dt, expected_resource_ids
+        )
+
+        places = ", ".join(
+            f"'{part.resource}' с {format_dt(part.start_datetime)} "
+            f"до {format_dt(part.end_datetime)}"
+            for part in parts
+        )
+        create_notification(
+            user=booking.user,
+            event_type="booking_extended",
+            title="Бронирование продлено",
+            message=(
+                f"Ваше бронирование ресурса '{updated_booking.resource}' продлено "
+                f"до {format_dt(updated_booking.end_datetime)}, далее: {places}."
+            ),
+            booking=updated_booking,
+        )
+
+        return Response(
+            {
+                "booking": self.get_serializer(updated_booking).data,
+                "segments": self.get_serializer(parts, many=True).data,
+            },
+            status=status.HTTP_200_OK,
+        )
 
-        Возвращает dict:
+    # ===== ВНУТРЕННИЙ ХЕЛПЕР ДЛЯ ПРОДЛЕНИЯ НА КОНКРЕТНОМ РЕСУРСЕ =====
+    def _extension_info(self, max_end, base_start, desired_end):
+        """
+        По пределу продления на ресурсе (см. extension_limits) собирает dict:
         {
           "max_end": datetime,
           "can_full": bool,   # true, если можно прямо до desired_end
         }
         """
-
-        # ближайшая бронь на этом ресурсе после base_start
-        next_booking = (
-            Booking.objects.filter(
-                resource=resource,
-                status__in=["active", "conflicted"],
-                start_datetime__gte=base_start,
-            )
-            .order_by("start_datetime")
-            .first()
-        )
-
-        if not next_booking:
-            # никого дальше нет — можем идти до желаемого конца
+        if max_end >= desired_end:
             return {
                 "max_end": desired_end,
                 "can_full": True,
             }
 
-        if next_booking.start_datetime >= desired_end:
-            # ближайшая бронь начинается уже после желаемого конца —
-            # весь интервал свободен
-            return {
-                "max_end": desired_end,
-                "can_full": True,
-            }
-
-        # есть пересечение — можно лишь до начала следующей брони
-        max_end = next_booking.start_datetime
-
-        # если вдруг ближайшая бронь начинается прямо в base_start или раньше —
-        # продлить вообще нельзя
+        # ресурс занят уже в base_start — продлить вообще нельзя
         if max_end <= base_start:
             return {
                 "max_end": base_start,
@@ -815,6 +821,16 @@ class BookingViewSet(viewsets.ModelViewSet):
             "resource_id": null или id,
             "resource_name": "...",
             "max_end": "..."
+          },
+
+          "chain": {
+            "exists": true/false,
+            "can_full": true/false,
+            "max_end": "...",
+            "segments": [
+              {"resource_id": 3, "resource_name": "Стол 3", "start": "...", "end": "..."},
+              {"resource_id": 7, "resource_name": "Стол 7", "start": "...", "end": "..."}
+            ]
           }
         }
         """
@@ -867,9 +883,27 @@ class BookingViewSet(viewsets.ModelViewSet):
 
         base_start = booking.end_datetime
 
+        # --- кандидаты: все активные workspace-ресурсы той же категории ---
+        rtype = catalog.get_type(resource.type_id)
+        others = list(
+            Resource.objects.filter(
+                type__category_id=rtype.category_id,
+                status="active",
+            ).exclude(id=resource.id)
+        )
+
+        # пределы продления для текущего и всех кандидатов разом:
+        # брони (в т.ч. уже идущие в base_start) и outage — двумя запросами
+        limits = extension_limits(
+            [resource, *others],
+            base_start,
+            desired_end_dt,
+            exclude_booking_id=booking.id,
+        )
+
         # --- 1) тот же ресурс ---
-        same_res_info = self._compute_extension_for_resource(
-            resource, base_start, desired_end_dt
+        same_res_info = self._extension_info(
+            limits[resource.id], base_start, desired_end_dt
         )
         same_res_can_full = same_res_info["can_full"]
         same_res_reason = (
@@ -883,28 +917,19 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
         )
 
-        # --- готовим наборы кандидатов для других сценариев ---
-        from resources.models import Resource as ResModel
-
         # ресурсы того же типа (тот же тип рабочего места), кроме текущего
-        same_type_qs = ResModel.objects.filter(
-            type=resource.type,
-            status="active",
-        ).exclude(id=resource.id)
+        same_type_resources = [r for r in others if r.type_id == resource.type_id]
 
         # любые другие workspace-ресурсы (другой type, но та же category)
-        same_category_other_type_qs = ResModel.objects.filter(
-            type__category=resource.type.category,
-            status="active",
-        ).exclude(type=resource.type)
+        other_type_resources = [r for r in others if r.type_id != resource.type_id]
 
         # --- 2) тот же тип ресурса, но другое рабочее место ---
         best_same_type = None
         best_same_type_max_end = None
         best_same_type_can_full = False
 
-        for res2 in same_type_qs:
-            info = self._compute_extension_for_resource(res2, base_start, desired_end_dt)
+        for res2 in same_type_resources:
+            info = self._extension_info(limits[res2.id], base_start, desired_end_dt)
             max_end = info["max_end"]
 
             # если вообще нет продления (max_end == base_start) — пропускаем
@@ -934,8 +959,8 @@ class BookingViewSet(viewsets.ModelViewSet):
         best_other_ws_max_end = None
         best_other_ws_can_full = False
 
-        for res3 in same_category_other_type_qs:
-            info = self._compute_extension_for_resource(res3, base_start, desired_end_dt)
+        for res3 in other_type_resources:
+            info = self._extension_info(limits[res3.id], base_start, desired_end_dt)
             max_end = info["max_end"]
 
             if max_end <= base_start:
@@ -1015,6 +1040,27 @@ class BookingViewSet(viewsets.ModelViewSet):
                 "max_end": max_end_best,
             }
 
+        # --- 5) цепочка по нескольким местам, если на своём целиком нельзя ---
+        chain = {
+            "exists": False,
+            "can_full": False,
+            "max_end": None,
+            "segments": [],
+        }
+        if not same_res_can_full:
+            segments = chain_plan(
+                booking, desired_end_dt, candidates=[resource, *others]
+            )
+            # цепочка из одного отрезка уже описана вариантами выше
+            if len(segments) > 1:
+                max_end = chain_end(booking, segments)
+                chain = {
+                    "exists": True,
+                    "can_full": max_end >= desired_end_dt,
+                    "max_end": max_end,
+                    "segments": [seg.as_dict() for seg in segments],
+                }
+
         result = {
             "requested_end": desired_end_dt,
             "current_end": booking.end_datetime,
@@ -1048,6 +1094,8 @@ class BookingViewSet(viewsets.ModelViewSet):
             },
 
             "best_partial": best_partial,
+
+            "chain": chain,
         }
 
         return Response(result, status=status.HTTP_200_OK)
@@ -1066,27 +1114,9 @@ class BookingViewSet(viewsets.ModelViewSet):
         - ResourceOutage (поломки/обслуживание);
         - пересекающихся броней и capacity.
         """
-        # 1) если есть outage на этот период — ресурс недоступен
-        has_outage = ResourceOutage.objects.filter(
-            resource=resource,
-            start_datetime__lt=end_dt,
-            end_datetime__gt=start_dt,
-        ).exists()
-        if has_outage:
-            return False
-
-        # 2) считаем пересекающиеся брони (кроме текущей)
-        overlapping = Booking.objects.filter(
-            resource=resource,
-            status__in=["active", "conflicted"],
-            start_datetime__lt=end_dt,
-            end_datetime__gt=start_dt,
+        return availability_service.is_available(
+            resource, start_dt, end_dt, exclude_booking_id=exclude_booking_id
         )
-        if exclude_booking_id:
-            overlapping = overlapping.exclude(id=exclude_booking_id)
-
-        capacity = resource.capacity if resource.capacity is not None else 1
-        return overlapping.count() < capacity
 
 
     @action(
@@ -1186,42 +1216,23 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status="active",
             ).exclude(id=old_resource.id)
 
-        options = []
-
-        for res in candidate_qs:
-            # 1) базовая вместимость
-            base_capacity = res.capacity if res.capacity is not None else 1
+        candidates = list(candidate_qs)
 
-            # 2) суммарное уменьшение capacity за счёт outage
-            outages = ResourceOutage.objects.filter(
-                resource=res,
-                start_datetime__lt=period_end,
-                end_datetime__gt=period_start,
-            )
-
-            total_reduction = 0
-            for o in outages:
-                total_reduction += o.capacity_reduction or 0
-
-            effective_capacity = base_capacity - total_reduction
-            if effective_capacity <= 0:
-                continue  # ресурс полностью выведен из работы
-
-            # 3) пересекающиеся брони (active+conflicted)
-            overlapping = Booking.objects.filter(
-                resource=res,
-                status__in=["active", "conflicted"],
-                start_datetime__lt=period_end,
-                end_datetime__gt=period_start,
-            )
+        # вместимость всех кандидатов одним проходом:
+        # outage уменьшают capacity, свою бронь из загрузки исключаем
+        capacities = compute_capacities(
+            candidates,
+            period_start,
+            period_end,
+            exclude_booking_ids=[booking.id],
+        )
 
-            # если смотрим на тот же ресурс, что в исходной брони —
-            # свою бронь из пересечений исключаем
-            if res.id == booking.resource_id:
-                overlapping = overlapping.exclude(id=booking.id)
+        options = []
 
-            if overlapping.count() >= effective_capacity:
-                continue  # все "слоты" заняты
+        for res in candidates:
+            effective_capacity, free_capacity, _ = capacities[res.id]
+            if free_capacity <= 0:
+                continue  # ресурс выведен из работы или все "слоты" заняты
 
             options.append(
                 {
@@ -1304,43 +1315,32 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=400,
             )
 
-        # ----- хелпер проверки ресурса на доступность -----
-        def resource_free_for_remainder(res: Resource) -> (bool, str):
+        # ----- доступность кандидатов: одна пачка AvailabilityService -----
+        def evaluate_remainder(resources):
             """
-            Проверка доступности ресурса res на интервал [cut_dt, old_end)
-            с учётом outage'ов и effective_capacity, исключая текущую бронь.
-            Возвращает (ok: bool, error_msg: str | None).
+            Доступность ресурсов на интервал [cut_dt, old_end) с учётом outage'ов
+            и effective_capacity, исключая текущую бронь.
+            Возвращает список (ok: bool, error_msg: str | None) в порядке resources.
             """
-            # 1) базовая capacity
-            base_capacity = res.capacity if res.capacity is not None else 1
-
-            # 2) суммарное уменьшение capacity по outage
-            outages = ResourceOutage.objects.filter(
-                resource=res,
-                start_datetime__lt=old_end,
-                end_datetime__gt=cut_dt,
-            )
-
-            total_reduction = 0
-            for o in outages:
-                total_reduction += o.capacity_reduction or 0
-
-            effective_capacity = base_capacity - total_reduction
-            if effective_capacity <= 0:
-                return False, "Выбранный ресурс в этот период полностью выведен из работы."
-
-            # 3) пересекающиеся брони, кроме текущей
-            overlapping = Booking.objects.filter(
-                resource=res,
-                status__in=["active", "conflicted"],
-                start_datetime__lt=old_end,
-                end_datetime__gt=cut_dt,
-            ).exclude(id=booking.id)
-
-            if overlapping.count() >= effective_capacity:
-                return False, "Выбранный ресурс уже полностью занят в этот период."
-
-            return True, None
+            results = availability_service.evaluate(
+                [
+                    AvailabilityQuery(res, cut_dt, old_end, booking.id)
+                    for res in resources
+                ]
+            )
+            verdicts = []
+            for availability in results:
+                if availability.reason == "outage":
+                    verdicts.append(
+                        (False, "Выбранный ресурс в этот период полностью выведен из работы.")
+                    )
+                elif availability.reason == "full":
+                    verdicts.append(
+                        (False, "Выбранный ресурс уже полностью занят в этот период.")
+                    )
+                else:
+                    verdicts.append((True, None))
+            return verdicts
 
         selected_resource_id = (
             request.data.get("resource_id") or request.data.get("resourceId")
@@ -1371,7 +1371,7 @@ class BookingViewSet(viewsets.ModelViewSet):
                     status=400,
                 )
 
-            ok, err_msg = resource_free_for_remainder(candidate)
+            ok, err_msg = evaluate_remainder([candidate])[0]
             if not ok:
                 return Response({"detail": err_msg}, status=409)
 
@@ -1389,8 +1389,8 @@ class BookingViewSet(viewsets.ModelViewSet):
             if base_cap_old <= 1:
                 candidate_qs = candidate_qs.exclude(id=old_resource.id)
 
-            for res in candidate_qs:
-                ok, _ = resource_free_for_remainder(res)
+            candidates = list(candidate_qs.order_by("id"))
+            for res, (ok, _) in zip(candidates, evaluate_remainder(candidates)):
                 if ok:
                     new_resource = res
                     break
@@ -1408,32 +1408,41 @@ class BookingViewSet(viewsets.ModelViewSet):
 
         from .models import Booking as BookingModel
 
-        with transaction.atomic():
-            # 1) закрываем исходную бронь на момент поломки
-            booking.end_datetime = cut_dt
-            booking.status = "completed"
-            booking.save(update_fields=["end_datetime", "status"])
-
-            # 2) создаём новую бронь на оставшийся период
-            new_booking = BookingModel.objects.create(
-                user=booking.user,
-                resource=new_resource,
-                booking_type=booking.booking_type,
-                time_format=booking.time_format,
-                start_datetime=cut_dt,
-                end_datetime=old_end,
-                status="active",
-            )
+        try:
+            with transaction.atomic():
+                # 1) закрываем исходную бронь на момент поломки
+                booking.end_datetime = cut_dt
+                booking.status = "completed"
+                booking.save(update_fields=["end_datetime", "status"])
+
+                # 2) создаём новую бронь на оставшийся период; одноместный
+                # ресурс мог занять параллельный запрос после проверки выше —
+                # тогда сработает exclusion-ограничение и всё откатится
+                new_booking = BookingModel.objects.create(
+                    user=booking.user,
+                    resource=new_resource,
+                    booking_type=booking.booking_type,
+                    time_format=booking.time_format,
+                    start_datetime=cut_dt,
+                    end_datetime=old_end,
+                    status="active",
+                )
 
-            # 3) переназначаем дочерние брони оборудования
-            children_qs = BookingModel.objects.filter(
-                parent_booking=booking,
-                booking_type="equipment",
-                status__in=["active", "conflicted"],
-            )
-            for child in children_qs:
-                child.parent_booking = new_booking
-                child.save(update_fields=["parent_booking"])
+                # 3) переназначаем дочерние брони оборудования
+                children_qs = BookingModel.objects.filter(
+                    parent_booking=booking,
+                    booking_type="equipment",
+                    status__in=["active", "conflicted"],
+                )
+                for child in children_qs:
+                    child.parent_booking = new_booking
+                    child.save(update_fields=["parent_booking"])
+        except IntegrityError as exc:
+            if not is_overlap_violation(exc):
+                raise
+            # save() выше изменил объект в памяти, а в БД всё откатилось
+            booking.refresh_from_db()
+            return Response({"detail": OVERLAP_MESSAGE}, status=409)
 
 
             # 4) уведомление пользователю
@@ -1521,6 +1530,17 @@ class BookingViewSet(viewsets.ModelViewSet):
         start = parent_booking.start_datetime
         end = parent_booking.end_datetime
 
+        return allocation.run_allocation(
+            [resource_type_id],
+            lambda: self._allocate_equipment_for_period(
+                parent_booking, resource_type_id, quantity, start, end
+            ),
+        )
+
+    def _allocate_equipment_for_period(
+        self, parent_booking, resource_type_id, quantity, start, end
+    ):
+        """Подбор и создание броней оборудования для add_equipment (под блокировкой типа)."""
         # пробуем подобрать оборудование через общий хелпер
         try:
             allocated = self._allocate_equipment_resources(
@@ -1533,22 +1553,9 @@ class BookingViewSet(viewsets.ModelViewSet):
 
         allocated_resources = allocated[0]["resources"]
 
-        created_bookings = []
-
-        with transaction.atomic():
-            for res in allocated_resources:
-                child_booking = Booking.objects.create(
-                    user=parent_booking.user,
-                    resource=res,
-                    booking_type="equipment",
-                    time_format=parent_booking.time_format,
-                    start_datetime=start,
-                    end_datetime=end,
-                    status="active",
-                    parent_booking=parent_booking,
-                    parent_relation_type="equipment",
-                )
-                created_bookings.append(child_booking)
+        created_bookings = create_child_bookings(
+            parent_booking, allocated_resources, start, end, parent_booking.time_format
+        )
 
         serializer = self.get_serializer(created_bookings, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1558,7 +1565,15 @@ class BookingViewSet(viewsets.ModelViewSet):
     # -------------------------------------------------------------------------
 
     def perform_create(self, serializer):
-        booking = serializer.save(user=self.request.user)
+        resource = serializer.validated_data["resource"]
+
+        def create():
+            # вместимость общих зон перепроверяем уже под блокировкой типа:
+            # validate() выше отработал без неё
+            serializer.validate(dict(serializer.validated_data))
+            return serializer.save(user=self.request.user)
+
+        booking = allocation.run_allocation([resource.type_id], create)
         create_notification(
             user=self.request.user,
             event_type="booking_created",
@@ -1571,55 +1586,14 @@ class BookingViewSet(viewsets.ModelViewSet):
         )
 
     def _get_free_equipment_count(
-        self, equipment_type: ResourceType, start_dt, end_dt
+        self, equipment_type: catalog.TypeInfo, start_dt, end_dt
 ) -> int:
         """
         Возвращает количество свободных ресурсов данного типа
         на интервал [start_dt, end_dt) с учётом брони и ResourceOutage.
         """
-        candidates = Resource.objects.filter(
-            type=equipment_type,
-            status="active",
-        )
-
-        if not candidates.exists():
-            return 0
-
-        # 1) занятые пересекающимися бронированиями
-        busy_ids = set(
-            Booking.objects.filter(
-                resource__in=candidates,
-                status__in=["active", "conflicted"],
-                start_datetime__lt=end_dt,
-                end_datetime__gt=start_dt,
-            )
-            .values_list("resource_id", flat=True)
-            .distinct()
-        )
-
-        # 2) outage на этот интервал
-        outages = ResourceOutage.objects.filter(
-            resource__in=candidates,
-            start_datetime__lt=end_dt,
-            end_datetime__gt=start_dt,
-        )
-
-        reduction_by_resource: dict[int, int] = {}
-        for o in outages:
-            reduction_by_resource[o.resource_id] = (
-                reduction_by_resource.get(o.resource_id, 0)
-                + (o.capacity_reduction or 0)
-            )
-
-        for res in candidates:
-            base_capacity = res.capacity if res.capacity is not None else 1
-            total_reduction = reduction_by_resource.get(res.id, 0)
-            effective_capacity = base_capacity - total_reduction
-            if effective_capacity <= 0:
-                busy_ids.add(res.id)
-
-        free_count = candidates.exclude(id__in=busy_ids).count()
-        return free_count
+        free = free_units_by_type([equipment_type.id], start_dt, end_dt)
+        return len(free[equipment_type.id])
 
     
 
@@ -1697,9 +1671,8 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        try:
-            equipment_type = ResourceType.objects.get(id=resource_type_id)
-        except ResourceType.DoesNotExist:
+        equipment_type = catalog.get_type(resource_type_id)
+        if equipment_type is None:
             return Response(
                 {"detail": "Тип оборудования с указанным ID не найден."},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -1879,9 +1852,8 @@ class BookingViewSet(viewsets.ModelViewSet):
                 )
                 continue
 
-            try:
-                equipment_type = ResourceType.objects.get(id=resource_type_id)
-            except ResourceType.DoesNotExist:
+            equipment_type = catalog.get_type(resource_type_id)
+            if equipment_type is None:
                 errors.append(
                     {"index": idx, "detail": f"Тип оборудования с id={resource_type_id} не найден."}
                 )
@@ -1898,103 +1870,50 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # сначала проверяем доступность по всем типам
-        shortage = []
-
-        for resource_type_id, info in type_map.items():
-            equipment_type = info["type"]
-            qty_needed = info["quantity"]
-
-            available_count = self._get_free_equipment_count(
-                equipment_type, start_dt, end_dt
-            )
-
-            info["available_count"] = available_count
+        return allocation.run_allocation(
+            list(type_map),
+            lambda: self._allocate_equipment_bulk(
+                parent_booking, type_map, start_dt, end_dt
+            ),
+        )
 
-            if available_count < qty_needed:
-                shortage.append(
-                    {
-                        "resource_type_id": resource_type_id,
-                        "needed": qty_needed,
-                        "available": available_count,
-                    }
-                )
+    def _allocate_equipment_bulk(self, parent_booking, type_map, start_dt, end_dt):
+        """
+        Проверка и создание броней для add_equipment_interval_bulk
+        (под блокировкой всех типов из запроса).
+        """
+        # доступность и подбор по всем типам сразу
+        plan, shortage = plan_equipment(
+            [(info["type"], info["quantity"]) for info in type_map.values()],
+            start_dt,
+            end_dt,
+        )
 
         if shortage:
             return Response(
                 {
                     "detail": "Недостаточно оборудования по некоторым типам. "
                               "Бронирование не создано.",
-                    "shortage": shortage,
+                    "shortage": [
+                        {
+                            "resource_type_id": item["type"].id,
+                            "needed": item["needed"],
+                            "available": item["available"],
+                        }
+                        for item in shortage
+                    ],
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # если всего хватает — создаём брони на оборудование
-        created_bookings = []
-
-        for resource_type_id, info in type_map.items():
-            equipment_type = info["type"]
-            qty_needed = info["quantity"]
-
-            candidates = Resource.objects.filter(
-                type=equipment_type,
-                status="active",
-            )
-
-            # 1) пересекающиеся брони
-            busy_ids = set(
-                Booking.objects.filter(
-                    resource__in=candidates,
-                    status__in=["active", "conflicted"],
-                    start_datetime__lt=end_dt,
-                    end_datetime__gt=start_dt,
-                )
-                .values_list("resource_id", flat=True)
-                .distinct()
-            )
-
-            # 2) outage
-            outages = ResourceOutage.objects.filter(
-                resource__in=candidates,
-                start_datetime__lt=end_dt,
-                end_datetime__gt=start_dt,
-            )
-
-            reduction_by_resource: dict[int, int] = {}
-            for o in outages:
-                reduction_by_resource[o.resource_id] = (
-                    reduction_by_resource.get(o.resource_id, 0)
-                    + (o.capacity_reduction or 0)
-                )
-
-            fully_unavailable_ids = set()
-            for res in candidates:
-                base_capacity = res.capacity if res.capacity is not None else 1
-                total_reduction = reduction_by_resource.get(res.id, 0)
-                effective_capacity = base_capacity - total_reduction
-                if effective_capacity <= 0:
-                    fully_unavailable_ids.add(res.id)
-
-            busy_ids.update(fully_unavailable_ids)
-
-            free_resources = list(
-                candidates.exclude(id__in=busy_ids)[:qty_needed]
-            )
-
-            for res in free_resources:
-                child_booking = Booking.objects.create(
-                    user=parent_booking.user,
-                    resource=res,
-                    booking_type="equipment",
-                    time_format="hour",
-                    start_datetime=start_dt,
-                    end_datetime=end_dt,
-                    status="active",
-                    parent_booking=parent_booking,
-                    parent_relation_type="equipment",
-                )
-                created_bookings.append(child_booking)
+        # если всего хватает — создаём брони на оборудование одним INSERT
+        created_bookings = create_child_bookings(
+            parent_booking,
+            [res for item in plan for res in item["resources"]],
+            start_dt,
+            end_dt,
+            "hour",
+        )
 
         serializer = self.get_serializer(created_bookings, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -2027,16 +1946,20 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=400,
             )
 
-        # если это бронь рабочего места — найдём дочерние брони оборудования
+        # если это бронь рабочего места — найдём дочерние брони: оборудование
+        # и отрезки цепочки продления (вместе с их оборудованием)
+        children = []
         if booking.booking_type == "workspace":
-            child_equipments = Booking.objects.filter(
-                parent_booking=booking,
-                booking_type="equipment",
-                status__in=["active", "conflicted"],
-            )
-        else:
-            # для брони оборудования (или других типов) ничего каскадно не трогаем
-            child_equipments = Booking.objects.none()
+            parents = [booking]
+            while parents:
+                parents = list(
+                    Booking.objects.filter(
+                        parent_booking__in=parents,
+                        parent_relation_type__in=("equipment", "extension"),
+                        status__in=["active", "conflicted"],
+                    ).select_related("resource", "resource__type", "user")
+                )
+                children.extend(parents)
 
         with transaction.atomic():
             # 1) отменяем основную бронь
@@ -2049,35 +1972,52 @@ class BookingViewSet(viewsets.ModelViewSet):
                 f"было отменено."
             )
 
-            create_notification(
-                user=booking.user,
-                event_type="booking_cancelled",
-                title="Бронирование отменено",
-                message=message_main,
-                channel="system",
-                booking=booking,
-            )
-
-            # 2) если есть дочерние брони оборудования — отменяем и их
-            for child in child_equipments:
-                child.status = "cancelled"
-                child.save(update_fields=["status"])
-
-                message_child = (
-                    f"Бронирование оборудования '{child.resource}' "
-                    f"на период {child.start_datetime} — {child.end_datetime} "
-                    f"отменено в связи с отменой основной брони рабочего места."
+            notifications = [
+                (
+                    booking.user,
+                    {
+                        "event_type": "booking_cancelled",
+                        "title": "Бронирование отменено",
+                        "message": message_main,
+                        "channel": "system",
+                        "booking": booking,
+                    },
                 )
-
-                create_notification(
-                    user=child.user,
-                    event_type="booking_cancelled",  # ВАЖНО: event_type, не notification_type
-                    title="Бронирование оборудования отменено",
-                    message=message_child,
-                    channel="system",
-                    booking=child,
+            ]
+
+            # 2) дочерние брони отменяем одним UPDATE
+            set_status(children, "cancelled")
+
+            for child in children:
+                if child.parent_relation_type == "extension":
+                    title = "Продление бронирования отменено"
+                    message_child = (
+                        f"Продление бронирования на ресурсе '{child.resource}' "
+                        f"на период {child.start_datetime} — {child.end_datetime} "
+                        f"отменено в связи с отменой основной брони."
+                    )
+                else:
+                    title = "Бронирование оборудования отменено"
+                    message_child = (
+                        f"Бронирование оборудования '{child.resource}' "
+                        f"на период {child.start_datetime} — {child.end_datetime} "
+                        f"отменено в связи с отменой основной брони рабочего места."
+                    )
+                notifications.append(
+                    (
+                        child.user,
+                        {
+                            "event_type": "booking_cancelled",
+                            "title": title,
+                            "message": message_child,
+                            "channel": "system",
+                            "booking": child,
+                        },
+                    )
                 )
 
+            create_notifications_bulk(notifications)
+
         return Response({"detail": "Бронирование отменено."})
 
     
@@ -2183,68 +2123,49 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
 
         # тип оборудования
-        try:
-            equipment_type = ResourceType.objects.get(id=resource_type_id)
-        except ResourceType.DoesNotExist:
+        equipment_type = catalog.get_type(resource_type_id)
+        if equipment_type is None:
             return Response(
                 {"detail": "Тип оборудования с указанным ID не найден."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # кандидаты-ресурсы этого типа
-        candidates = Resource.objects.filter(
-            type=equipment_type,
-            status="active",
-        )
-
-        if not candidates.exists():
-            return Response(
-                {"detail": "Нет доступного оборудования данного типа."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # уже занятые ресурсы в этот интервал
-        busy_resource_ids = (
-            Booking.objects.filter(
-                resource__in=candidates,
-                status__in=["active", "conflicted"],
-                start_datetime__lt=end_dt,
-                end_datetime__gt=start_dt,
-            )
-            .values_list("resource_id", flat=True)
-            .distinct()
+        return allocation.run_allocation(
+            [equipment_type.id],
+            lambda: self._allocate_equipment_interval(
+                parent_booking, equipment_type, quantity, start_dt, end_dt
+            ),
         )
 
-        free_resources = candidates.exclude(id__in=busy_resource_ids)
+    def _allocate_equipment_interval(
+        self, parent_booking, equipment_type, quantity, start_dt, end_dt
+    ):
+        """Подбор и создание броней для add_equipment_interval (под блокировкой типа)."""
+        # то же правило доступности, что и везде (брони + outage)
+        plan, shortage = plan_equipment([(equipment_type, quantity)], start_dt, end_dt)
 
-        if free_resources.count() < quantity:
+        if plan is None:
+            item = shortage[0]
+            if item["total"] == 0:
+                return Response(
+                    {"detail": "Нет доступного оборудования данного типа."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             return Response(
                 {
                     "detail": (
                         f"Недостаточно свободного оборудования на указанный интервал. "
-                        f"Запрошено: {quantity}, доступно: {free_resources.count()}."
+                        f"Запрошено: {quantity}, доступно: {item['available']}."
                     )
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        free_resources = list(free_resources[:quantity])
+        free_resources = plan[0]["resources"]
 
-        created_bookings = []
-
-        for res in free_resources:
-            child_booking = Booking.objects.create(
-                user=parent_booking.user,
-                resource=res,
-                booking_type="equipment",
-                time_format="hour", 
-                start_datetime=start_dt,
-                end_datetime=end_dt,
-                status="active",
-                parent_booking=parent_booking,
-                parent_relation_type="equipment",
-            )
-            created_bookings.append(child_booking)
+        created_bookings = create_child_bookings(
+            parent_booking, free_resources, start_dt, end_dt, "hour"
+        )
 
         serializer = self.get_serializer(created_bookings, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     "corsheaders",
     "rest_framework",
@@ -96,6 +97,35 @@ DATABASES = {
     }
 }
 
+# Cache
+# Локальный кэш процесса — для разработки и тестов. В проде с несколькими
+# воркерами нужен общий backend (Redis/Memcached): через cache между
+# процессами синхронизируются версии индексов и кэш доступности.
+
+CACHES = {
+    # кэш процесса: посчитанные ответы доступности и счётчики
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "coworking-default",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    # общий для всех воркеров: версии каталога и индексов интервалов,
+    # поколения кэша доступности, токены планов перераспределения.
+    # Таблица создаётся командой `manage.py createcachetable`; можно
+    # заменить на RedisCache. Кэш процесса сюда нельзя (resources/checks.py).
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "coworking_shared_cache",
+    },
+}
+
+# сколько живёт посчитанная доступность, секунды
+AVAILABILITY_CACHE_TTL = 300
+
+# до скольких затронутых броней перераспределение идёт прямо в запросе;
+# больше — фоновая задача (manage.py run_redistribution_jobs)
+REDISTRIBUTION_INLINE_LIMIT = 200
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -158,6 +188,12 @@ CORS_ALLOWED_ORIGINS = [
 
 # Для разработки: все письма печатаются в консоль
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+# сколько писем уходит через одну SMTP-сессию при рассылке из outbox
+NOTIFICATION_EMAIL_BATCH_SIZE = 50
 
 TELEGRAM_BOT_TOKEN = ""
-TELEGRAM_DEFAULT_PARSE_MODE = "HTML"  
+TELEGRAM_DEFAULT_PARSE_MODE = "HTML"
+TELEGRAM_API_BASE_URL = "https://api.telegram.org"
+# лимиты Bot API: сообщений в секунду всего и в один чат
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_PER_CHAT_RATE = 1
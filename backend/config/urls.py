@@ -19,7 +19,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from bookings.views import BookingViewSet
-from issues.views import IssueViewSet, ResourceOutageViewSet
+from issues.views import IssueViewSet, RedistributionJobViewSet, ResourceOutageViewSet
 from services.views import ServiceViewSet, ServiceOrderViewSet
 from notifications.views import NotificationViewSet
 from resources.views import (
@@ -46,6 +46,7 @@ router.register(r"resources", ResourceViewSet, basename="resource")
 router.register(r"bookings", BookingViewSet, basename="booking")
 router.register(r"issues", IssueViewSet, basename="issue")
 router.register(r"resource-outages", ResourceOutageViewSet, basename="resource-outage")
+router.register(r"redistribution-jobs", RedistributionJobViewSet, basename="redistribution-job")
 router.register(r"services", ServiceViewSet, basename="service")
 router.register(r"service-orders", ServiceOrderViewSet, basename="service-order")
 router.register(r"notifications", NotificationViewSet, basename="notification")
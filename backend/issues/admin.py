@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Issue, ResourceOutage
+from .models import Issue, RedistributionJob, ResourceOutage
 
 
 @admin.register(Issue)
@@ -13,3 +13,9 @@ class IssueAdmin(admin.ModelAdmin):
 class ResourceOutageAdmin(admin.ModelAdmin):
     list_display = ("id", "resource", "start_datetime", "end_datetime", "reason", "created_at")
     list_filter = ("reason", "created_at")
+
+
+@admin.register(RedistributionJob)
+class RedistributionJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "issue", "processed", "total", "created_at")
+    list_filter = ("kind", "status", "created_at")
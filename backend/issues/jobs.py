@@ -0,0 +1,271 @@
+# backend/issues/jobs.py
+"""
+Фоновые задачи перераспределения броней (RedistributionJob).
+
+confirm_issue / create_with_redistribution при большом числе затронутых
+броней записывают outage и задачу и сразу отвечают 202 с job_id, а брони
+переносит команда run_redistribution_jobs:
+
+  - задачу забирает один воркер (select_for_update(skip_locked=True));
+  - брони обрабатываются порциями по CHUNK_SIZE в порядке
+    (start_datetime, id) через issues.redistribution.redistribute;
+  - курсор, счётчики и heartbeat пишутся в транзакции порции (конфликтные
+    брони дописываются строками RedistributionJobConflict), поэтому
+    упавшая задача (heartbeat старше STALE_AFTER) подхватывается другим
+    воркером и продолжается с последней сохранённой порции.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from bookings.allocation import AllocationConflict
+from bookings.models import Booking
+from notifications.utils import create_notification
+
+from .models import RedistributionJob, RedistributionJobConflict
+from .redistribution import redistribute
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+# сколько броней ещё переносим прямо в HTTP-запросе
+INLINE_LIMIT = getattr(settings, "REDISTRIBUTION_INLINE_LIMIT", 200)
+
+# задача без heartbeat дольше этого считается брошенной упавшим воркером
+STALE_AFTER = timedelta(minutes=5)
+
+# после стольких неудачных запусков задача помечается failed
+MAX_ATTEMPTS = 3
+
+# повторы порции при конфликте блокировок с параллельными бронированиями
+CHUNK_CONFLICT_RETRIES = 5
+
+LIVE_STATUSES = ["active", "conflicted"]
+
+
+class JobLost(Exception):
+    """Задачу забрал другой воркер (наш heartbeat устарел)."""
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def affected_bookings(job):
+    """Брони, которые задача должна перераспределить (без учёта курсора)."""
+    qs = Booking.objects.filter(
+        resource_id__in=job.broken_resource_ids,
+        status__in=LIVE_STATUSES,
+        start_datetime__lt=job.end_datetime,
+        end_datetime__gt=job.start_datetime,
+        start_datetime__gte=job.future_from,
+    )
+    if job.excluded_booking_ids:
+        qs = qs.exclude(id__in=job.excluded_booking_ids)
+    return qs
+
+
+def enqueue(
+    kind,
+    broken_resource_ids,
+    start_dt,
+    end_dt,
+    future_from,
+    excluded_booking_ids=(),
+    issue=None,
+    created_by=None,
+    conflicted_bookings=(),
+    conflicted_count=0,
+):
+    """
+    Создаёт задачу. conflicted_bookings / conflicted_count — то, что view
+    уже пометила конфликтным сама (текущие брони заявки): попадают
+    в итог задачи вместе с результатами воркера.
+    """
+    job = RedistributionJob(
+        kind=kind,
+        issue=issue,
+        created_by=created_by,
+        broken_resource_ids=sorted(broken_resource_ids),
+        excluded_booking_ids=sorted(excluded_booking_ids),
+        start_datetime=start_dt,
+        end_datetime=end_dt,
+        future_from=future_from,
+        conflicted_count=conflicted_count,
+    )
+    job.total = affected_bookings(job).count()
+    job.save()
+    _add_conflicts(job, conflicted_bookings)
+    return job
+
+
+def _add_conflicts(job, conflicted_bookings):
+    RedistributionJobConflict.objects.bulk_create(
+        [
+            RedistributionJobConflict(job=job, details=details)
+            for details in conflicted_bookings
+        ]
+    )
+
+
+def claim_next(worker):
+    """
+    Забирает следующую задачу (новую или брошенную) или возвращает None.
+    Задачи, исчерпавшие MAX_ATTEMPTS, помечаются failed и пропускаются.
+    """
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                RedistributionJob.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status="pending")
+                    | Q(status="running", heartbeat_at__lt=now - STALE_AFTER)
+                )
+                .order_by("created_at", "id")
+                .first()
+            )
+            if job is None:
+                return None
+
+            job.attempts += 1
+            if job.attempts > MAX_ATTEMPTS:
+                job.status = "failed"
+                job.finished_at = now
+                job.error = job.error or "Превышено число попыток выполнения."
+                job.save(
+                    update_fields=["attempts", "status", "finished_at", "error", "updated_at"]
+                )
+                continue
+
+            job.status = "running"
+            job.locked_by = worker
+            job.heartbeat_at = now
+            job.save(
+                update_fields=["attempts", "status", "locked_by", "heartbeat_at", "updated_at"]
+            )
+            return job
+
+
+def _next_chunk(job, chunk_size):
+    qs = affected_bookings(job)
+    if job.cursor_start is not None:
+        qs = qs.filter(
+            Q(start_datetime__gt=job.cursor_start)
+            | Q(start_datetime=job.cursor_start, id__gt=job.cursor_id)
+        )
+    return list(
+        qs.order_by("start_datetime", "id").values_list("id", "start_datetime")[:chunk_size]
+    )
+
+
+def process_chunk(job_id, worker, chunk_size=CHUNK_SIZE):
+    """
+    Одна порция в одной транзакции. Возвращает True, если задача завершена.
+    """
+    with transaction.atomic():
+        job = RedistributionJob.objects.select_for_update().get(id=job_id)
+        if job.status != "running" or job.locked_by != worker:
+            raise JobLost()
+
+        chunk = _next_chunk(job, chunk_size)
+        if not chunk:
+            _finish(job)
+            return True
+
+        result = redistribute(
+            Booking.objects.filter(
+                id__in=[booking_id for booking_id, _ in chunk],
+                status__in=LIVE_STATUSES,
+            ),
+            job.broken_resource_ids,
+            issue=job.issue if job.kind == "issue" else None,
+        )
+
+        job.cursor_id, job.cursor_start = chunk[-1]
+        job.processed += len(chunk)
+        job.reassigned_count += result["auto_reassigned_count"]
+        job.conflicted_count += result["conflicted_count"]
+        job.heartbeat_at = timezone.now()
+        job.save(
+            update_fields=[
+                "cursor_id",
+                "cursor_start",
+                "processed",
+                "reassigned_count",
+                "conflicted_count",
+                "heartbeat_at",
+                "updated_at",
+            ]
+        )
+        _add_conflicts(job, result["conflicted_bookings"])
+        return False
+
+
+def _finish(job):
+    job.status = "done"
+    job.finished_at = timezone.now()
+    job.heartbeat_at = job.finished_at
+    job.total = max(job.total, job.processed)
+    job.save()
+
+    if job.kind == "issue" and job.issue is not None:
+        notify_issue_confirmed(job.issue, job.reassigned_count, job.conflicted_count)
+
+
+def notify_issue_confirmed(issue, reassigned_count, conflicted_count):
+    create_notification(
+        user=issue.user,
+        event_type="issue_confirmed",
+        title="Обращение подтверждено",
+        message=(
+            "Администратор подтвердил неисправность ресурса. "
+            f"Автоматически перенесено броней: {reassigned_count}. "
+            f"Броней, требующих ручного выбора нового места/оборудования: {conflicted_count}."
+        ),
+        issue=issue,
+        booking=issue.booking,
+    )
+
+
+def run_job(job, worker, chunk_size=CHUNK_SIZE):
+    """Выполняет задачу до конца. Ошибка порции откатывает только её."""
+    conflicts = 0
+    while True:
+        try:
+            if process_chunk(job.id, worker, chunk_size):
+                return
+            conflicts = 0
+        except JobLost:
+            logger.warning("Redistribution job #%s taken over by another worker", job.id)
+            return
+        except AllocationConflict:
+            conflicts += 1
+            if conflicts <= CHUNK_CONFLICT_RETRIES:
+                time.sleep(0.2 * conflicts)
+                continue
+            _release(job, "Не удалось получить блокировки ресурсов.")
+            return
+        except Exception as exc:  # noqa: BLE001 — сохраняем в задачу, воркер живёт дальше
+            logger.exception("Redistribution job #%s failed", job.id)
+            _release(job, repr(exc))
+            return
+
+
+def _release(job, error):
+    """Возвращает задачу в очередь (или failed, если попытки кончились)."""
+    RedistributionJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status="failed" if job.attempts >= MAX_ATTEMPTS else "pending",
+        locked_by="",
+        error=error,
+        updated_at=timezone.now(),
+    )
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from issues import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет фоновые задачи перераспределения броней (RedistributionJob). "
+        "Несколько экземпляров можно запускать параллельно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить все задачи из очереди и выйти",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Пауза между опросами пустой очереди, секунды",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=jobs.CHUNK_SIZE,
+            help="Сколько броней обрабатывать в одной транзакции",
+        )
+
+    def handle(self, *args, **options):
+        worker = jobs.worker_id()
+        self.stdout.write(f"Воркер перераспределения {worker} запущен.")
+
+        while True:
+            job = jobs.claim_next(worker)
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write(f"Задача #{job.id}: {job.total} броней.")
+            jobs.run_job(job, worker, options["chunk_size"])
+            job.refresh_from_db()
+            self.stdout.write(
+                f"Задача #{job.id}: {job.status}, обработано {job.processed}, "
+                f"перенесено {job.reassigned_count}, конфликтов {job.conflicted_count}."
+            )
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:00
+
+import bookings.models
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bookings", "0003_booking_period_exclusion"),
+        ("issues", "0004_resourceoutage_capacity_reduction"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="resourceoutage",
+            name="period",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=bookings.models.TsTzRange(
+                    "start_datetime", "end_datetime"
+                ),
+                output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="resourceoutage",
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=["period"], name="outage_period_gist"
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("issues", "0005_resourceoutage_period"),
+        ("resources", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="resourceoutage",
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=["resource", "period"], name="outage_res_period_gist"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="resourceoutage",
+            index=models.Index(
+                fields=["resource", "start_datetime", "end_datetime"],
+                name="outage_res_time_idx",
+            ),
+        ),
+    ]
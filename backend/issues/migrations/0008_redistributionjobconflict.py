@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:00
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_conflicts(apps, schema_editor):
+    RedistributionJob = apps.get_model("issues", "RedistributionJob")
+    RedistributionJobConflict = apps.get_model("issues", "RedistributionJobConflict")
+
+    conflicts = []
+    for job in RedistributionJob.objects.exclude(conflicted_bookings=[]).iterator():
+        conflicts.extend(
+            RedistributionJobConflict(job_id=job.id, details=details)
+            for details in job.conflicted_bookings
+        )
+    RedistributionJobConflict.objects.bulk_create(conflicts, batch_size=1000)
+
+
+def restore_conflicts(apps, schema_editor):
+    RedistributionJob = apps.get_model("issues", "RedistributionJob")
+    RedistributionJobConflict = apps.get_model("issues", "RedistributionJobConflict")
+
+    by_job = {}
+    for conflict in RedistributionJobConflict.objects.order_by("id").iterator():
+        by_job.setdefault(conflict.job_id, []).append(conflict.details)
+    for job_id, details in by_job.items():
+        RedistributionJob.objects.filter(id=job_id).update(conflicted_bookings=details)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("issues", "0007_redistributionjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RedistributionJobConflict",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "details",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="conflicts",
+                        to="issues.redistributionjob",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(move_conflicts, restore_conflicts),
+        migrations.RemoveField(
+            model_name="redistributionjob",
+            name="conflicted_bookings",
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 
-from bookings.models import Booking
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.indexes import GistIndex
+
+from bookings.models import Booking, TsTzRange
 from resources.models import Resource
 
 
@@ -90,11 +94,125 @@ class ResourceOutage(models.Model):
         help_text="На сколько единиц уменьшается capacity ресурса на этот период",
     )
 
+    # [start_datetime, end_datetime) в виде tstzrange — для индексного оператора &&
+    period = models.GeneratedField(
+        expression=TsTzRange("start_datetime", "end_datetime"),
+        output_field=DateTimeRangeField(),
+        db_persist=True,
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            GistIndex(fields=["period"], name="outage_period_gist"),
+            # outage набора ресурсов на интервал
+            GistIndex(fields=["resource", "period"], name="outage_res_period_gist"),
+            models.Index(
+                fields=["resource", "start_datetime", "end_datetime"],
+                name="outage_res_time_idx",
+            ),
+        ]
+
     def __str__(self):
         return (
             f"Outage #{self.id} for {self.resource} "
             f"({self.start_datetime} - {self.end_datetime}, "
             f"reduction={self.capacity_reduction})"
         )
+
+
+class RedistributionJob(models.Model):
+    """
+    Фоновое перераспределение броней после вывода ресурсов из работы.
+
+    Большие outage (месяцы будущих броней) обрабатываются не в HTTP-запросе,
+    а командой run_redistribution_jobs — порциями по возрастанию
+    (start_datetime, id). Позиция (cursor_*) и счётчики сохраняются в той же
+    транзакции, что и порция броней, поэтому после падения воркера задача
+    продолжается с места остановки без повторной обработки.
+    """
+
+    KIND_CHOICES = [
+        ("issue", "Подтверждение заявки"),
+        ("outage", "Вывод ресурса из работы"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Завершена"),
+        ("failed", "Ошибка"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+
+    issue = models.ForeignKey(
+        Issue,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="redistribution_jobs",
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="redistribution_jobs",
+    )
+
+    # что перераспределяем: брони на этих ресурсах в [start_datetime, end_datetime),
+    # начинающиеся не раньше future_from, кроме excluded_booking_ids
+    broken_resource_ids = models.JSONField(default=list)
+    excluded_booking_ids = models.JSONField(default=list)
+    start_datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField()
+    future_from = models.DateTimeField()
+
+    # прогресс
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    reassigned_count = models.PositiveIntegerField(default=0)
+    conflicted_count = models.PositiveIntegerField(default=0)
+    # сами конфликтные брони — в RedistributionJobConflict, по строке на бронь
+
+    # последняя обработанная бронь (keyset-курсор)
+    cursor_start = models.DateTimeField(null=True, blank=True)
+    cursor_id = models.BigIntegerField(null=True, blank=True)
+
+    # кто выполняет и когда последний раз отчитывался — для подхвата после падения
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="redist_job_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"RedistributionJob #{self.id} ({self.kind}, {self.status})"
+
+
+class RedistributionJobConflict(models.Model):
+    """
+    Бронь, которой задача не нашла места (формат summarize()["conflicted_bookings"]).
+
+    Порции только дописывают строки, поэтому список не перезаписывается
+    целиком при каждой порции, как было бы с JSON-полем задачи.
+    """
+
+    job = models.ForeignKey(
+        RedistributionJob, on_delete=models.CASCADE, related_name="conflicts"
+    )
+    details = models.JSONField(encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"Conflict #{self.id} (job #{self.job_id})"
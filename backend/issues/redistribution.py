@@ -0,0 +1,571 @@
+# backend/issues/redistribution.py
+"""
+Перераспределение броней со сломанных / выведенных из работы ресурсов.
+
+Раньше брони перебирались по времени начала и для каждой брался первый
+подходящий кандидат (first-fit) — по два запроса на каждую пару
+«бронь × кандидат», а ранний неудачный выбор мог оставить без места
+более поздние брони.
+
+Теперь:
+  1) кандидаты (активные ресурсы того же типа, кроме всех выводимых)
+     и их брони/outage на охватывающий интервал грузятся тремя запросами;
+  2) назначение решается в памяти: брони берутся по возрастанию
+     окончания, каждая отдаётся кандидату, на котором она помещается
+     с наименьшим «простоем» перед ней (best-fit). Жадное правило
+     оптимально только для одного ресурса, поэтому параллельно считается
+     и прежний first-fit, берётся лучший из двух, а для оставшихся без
+     места броней пробуются перестановки: бронь занимает место одной
+     или нескольких уже перенесённых, а те уезжают на другие кандидаты.
+     Результат не хуже first-fit, но максимум не гарантируется;
+  3) результат пишется двумя bulk_update, уведомления — одним пакетом.
+
+Всё выполняется под блокировками типов (bookings.allocation), чтобы
+параллельные бронирования не заняли выбранные места между расчётом
+и записью.
+
+Dry-run (preview) считает то же назначение без записи и кладёт его
+в общий кэш под коротким токеном. При подтверждении с токеном план не ищется
+заново, а только перепроверяется (verify_assignment); если за это время
+набор броней или занятость изменились — PlanExpired (HTTP 409).
+"""
+import uuid
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from bookings import allocation
+from bookings.bulk import sync_after_bulk_write
+from bookings.interval_index import Timeline
+from bookings.models import Booking, is_exclusive_resource
+from notifications.utils import create_notifications_bulk, format_dt
+from resources.availability import base_capacity_of, fetch_timelines, sweep_occupancy
+from resources.models import Resource
+from resources.versions import shared_cache
+
+
+# план dry-run живёт недолго: занятость меняется, старый план всё равно
+# не пройдёт перепроверку
+PLAN_KEY = "issues:redistribution:plan:{token}"
+PLAN_TTL = 300
+
+
+class PlanExpired(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        "План перераспределения устарел или не найден. "
+        "Выполните предпросмотр (dry_run) заново."
+    )
+    default_code = "redistribution_plan_expired"
+
+
+# тексты уведомлений: по подтверждённой заявке и по решению администратора
+MESSAGES = {
+    "issue": {
+        "reassigned_title": "Бронирование перенесено на другой ресурс",
+        "reassigned": (
+            "Ваше бронирование ресурса '{old}' на период {start} — {end} "
+            "перенесено на ресурс '{new}' в связи с неисправностью исходного ресурса."
+        ),
+        "conflicted_title": "Бронирование требует выбора нового ресурса",
+        "conflicted": (
+            "Ваше бронирование ресурса '{old}' на период {start} — {end} "
+            "стало конфликтным: нет свободных ресурсов этого типа "
+            "на указанный интервал. Пожалуйста, выберите другой вариант."
+        ),
+    },
+    "outage": {
+        "reassigned_title": "Бронирование перенесено на другой ресурс",
+        "reassigned": (
+            "Ваше бронирование ресурса '{old}' на период {start} — {end} "
+            "перенесено на ресурс '{new}' в связи с выводом исходного ресурса из работы."
+        ),
+        "conflicted_title": "Бронирование требует выбора нового ресурса",
+        "conflicted": (
+            "Ваше бронирование ресурса '{old}' на период {start} — {end} "
+            "стало конфликтным в связи с выводом ресурса из работы "
+            "и отсутствием свободных ресурсов того же типа."
+        ),
+    },
+}
+
+
+class _Slot:
+    """Кандидат с его занятостью: брони и outage в виде Timeline."""
+
+    def __init__(self, resource, bookings, outages):
+        self.resource = resource
+        self.base_capacity = base_capacity_of(resource)
+        self.bookings = Timeline()
+        self.outages = Timeline()
+        for booking_id, start, end in bookings:
+            self.bookings.add(booking_id, start, end)
+        for key, (start, end, reduction) in enumerate(outages):
+            self.outages.add(key, start, end, reduction)
+
+    def fits(self, start, end):
+        _, _, min_free = sweep_occupancy(
+            self.base_capacity,
+            [(s, e) for s, e, _, _ in self.bookings.overlapping(start, end)],
+            [(s, e, w) for s, e, _, w in self.outages.overlapping(start, end)],
+            start,
+            end,
+        )
+        return min_free > 0
+
+    def idle_before(self, start, horizon):
+        """Сколько ресурс простаивает перед start (от последней брони или horizon)."""
+        previous = self.bookings.previous_before(start)
+        return start - (previous[1] if previous else horizon)
+
+
+def _load_timelines(bookings, broken_resource_ids):
+    """
+    Кандидаты для броней (активные ресурсы тех же типов, кроме сломанных)
+    и их занятость — тремя запросами.
+    Возвращает (candidates, bookings_by_resource, outages_by_resource).
+    """
+    type_ids = {b.resource.type_id for b in bookings}
+    candidates = list(
+        Resource.objects.filter(type_id__in=type_ids, status="active")
+        .exclude(id__in=broken_resource_ids)
+        .order_by("id")
+    )
+
+    bookings_by_resource, outages_by_resource = fetch_timelines(
+        [res.id for res in candidates],
+        min(b.start_datetime for b in bookings),
+        max(b.end_datetime for b in bookings),
+        with_booking_ids=True,
+    )
+    return candidates, bookings_by_resource, outages_by_resource
+
+
+def _build_slots(candidates, bookings_by_resource, outages_by_resource):
+    """{resource_id: _Slot} — свежая копия занятости для одного расчёта."""
+    return {
+        res.id: _Slot(
+            res,
+            bookings_by_resource.get(res.id, []),
+            outages_by_resource.get(res.id, []),
+        )
+        for res in candidates
+    }
+
+
+def _load_slots(bookings, broken_resource_ids):
+    """Кандидаты с занятостью: {resource_id: _Slot}."""
+    return _build_slots(*_load_timelines(bookings, broken_resource_ids))
+
+
+def _by_end(bookings):
+    return sorted(bookings, key=lambda b: (b.end_datetime, b.start_datetime, b.id))
+
+
+def _by_start(bookings):
+    return sorted(bookings, key=lambda b: (b.start_datetime, b.id))
+
+
+def _group_by_type(slots):
+    slots_by_type = {}
+    for slot in slots.values():
+        slots_by_type.setdefault(slot.resource.type_id, []).append(slot)
+    return slots_by_type
+
+
+def _best_fit(bookings, slots_by_type, window_start):
+    """
+    Брони по возрастанию окончания, каждая — на кандидата с наименьшим
+    простоем перед ней. Возвращает {booking_id: _Slot или None}.
+    """
+    placed = {}
+    for booking in _by_end(bookings):
+        start, end = booking.start_datetime, booking.end_datetime
+
+        best = None
+        best_idle = None
+        for slot in slots_by_type.get(booking.resource.type_id, []):
+            if not slot.fits(start, end):
+                continue
+            idle = slot.idle_before(start, window_start)
+            if best is None or idle < best_idle:
+                best, best_idle = slot, idle
+
+        if best is not None:
+            best.bookings.add(booking.id, start, end)
+        placed[booking.id] = best
+    return placed
+
+
+def _first_fit(bookings, slots_by_type):
+    """
+    Прежнее правило: брони по времени начала, каждая — на первого
+    подходящего кандидата. Возвращает {booking_id: _Slot или None}.
+    """
+    placed = {}
+    for booking in _by_start(bookings):
+        start, end = booking.start_datetime, booking.end_datetime
+        placed[booking.id] = None
+        for slot in slots_by_type.get(booking.resource.type_id, []):
+            if slot.fits(start, end):
+                slot.bookings.add(booking.id, start, end)
+                placed[booking.id] = slot
+                break
+    return placed
+
+
+def _placed_count(placed):
+    return sum(slot is not None for slot in placed.values())
+
+
+def _try_displace(booking, slot, placed, bookings_by_id, slots_by_type):
+    """
+    Пытается посадить booking на slot, пересадив мешающие ему перенесённые
+    брони на другие кандидаты. Брони, которые уже были на кандидатах до
+    перераспределения, не трогаются. При неудаче состояние откатывается.
+    """
+    start, end = booking.start_datetime, booking.end_datetime
+    blockers = [
+        bookings_by_id[key]
+        for _, _, key, _ in slot.bookings.overlapping(start, end)
+        if placed.get(key) is slot
+    ]
+    if not blockers:
+        return False
+
+    for blocker in blockers:
+        slot.bookings.remove(blocker.id)
+    if not slot.fits(start, end):
+        for blocker in blockers:
+            slot.bookings.add(blocker.id, blocker.start_datetime, blocker.end_datetime)
+        return False
+    slot.bookings.add(booking.id, start, end)
+
+    moved = []
+    for blocker in _by_end(blockers):
+        target = next(
+            (
+                other
+                for other in slots_by_type[slot.resource.type_id]
+                if other is not slot
+                and other.fits(blocker.start_datetime, blocker.end_datetime)
+            ),
+            None,
+        )
+        if target is None:
+            break
+        target.bookings.add(blocker.id, blocker.start_datetime, blocker.end_datetime)
+        moved.append((blocker, target))
+    else:
+        placed[booking.id] = slot
+        for blocker, target in moved:
+            placed[blocker.id] = target
+        return True
+
+    # откат: пересаженные возвращаются на место, booking снимается
+    for blocker, target in moved:
+        target.bookings.remove(blocker.id)
+    slot.bookings.remove(booking.id)
+    for blocker in blockers:
+        slot.bookings.add(blocker.id, blocker.start_datetime, blocker.end_datetime)
+    return False
+
+
+def _improve(bookings, placed, slots_by_type):
+    """
+    Для броней без места пробует перестановки (_try_displace), пока
+    они что-то дают. Каждый успех добавляет одну размещённую бронь,
+    поэтому цикл конечен.
+    """
+    bookings_by_id = {b.id: b for b in bookings}
+    improved = True
+    while improved:
+        improved = False
+        for booking in _by_end(bookings):
+            if placed[booking.id] is not None:
+                continue
+            for slot in slots_by_type.get(booking.resource.type_id, []):
+                if _try_displace(booking, slot, placed, bookings_by_id, slots_by_type):
+                    improved = True
+                    break
+    return placed
+
+
+def plan_reassignment(bookings, broken_resource_ids):
+    """
+    Назначение для броней со сломанных ресурсов.
+
+    bookings — брони с загруженным resource; кандидаты для брони — активные
+    ресурсы того же типа, кроме broken_resource_ids.
+
+    Best-fit и first-fit считаются на отдельных копиях занятости, лучший
+    результат дорабатывается перестановками (_improve). Размещённых броней
+    не меньше, чем у first-fit; максимум не гарантируется.
+
+    Возвращает dict {booking_id: Resource или None}.
+    """
+    bookings = list(bookings)
+    if not bookings:
+        return {}
+
+    timelines = _load_timelines(bookings, broken_resource_ids)
+    window_start = min(b.start_datetime for b in bookings)
+
+    best_slots = _group_by_type(_build_slots(*timelines))
+    placed = _best_fit(bookings, best_slots, window_start)
+
+    first_slots = _group_by_type(_build_slots(*timelines))
+    first_placed = _first_fit(bookings, first_slots)
+
+    if _placed_count(first_placed) > _placed_count(placed):
+        placed, best_slots = first_placed, first_slots
+
+    placed = _improve(bookings, placed, best_slots)
+
+    return {
+        booking_id: slot.resource if slot is not None else None
+        for booking_id, slot in placed.items()
+    }
+
+
+def verify_assignment(bookings, broken_resource_ids, planned):
+    """
+    Проверяет сохранённый план {booking_id: resource_id или None}
+    на актуальных данных без повторного поиска.
+
+    Возвращает назначение в формате plan_reassignment или бросает
+    PlanExpired, если набор броней изменился или место уже занято.
+    """
+    bookings = list(bookings)
+    if {b.id for b in bookings} != set(planned):
+        raise PlanExpired()
+    if not bookings:
+        return {}
+
+    slots = _load_slots(bookings, broken_resource_ids)
+
+    assignment = {}
+    for booking in _by_end(bookings):
+        resource_id = planned[booking.id]
+        if resource_id is None:
+            assignment[booking.id] = None
+            continue
+
+        slot = slots.get(resource_id)
+        if (
+            slot is None
+            or slot.resource.type_id != booking.resource.type_id
+            or not slot.fits(booking.start_datetime, booking.end_datetime)
+        ):
+            raise PlanExpired()
+
+        slot.bookings.add(booking.id, booking.start_datetime, booking.end_datetime)
+        assignment[booking.id] = slot.resource
+
+    return assignment
+
+
+def _resource_name(res):
+    return res.name or f"Ресурс #{res.id}"
+
+
+def summarize(bookings, assignment):
+    """
+    Результат назначения в формате ответов confirm_issue /
+    create_with_redistribution — без записи в БД.
+    """
+    auto_reassigned_bookings = []
+    conflicted_bookings = []
+    conflicted_count = 0
+
+    for booking in bookings:
+        old_resource = booking.resource
+        new_resource = assignment.get(booking.id)
+
+        if new_resource is not None:
+            auto_reassigned_bookings.append(
+                {
+                    "id": booking.id,
+                    "old_resource_id": old_resource.id,
+                    "old_resource_name": _resource_name(old_resource),
+                    "new_resource_id": new_resource.id,
+                    "new_resource_name": _resource_name(new_resource),
+                    "start_datetime": booking.start_datetime,
+                    "end_datetime": booking.end_datetime,
+                }
+            )
+            continue
+
+        if booking.status != "conflicted":
+            conflicted_count += 1
+        conflicted_bookings.append(
+            {
+                "id": booking.id,
+                "resource_id": old_resource.id,
+                "resource_name": _resource_name(old_resource),
+                "start_datetime": booking.start_datetime,
+                "end_datetime": booking.end_datetime,
+                "reason": "no_free_same_type",
+            }
+        )
+
+    return {
+        "auto_reassigned_count": len(auto_reassigned_bookings),
+        "conflicted_count": conflicted_count,
+        "auto_reassigned_bookings": auto_reassigned_bookings,
+        "conflicted_bookings": conflicted_bookings,
+    }
+
+
+def apply_reassignment(bookings, assignment, issue=None):
+    """
+    Записывает назначение: перенесённые брони и новые конфликтные —
+    двумя bulk_update, уведомления — одним create_notifications_bulk.
+
+    Возвращает summarize() для записанного назначения.
+    """
+    summary = summarize(bookings, assignment)
+    messages = MESSAGES["issue" if issue is not None else "outage"]
+
+    moved = []
+    previous_resources = {}
+    newly_conflicted = []
+    notifications = []
+
+    for booking in bookings:
+        old_resource = booking.resource
+        new_resource = assignment.get(booking.id)
+        period = {
+            "old": old_resource,
+            "start": format_dt(booking.start_datetime),
+            "end": format_dt(booking.end_datetime),
+        }
+
+        if new_resource is not None:
+            booking.resource = new_resource
+            booking.status = "active"
+            booking.is_exclusive = is_exclusive_resource(new_resource)
+            moved.append(booking)
+            previous_resources[old_resource.id] = old_resource
+            notifications.append(
+                (
+                    booking.user,
+                    {
+                        "event_type": "booking_reassigned",
+                        "title": messages["reassigned_title"],
+                        "message": messages["reassigned"].format(
+                            new=new_resource, **period
+                        ),
+                        "booking": booking,
+                        "issue": issue,
+                    },
+                )
+            )
+        elif booking.status != "conflicted":
+            booking.status = "conflicted"
+            newly_conflicted.append(booking)
+            notifications.append(
+                (
+                    booking.user,
+                    {
+                        "event_type": "booking_conflicted",
+                        "title": messages["conflicted_title"],
+                        "message": messages["conflicted"].format(**period),
+                        "booking": booking,
+                        "issue": issue,
+                    },
+                )
+            )
+
+    if moved:
+        Booking.objects.bulk_update(moved, ["resource", "status", "is_exclusive"])
+    if newly_conflicted:
+        Booking.objects.bulk_update(newly_conflicted, ["status"])
+    sync_after_bulk_write(moved + newly_conflicted, previous_resources.values())
+
+    create_notifications_bulk(notifications)
+
+    return summary
+
+
+def _affected(affected_qs):
+    return list(
+        affected_qs.select_related("resource", "user").order_by("start_datetime", "id")
+    )
+
+
+def _type_ids(broken_resource_ids):
+    return set(
+        Resource.objects.filter(id__in=broken_resource_ids).values_list(
+            "type_id", flat=True
+        )
+    )
+
+
+def redistribute(affected_qs, broken_resource_ids, issue=None, planned=None):
+    """
+    Перераспределяет брони из affected_qs (брони на сломанных ресурсах)
+    в одной транзакции под блокировками затронутых типов ресурсов.
+
+    planned — план из preview() (load_plan): тогда поиск не повторяется,
+    план только перепроверяется на актуальных данных.
+
+    Возвращает результат apply_reassignment.
+    """
+    broken_resource_ids = set(broken_resource_ids)
+
+    def run():
+        bookings = _affected(affected_qs)
+        if planned is None:
+            assignment = plan_reassignment(bookings, broken_resource_ids)
+        else:
+            assignment = verify_assignment(bookings, broken_resource_ids, planned)
+        return apply_reassignment(bookings, assignment, issue=issue)
+
+    return allocation.run_allocation(_type_ids(broken_resource_ids), run)
+
+
+def preview(affected_qs, broken_resource_ids, scope):
+    """
+    Dry-run: считает назначение, ничего не записывая, и сохраняет его
+    в общем кэше на PLAN_TTL секунд под новым токеном.
+
+    scope — описание операции (заявка/ресурсы/интервал); при подтверждении
+    токен принимается только для того же scope.
+
+    Возвращает summarize() + plan_token / plan_expires_in.
+    """
+    broken_resource_ids = set(broken_resource_ids)
+    bookings = _affected(affected_qs)
+    assignment = plan_reassignment(bookings, broken_resource_ids)
+
+    token = uuid.uuid4().hex
+    # общий кэш: предпросмотр и подтверждение могут попасть в разные воркеры
+    shared_cache().set(
+        PLAN_KEY.format(token=token),
+        {
+            "scope": scope,
+            "assignment": {
+                booking_id: res.id if res is not None else None
+                for booking_id, res in assignment.items()
+            },
+        },
+        timeout=PLAN_TTL,
+    )
+
+    result = summarize(bookings, assignment)
+    result["plan_token"] = token
+    result["plan_expires_in"] = PLAN_TTL
+    return result
+
+
+def load_plan(token, scope):
+    """План из preview() для того же scope или PlanExpired."""
+    data = shared_cache().get(PLAN_KEY.format(token=token))
+    if data is None or data["scope"] != scope:
+        raise PlanExpired()
+    return data["assignment"]
+
+
+def discard_plan(token):
+    shared_cache().delete(PLAN_KEY.format(token=token))
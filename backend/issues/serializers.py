@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 
-from .models import Issue, ResourceOutage
+from .models import Issue, RedistributionJob, ResourceOutage
 from bookings.models import Booking
 from resources.models import Resource
 
@@ -151,3 +151,46 @@ class ResourceOutageSerializer(serializers.ModelSerializer):
             )
 
         return attrs
+
+
+class RedistributionJobSerializer(serializers.ModelSerializer):
+    """Состояние фоновой задачи перераспределения (для опроса с фронта)."""
+
+    progress = serializers.SerializerMethodField()
+    conflicted_bookings = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RedistributionJob
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "issue",
+            "broken_resource_ids",
+            "start_datetime",
+            "end_datetime",
+            "total",
+            "processed",
+            "progress",
+            "reassigned_count",
+            "conflicted_count",
+            "conflicted_bookings",
+            "attempts",
+            "error",
+            "created_at",
+            "updated_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        """Доля обработанных броней, 0..1."""
+        if obj.status == "done":
+            return 1.0
+        if not obj.total:
+            return 0.0
+        return round(min(obj.processed / obj.total, 1.0), 3)
+
+    def get_conflicted_bookings(self, obj):
+        # порядок добавления задаёт Prefetch во view (order_by id)
+        return [conflict.details for conflict in obj.conflicts.all()]
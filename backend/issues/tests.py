@@ -1,3 +1,268 @@
+import datetime
+import random
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from bookings.models import Booking
+from resources.models import Resource, ResourceCategory, ResourceType
+from resources.versions import shared_cache
+
+from . import jobs, redistribution
+from .models import RedistributionJob
+from .redistribution import (
+    PlanExpired,
+    load_plan,
+    plan_reassignment,
+    preview,
+    redistribute,
+    verify_assignment,
+)
+
+
+class RedistributionTestMixin:
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.category = ResourceCategory.objects.create(
+            code="workspace", name="Рабочие места"
+        )
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+    def local(self, hour):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time()),
+            timezone.get_current_timezone(),
+        ) + datetime.timedelta(hours=hour)
+
+    def make_resources(self, candidates):
+        """Сломанный общий ресурс и candidates столов того же типа (по возрастанию id)."""
+        rtype = ResourceType.objects.create(category=self.category, name="Стол")
+        broken = Resource.objects.create(type=rtype, name="Сломанный", capacity=10)
+        desks = [
+            Resource.objects.create(type=rtype, name=f"Стол {i}") for i in range(candidates)
+        ]
+        return broken, desks
+
+    def book(self, resource, start_hour, end_hour):
+        return Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(start_hour),
+            end_datetime=self.local(end_hour),
+            status="active",
+        )
+
+    def plan(self, broken):
+        affected = list(Booking.objects.filter(resource=broken).select_related("resource"))
+        return affected, plan_reassignment(affected, {broken.id})
+
+
+class RedistributionPlanTests(RedistributionTestMixin, TestCase):
+    def test_displacement_places_both_bookings(self):
+        # A по best-fit садится на первый стол и не оставляет места B;
+        # перестановка A → второй стол освобождает первый для B
+        broken, (first, second) = self.make_resources(2)
+        self.book(first, 0, 2)
+        self.book(second, 6, 20)
+        a = self.book(broken, 2, 5)
+        b = self.book(broken, 3, 10)
+
+        _, assignment = self.plan(broken)
+
+        self.assertEqual(assignment, {a.id: second, b.id: first})
+
+    def test_never_worse_than_first_fit(self):
+        rng = random.Random(42)
+
+        for round_no in range(15):
+            with self.subTest(round=round_no):
+                broken, desks = self.make_resources(rng.randint(1, 3))
+
+                busy = {desk.id: [] for desk in desks}
+                for desk in desks:
+                    hour = 0
+                    while True:
+                        hour += rng.randint(0, 6)
+                        if hour > 20:
+                            break
+                        end = hour + rng.randint(1, 5)
+                        self.book(desk, hour, end)
+                        busy[desk.id].append((hour, end))
+                        hour = end
+
+                wanted = []
+                for _ in range(rng.randint(1, 6)):
+                    start = rng.randint(0, 18)
+                    end = start + rng.randint(1, 6)
+                    wanted.append(self.book(broken, start, end))
+
+                affected, assignment = self.plan(broken)
+
+                intervals = {desk.id: list(busy[desk.id]) for desk in desks}
+                for booking in affected:
+                    desk = assignment[booking.id]
+                    if desk is None:
+                        continue
+                    start = (booking.start_datetime - self.local(0)).total_seconds() // 3600
+                    end = (booking.end_datetime - self.local(0)).total_seconds() // 3600
+                    for s, e in intervals[desk.id]:
+                        self.assertFalse(s < end and start < e, "план пересекает брони")
+                    intervals[desk.id].append((start, end))
+
+                # эталонный first-fit: по времени начала, первый свободный стол
+                first_fit = 0
+                taken = {desk.id: list(busy[desk.id]) for desk in desks}
+                for booking in sorted(wanted, key=lambda b: (b.start_datetime, b.id)):
+                    start = (booking.start_datetime - self.local(0)).total_seconds() // 3600
+                    end = (booking.end_datetime - self.local(0)).total_seconds() // 3600
+                    for desk in desks:
+                        if all(not (s < end and start < e) for s, e in taken[desk.id]):
+                            taken[desk.id].append((start, end))
+                            first_fit += 1
+                            break
+
+                placed = sum(desk is not None for desk in assignment.values())
+                self.assertGreaterEqual(placed, first_fit)
+
+
+class PlanTokenTests(RedistributionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.broken, (self.first, self.second) = self.make_resources(2)
+        self.book(self.first, 8, 12)
+        self.a = self.book(self.broken, 9, 11)
+        self.b = self.book(self.broken, 13, 15)
+        self.scope = {"resource_id": self.broken.id}
+
+    def affected_qs(self):
+        return Booking.objects.filter(resource=self.broken)
+
+    def preview(self):
+        return preview(self.affected_qs(), {self.broken.id}, self.scope)
+
+    def verify(self, planned):
+        affected = list(self.affected_qs().select_related("resource"))
+        return verify_assignment(affected, {self.broken.id}, planned)
+
+    def test_preview_stores_plan_for_scope(self):
+        result = self.preview()
+
+        self.assertEqual(result["plan_expires_in"], redistribution.PLAN_TTL)
+        self.assertEqual(result["auto_reassigned_count"], 2)
+        self.assertEqual(
+            load_plan(result["plan_token"], self.scope),
+            {self.a.id: self.second.id, self.b.id: self.first.id},
+        )
+        # dry-run ничего не пишет
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.resource_id, self.broken.id)
+
+    def test_load_plan_rejects_other_scope_and_unknown_token(self):
+        token = self.preview()["plan_token"]
+
+        with self.assertRaises(PlanExpired):
+            load_plan(token, {"resource_id": self.first.id})
+        with self.assertRaises(PlanExpired):
+            load_plan("0" * 32, self.scope)
+
+    def test_load_plan_after_ttl(self):
+        with mock.patch.object(redistribution, "PLAN_TTL", 0):
+            token = self.preview()["plan_token"]
+
+        with self.assertRaises(PlanExpired):
+            load_plan(token, self.scope)
+
+    def test_verify_accepts_current_plan(self):
+        planned = load_plan(self.preview()["plan_token"], self.scope)
+
+        self.assertEqual(
+            self.verify(planned), {self.a.id: self.second, self.b.id: self.first}
+        )
+
+    def test_verify_rejects_changed_booking_set(self):
+        planned = load_plan(self.preview()["plan_token"], self.scope)
+        self.book(self.broken, 16, 17)
+
+        with self.assertRaises(PlanExpired):
+            self.verify(planned)
+
+    def test_verify_rejects_taken_slot(self):
+        planned = load_plan(self.preview()["plan_token"], self.scope)
+        self.book(self.second, 10, 12)
+
+        with self.assertRaises(PlanExpired):
+            self.verify(planned)
+        with self.assertRaises(PlanExpired):
+            redistribute(self.affected_qs(), {self.broken.id}, planned=planned)
+
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.resource_id, self.broken.id)
+
+    def test_redistribute_applies_verified_plan(self):
+        planned = load_plan(self.preview()["plan_token"], self.scope)
+
+        result = redistribute(self.affected_qs(), {self.broken.id}, planned=planned)
+
+        self.assertEqual(result["auto_reassigned_count"], 2)
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual(
+            (self.a.resource_id, self.b.resource_id), (self.second.id, self.first.id)
+        )
+
+
+class RedistributionJobTests(RedistributionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.broken, (self.desk,) = self.make_resources(1)
+        self.book(self.desk, 8, 12)
+        for start, end in ((9, 11), (10, 12), (13, 15)):
+            self.book(self.broken, start, end)
+
+    def enqueue(self, **extra):
+        return jobs.enqueue(
+            "outage",
+            [self.broken.id],
+            self.local(0),
+            self.local(24),
+            self.local(0),
+            **extra,
+        )
+
+    def test_claim_next_skips_exhausted_jobs(self):
+        exhausted = self.enqueue()
+        RedistributionJob.objects.filter(id=exhausted.id).update(
+            attempts=jobs.MAX_ATTEMPTS
+        )
+        fresh = self.enqueue()
+
+        claimed = jobs.claim_next("worker")
+
+        self.assertEqual(claimed.id, fresh.id)
+        self.assertEqual(claimed.status, "running")
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, "failed")
+        self.assertIsNone(jobs.claim_next("worker"))
+
+    def test_chunks_append_conflicts(self):
+        initial = {"id": 0, "reason": "current_booking"}
+        job = self.enqueue(conflicted_bookings=[initial], conflicted_count=1)
+
+        jobs.run_job(jobs.claim_next("worker"), "worker", chunk_size=1)
 
-# Create your tests here.
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.processed, job.reassigned_count), (3, 1))
+        self.assertEqual(job.conflicted_count, 3)
+        details = [c.details for c in job.conflicts.order_by("id")]
+        self.assertEqual(details[0], initial)
+        self.assertEqual(
+            [d["reason"] for d in details[1:]], ["no_free_same_type"] * 2
+        )
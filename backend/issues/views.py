@@ -5,11 +5,19 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
-from .models import Issue, ResourceOutage
-from .serializers import IssueSerializer, ResourceOutageSerializer
+from . import jobs
+from .models import Issue, RedistributionJob, RedistributionJobConflict, ResourceOutage
+from .redistribution import discard_plan, load_plan, preview, redistribute
+from .serializers import (
+    IssueSerializer,
+    RedistributionJobSerializer,
+    ResourceOutageSerializer,
+)
 from bookings.models import Booking
 from notifications.utils import create_notification, format_dt
 from resources.models import Resource
@@ -32,39 +40,8 @@ def handle_resource_breakdown(resource, start_dt, end_dt, issue=None):
     }
 
 
-def resource_available_for_period(
-    resource,
-    start_dt,
-    end_dt,
-    exclude_booking_id=None,
-):
-    """
-    Свободен ли ресурс на весь интервал [start_dt, end_dt)
-    с учётом:
-    - ResourceOutage (сломан/выведен);
-    - пересекающихся броней и capacity.
-    """
-    # 1) outages
-    has_outage = ResourceOutage.objects.filter(
-        resource=resource,
-        start_datetime__lt=end_dt,
-        end_datetime__gt=start_dt,
-    ).exists()
-    if has_outage:
-        return False
-
-    # 2) пересекающиеся брони на этом ресурсе
-    overlapping = Booking.objects.filter(
-        resource=resource,
-        status__in=["active", "conflicted"],
-        start_datetime__lt=end_dt,
-        end_datetime__gt=start_dt,
-    )
-    if exclude_booking_id:
-        overlapping = overlapping.exclude(id=exclude_booking_id)
-
-    capacity = resource.capacity if resource.capacity is not None else 1
-    return overlapping.count() < capacity
+def _is_true(value):
+    return value in [True, 1, "1", "true", "True", "yes"]
 
 
 class IssueViewSet(viewsets.ModelViewSet):
@@ -128,6 +105,7 @@ class IssueViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAdminUser],
         url_path="confirm",
     )
+    @transaction.atomic
     def confirm_issue(self, request, pk=None):
         """
         Администратор подтверждает поломку.
@@ -147,12 +125,17 @@ class IssueViewSet(viewsets.ModelViewSet):
                 (пересечение с [start, end]) → помечаем conflicted.
 
         3) Все прочие БУДУЩИЕ брони на сломанных ресурсах:
-           - пытаемся перенести на другой ресурс того же типа;
-           - если не получилось → ставим conflicted.
+           - переносим на другие ресурсы того же типа (issues/redistribution.py:
+             назначение считается в памяти так, чтобы перенести как можно больше);
+           - что не поместилось → ставим conflicted.
 
         В ответе отдаём:
         - количество перенесённых / помеченных конфликтными;
         - списки конкретных броней: auto_reassigned_bookings, conflicted_bookings.
+
+        dry_run=true — ничего не записываем и не рассылаем, возвращаем план
+        и plan_token; повторный вызов с plan_token (без dry_run) применяет
+        этот план после перепроверки. Все изменения — одной транзакцией.
         """
 
         issue = self.get_object()
@@ -226,6 +209,21 @@ class IssueViewSet(viewsets.ModelViewSet):
                 )
             resources_qs = Resource.objects.filter(id=issue.resource.id)
 
+        # dry_run — только расчёт плана; plan_token — подтверждение
+        # ранее показанного плана без повторного поиска
+        dry_run = _is_true(request.data.get("dry_run"))
+        plan_token = request.data.get("plan_token")
+        scope = {
+            "kind": "issue",
+            "issue_id": issue.id,
+            "resource_ids": sorted(res.id for res in resources_qs),
+            "start": start_dt.isoformat(),
+            "end": end_dt.isoformat(),
+        }
+        planned = None
+        if plan_token and not dry_run:
+            planned = load_plan(plan_token, scope)
+
         created_outages = []
 
         total_reassigned = 0
@@ -239,6 +237,7 @@ class IssueViewSet(viewsets.ModelViewSet):
 
         # id броней, которые НЕ нужно автопереносить
         excluded_booking_ids_for_auto = set()
+        broken_resource_ids = []
 
         # --- основной цикл по ресурсам ---
         for res in resources_qs:
@@ -257,15 +256,16 @@ class IssueViewSet(viewsets.ModelViewSet):
                 is_equipment_resource = True
 
             # 1) создаём outage: полностью выводим ресурс из работы
-            outage = ResourceOutage.objects.create(
-                resource=res,
-                start_datetime=start_dt,
-                end_datetime=end_dt,
-                reason="issue",
-                issue=issue,
-                capacity_reduction=res.capacity or 1,
-            )
-            created_outages.append(outage)
+            if not dry_run:
+                outage = ResourceOutage.objects.create(
+                    resource=res,
+                    start_datetime=start_dt,
+                    end_datetime=end_dt,
+                    reason="issue",
+                    issue=issue,
+                    capacity_reduction=res.capacity or 1,
+                )
+                created_outages.append(outage)
 
             # 2) «текущие» брони по этому ресурсу — НЕ переносим, только помечаем conflicted
             if parent_booking:
@@ -278,9 +278,11 @@ class IssueViewSet(viewsets.ModelViewSet):
                         and parent_booking.end_datetime > start_dt
                     ):
                         if parent_booking.status != "conflicted":
+                            total_conflicted += 1
+
+                        if parent_booking.status != "conflicted" and not dry_run:
                             parent_booking.status = "conflicted"
                             parent_booking.save(update_fields=["status"])
-                            total_conflicted += 1
 
                             # уведомляем клиента о конфликте текущей брони
                             create_notification(
@@ -322,9 +324,11 @@ class IssueViewSet(viewsets.ModelViewSet):
                     )
                     for b in current_equipment_bookings:
                         if b.status != "conflicted":
+                            total_conflicted += 1
+
+                        if b.status != "conflicted" and not dry_run:
                             b.status = "conflicted"
                             b.save(update_fields=["status"])
-                            total_conflicted += 1
 
                             # уведомление по оборудованию
                             create_notification(
@@ -354,126 +358,96 @@ class IssueViewSet(viewsets.ModelViewSet):
                         )
                         excluded_booking_ids_for_auto.add(b.id)
 
-            # 3) авто-перенос будущих броней на этом ресурсе
-            same_type_candidates = Resource.objects.filter(
-                type=res.type,
-                status="active",
-            ).exclude(id=res.id)
-
-            affected_qs = Booking.objects.filter(
-                resource=res,
-                status__in=["active", "conflicted"],
-                start_datetime__lt=end_dt,
-                end_datetime__gt=start_dt,
-                start_datetime__gte=future_from,
-            )
+            broken_resource_ids.append(res.id)
 
-            if excluded_booking_ids_for_auto:
-                affected_qs = affected_qs.exclude(
-                    id__in=excluded_booking_ids_for_auto
-                )
+        # 3) авто-перенос будущих броней со всех выводимых ресурсов разом
+        affected_qs = Booking.objects.filter(
+            resource_id__in=broken_resource_ids,
+            status__in=["active", "conflicted"],
+            start_datetime__lt=end_dt,
+            end_datetime__gt=start_dt,
+            start_datetime__gte=future_from,
+        )
+        if excluded_booking_ids_for_auto:
+            affected_qs = affected_qs.exclude(id__in=excluded_booking_ids_for_auto)
 
-            for booking in affected_qs.order_by("start_datetime"):
-                new_resource = None
+        if dry_run:
+            redistribution = preview(affected_qs, broken_resource_ids, scope)
+            return Response(
+                {
+                    "detail": (
+                        "Предпросмотр: заявка не подтверждена, изменения не сохранены."
+                    ),
+                    "dry_run": True,
+                    "plan_token": redistribution["plan_token"],
+                    "plan_expires_in": redistribution["plan_expires_in"],
+                    "auto_reassigned_count": (
+                        total_reassigned + redistribution["auto_reassigned_count"]
+                    ),
+                    "conflicted_count": (
+                        total_conflicted + redistribution["conflicted_count"]
+                    ),
+                    "auto_reassigned_bookings": redistribution["auto_reassigned_bookings"],
+                    "conflicted_bookings": (
+                        conflicted_bookings + redistribution["conflicted_bookings"]
+                    ),
+                    "outages": [],
+                },
+                status=status.HTTP_200_OK,
+            )
 
-                # ищем свободный ресурс того же типа
-                for candidate in same_type_candidates:
-                    if resource_available_for_period(
-                        candidate,
-                        booking.start_datetime,
-                        booking.end_datetime,
-                        exclude_booking_id=booking.id,
-                    ):
-                        new_resource = candidate
-                        break
-
-                if new_resource:
-                    old_resource = booking.resource
-                    booking.resource = new_resource
-                    if booking.status != "active":
-                        booking.status = "active"
-                    booking.save(update_fields=["resource", "status"])
-                    total_reassigned += 1
-
-                    # уведомление о переносе
-                    create_notification(
-                        user=booking.user,
-                        event_type="booking_reassigned",
-                        title="Бронирование перенесено на другой ресурс",
-                        message=(
-                            f"Ваше бронирование ресурса '{old_resource}' на период "
-                            f"{format_dt(booking.start_datetime)} — "
-                            f"{format_dt(booking.end_datetime)} "
-                            f"перенесено на ресурс '{new_resource}' "
-                            f"в связи с неисправностью исходного ресурса."
-                        ),
-                        booking=booking,
-                        issue=issue,
-                    )
+        # много броней — переносим в фоне (run_redistribution_jobs), outage уже записаны
+        if planned is None and (
+            _is_true(request.data.get("async"))
+            or affected_qs.count() > jobs.INLINE_LIMIT
+        ):
+            job = jobs.enqueue(
+                "issue",
+                broken_resource_ids,
+                start_dt,
+                end_dt,
+                future_from,
+                excluded_booking_ids=excluded_booking_ids_for_auto,
+                issue=issue,
+                created_by=request.user,
+                conflicted_bookings=conflicted_bookings,
+                conflicted_count=total_conflicted,
+            )
 
-                    auto_reassigned_bookings.append(
-                        {
-                            "id": booking.id,
-                            "old_resource_id": old_resource.id,
-                            "old_resource_name": old_resource.name
-                            or f"Ресурс #{old_resource.id}",
-                            "new_resource_id": new_resource.id,
-                            "new_resource_name": new_resource.name
-                            or f"Ресурс #{new_resource.id}",
-                            "start_datetime": booking.start_datetime,
-                            "end_datetime": booking.end_datetime,
-                        }
-                    )
-                else:
-                    if booking.status != "conflicted":
-                        booking.status = "conflicted"
-                        booking.save(update_fields=["status"])
-                        total_conflicted += 1
-
-                        # уведомление о конфликте будущей брони
-                        create_notification(
-                            user=booking.user,
-                            event_type="booking_conflicted",
-                            title="Бронирование требует выбора нового ресурса",
-                            message=(
-                                f"Ваше бронирование ресурса '{booking.resource}' "
-                                f"на период {format_dt(booking.start_datetime)} — "
-                                f"{format_dt(booking.end_datetime)} "
-                                f"стало конфликтным: нет свободных ресурсов этого типа "
-                                f"на указанный интервал. Пожалуйста, выберите другой вариант."
-                            ),
-                            booking=booking,
-                            issue=issue,
-                        )
+            issue.status = "confirmed"
+            issue.save(update_fields=["status", "updated_at"])
 
-                    conflicted_bookings.append(
-                        {
-                            "id": booking.id,
-                            "resource_id": res.id,
-                            "resource_name": res.name
-                            or f"Ресурс #{res.id}",
-                            "start_datetime": booking.start_datetime,
-                            "end_datetime": booking.end_datetime,
-                            "reason": "no_free_same_type",
-                        }
-                    )
+            return Response(
+                {
+                    "detail": (
+                        "Заявка подтверждена, ресурсы выведены из работы. "
+                        "Брони перераспределяются в фоне."
+                    ),
+                    "job_id": job.id,
+                    "job_status": job.status,
+                    "total": job.total,
+                    "outages": ResourceOutageSerializer(
+                        created_outages, many=True
+                    ).data,
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        redistribution = redistribute(
+            affected_qs, broken_resource_ids, issue=issue, planned=planned
+        )
+        if plan_token:
+            discard_plan(plan_token)
+        total_reassigned += redistribution["auto_reassigned_count"]
+        total_conflicted += redistribution["conflicted_count"]
+        auto_reassigned_bookings.extend(redistribution["auto_reassigned_bookings"])
+        conflicted_bookings.extend(redistribution["conflicted_bookings"])
 
         # статус заявки
         issue.status = "confirmed"
         issue.save(update_fields=["status", "updated_at"])
 
-        create_notification(
-            user=issue.user,
-            event_type="issue_confirmed",
-            title="Обращение подтверждено",
-            message=(
-                "Администратор подтвердил неисправность ресурса. "
-                f"Автоматически перенесено броней: {total_reassigned}. "
-                f"Броней, требующих ручного выбора нового места/оборудования: {total_conflicted}."
-            ),
-            issue=issue,
-            booking=issue.booking,
-        )
+        jobs.notify_issue_confirmed(issue, total_reassigned, total_conflicted)
 
         return Response(
             {
@@ -554,6 +528,7 @@ class ResourceOutageViewSet(viewsets.ModelViewSet):
         return qs
 
     @action(detail=False, methods=["post"], url_path="with-redistribution")
+    @transaction.atomic
     def create_with_redistribution(self, request):
         """
         Создать outage по ресурсу и перераспределить брони
@@ -567,6 +542,9 @@ class ResourceOutageViewSet(viewsets.ModelViewSet):
             - mode="all_future"  → выводим ресурс из работы на всё будущее
               (используем очень далёкую end_datetime).
 
+        - dry_run=true → только план и plan_token (см. confirm_issue);
+        - plan_token → применить ранее показанный план.
+
         Возвращает:
         - outage
         - auto_reassigned_* / conflicted_* так же, как confirm_issue.
@@ -634,6 +612,40 @@ class ResourceOutageViewSet(viewsets.ModelViewSet):
 
             reason = "maintenance"
 
+        dry_run = _is_true(request.data.get("dry_run"))
+        plan_token = request.data.get("plan_token")
+        scope = {
+            "kind": "outage",
+            "resource_id": resource.id,
+            "mode": mode,
+            # all_future отсчитывается от «сейчас» — границы не сравниваем
+            "start": None if mode == "all_future" else start_dt.isoformat(),
+            "end": None if mode == "all_future" else end_dt.isoformat(),
+        }
+
+        future_from = max(timezone.now(), start_dt)
+
+        affected_qs = Booking.objects.filter(
+            resource=resource,
+            status__in=["active", "conflicted"],
+            start_datetime__lt=end_dt,
+            end_datetime__gt=start_dt,
+            start_datetime__gte=future_from,
+        )
+
+        if dry_run:
+            return Response(
+                {
+                    "detail": "Предпросмотр: ресурс не выведен из работы, изменения не сохранены.",
+                    "dry_run": True,
+                    **preview(affected_qs, [resource.id], scope),
+                    "outages": [],
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        planned = load_plan(plan_token, scope) if plan_token else None
+
         # создаём outage
         outage = ResourceOutage.objects.create(
             resource=resource,
@@ -646,121 +658,69 @@ class ResourceOutageViewSet(viewsets.ModelViewSet):
 
         created_outages = [outage]
 
-        total_reassigned = 0
-        total_conflicted = 0
-        auto_reassigned_bookings = []
-        conflicted_bookings = []
-
-        future_from = max(timezone.now(), start_dt)
-
-        # такой же подбор кандидатов, как в confirm_issue
-        same_type_candidates = Resource.objects.filter(
-            type=resource.type,
-            status="active",
-        ).exclude(id=resource.id)
-
-        affected_qs = Booking.objects.filter(
-            resource=resource,
-            status__in=["active", "conflicted"],
-            start_datetime__lt=end_dt,
-            end_datetime__gt=start_dt,
-            start_datetime__gte=future_from,
-        )
-
-        for booking in affected_qs.order_by("start_datetime"):
-            new_resource = None
-
-            for candidate in same_type_candidates:
-                if resource_available_for_period(
-                    candidate,
-                    booking.start_datetime,
-                    booking.end_datetime,
-                    exclude_booking_id=booking.id,
-                ):
-                    new_resource = candidate
-                    break
-
-            if new_resource:
-                old_resource = booking.resource
-                booking.resource = new_resource
-                if booking.status != "active":
-                    booking.status = "active"
-                booking.save(update_fields=["resource", "status"])
-                total_reassigned += 1
-
-                # уведомление о переносе по решению админа
-                create_notification(
-                    user=booking.user,
-                    event_type="booking_reassigned",
-                    title="Бронирование перенесено на другой ресурс",
-                    message=(
-                        f"Ваше бронирование ресурса '{old_resource}' "
-                        f"на период {format_dt(booking.start_datetime)} — "
-                        f"{format_dt(booking.end_datetime)} "
-                        f"перенесено на ресурс '{new_resource}' "
-                        f"в связи с выводом исходного ресурса из работы."
+        if planned is None and (
+            _is_true(request.data.get("async"))
+            or affected_qs.count() > jobs.INLINE_LIMIT
+        ):
+            job = jobs.enqueue(
+                "outage",
+                [resource.id],
+                start_dt,
+                end_dt,
+                future_from,
+                created_by=request.user,
+            )
+            return Response(
+                {
+                    "detail": (
+                        "Ресурс выведен из работы. Брони перераспределяются в фоне."
                     ),
-                    booking=booking,
-                )
-
-                auto_reassigned_bookings.append(
-                    {
-                        "id": booking.id,
-                        "old_resource_id": old_resource.id,
-                        "old_resource_name": old_resource.name
-                        or f"Ресурс #{old_resource.id}",
-                        "new_resource_id": new_resource.id,
-                        "new_resource_name": new_resource.name
-                        or f"Ресурс #{new_resource.id}",
-                        "start_datetime": booking.start_datetime,
-                        "end_datetime": booking.end_datetime,
-                    }
-                )
-            else:
-                if booking.status != "conflicted":
-                    booking.status = "conflicted"
-                    booking.save(update_fields=["status"])
-                    total_conflicted += 1
-
-                    # уведомление о конфликте по решению админа
-                    create_notification(
-                        user=booking.user,
-                        event_type="booking_conflicted",
-                        title="Бронирование требует выбора нового ресурса",
-                        message=(
-                            f"Ваше бронирование ресурса '{booking.resource}' "
-                            f"на период {format_dt(booking.start_datetime)} — "
-                            f"{format_dt(booking.end_datetime)} "
-                            f"стало конфликтным в связи с выводом ресурса из работы "
-                            f"и отсутствием свободных ресурсов того же типа."
-                        ),
-                        booking=booking,
-                    )
+                    "job_id": job.id,
+                    "job_status": job.status,
+                    "total": job.total,
+                    "outages": ResourceOutageSerializer(
+                        created_outages, many=True
+                    ).data,
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
 
-                conflicted_bookings.append(
-                    {
-                        "id": booking.id,
-                        "resource_id": resource.id,
-                        "resource_name": resource.name
-                        or f"Ресурс #{resource.id}",
-                        "start_datetime": booking.start_datetime,
-                        "end_datetime": booking.end_datetime,
-                        "reason": "no_free_same_type",
-                    }
-                )
+        redistribution = redistribute(affected_qs, [resource.id], planned=planned)
+        if plan_token:
+            discard_plan(plan_token)
 
         return Response(
             {
                 "detail": (
                     "Ресурс выведен из работы, будущие брони перераспределены."
                 ),
-                "auto_reassigned_count": total_reassigned,
-                "conflicted_count": total_conflicted,
-                "auto_reassigned_bookings": auto_reassigned_bookings,
-                "conflicted_bookings": conflicted_bookings,
+                **redistribution,
                 "outages": ResourceOutageSerializer(
                     created_outages, many=True
                 ).data,
             },
             status=status.HTTP_200_OK,
         )
+
+
+class RedistributionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Фоновые задачи перераспределения броней: GET /redistribution-jobs/<id>/
+    для опроса прогресса после ответа 202 от confirm / with-redistribution.
+    """
+
+    queryset = (
+        RedistributionJob.objects.prefetch_related(
+            Prefetch("conflicts", queryset=RedistributionJobConflict.objects.order_by("id"))
+        )
+        .order_by("-created_at")
+    )
+    serializer_class = RedistributionJobSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        status_param = self.request.query_params.get("status")
+        if status_param:
+            qs = qs.filter(status=status_param)
+        return qs
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notification
+from .models import Notification, NotificationOutbox
 
 
 @admin.register(Notification)
@@ -15,3 +15,9 @@ class NotificationAdmin(admin.ModelAdmin):
     )
     list_filter = ("event_type", "channel", "status", "created_at")
     search_fields = ("title", "message", "user__username", "user__email")
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "notification", "status", "attempts", "next_attempt_at", "processed_at")
+    list_filter = ("status",)
@@ -0,0 +1,157 @@
+# notifications/delivery.py
+"""
+Доставка уведомлений из outbox (NotificationOutbox) по email и Telegram.
+
+create_notification только пишет Notification и строку outbox в транзакции
+вызывающего кода — никаких внешних запросов на пути HTTP-запроса. Команда
+deliver_notifications в цикле:
+
+  1) забирает пачку строк SELECT ... FOR UPDATE SKIP LOCKED и помечает
+     их processing (несколько воркеров не получат одну и ту же строку);
+  2) читает настройки и профили получателей двумя запросами
+     (PreferenceResolver, notifications/preferences.py);
+  3) письма уходят пачками через одно SMTP-соединение на пачку
+     (send_notification_emails), сообщения Telegram — параллельно
+     в ThreadPoolExecutor; потоки только ходят в сеть, к БД не обращаются;
+  4) пишет итоговые статусы двумя bulk_update.
+
+Если все каналы уведомления упали, строка возвращается в pending
+с экспоненциальной задержкой; после MAX_ATTEMPTS — failed. Строки,
+зависшие в processing дольше LEASE (воркер упал), забираются снова.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .email_utils import send_notification_emails
+from .models import Notification, NotificationOutbox
+from .telegram import send_telegram_message
+from .preferences import preference_scope
+
+
+BATCH_SIZE = 100
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 5
+LEASE = timedelta(minutes=5)
+RETRY_BASE = timedelta(seconds=30)
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """Забирает до limit строк outbox и возвращает их с уведомлениями и получателями."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="pending", next_attempt_at__lte=now)
+                | Q(status="processing", locked_at__lt=now - LEASE)
+            )
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        NotificationOutbox.objects.filter(id__in=ids).update(
+            status="processing",
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    return list(
+        NotificationOutbox.objects.filter(id__in=ids)
+        .select_related("notification__user")
+        .order_by("id")
+    )
+
+
+def _send_telegram(task):
+    """Отправка одного сообщения в Telegram (выполняется в потоке)."""
+    notif, chat_id = task
+    return send_telegram_message(chat_id, f"<b>{notif.title}</b>\n\n{notif.message}")
+
+
+def deliver_batch(rows, max_workers=MAX_WORKERS):
+    """Доставляет забранные строки outbox и записывает результат."""
+    if not rows:
+        return {"sent": 0, "failed": 0, "retry": 0, "skipped": 0}
+
+    email_items = []
+    telegram_tasks = []
+    with preference_scope([row.notification.user for row in rows]) as preferences:
+        for row in rows:
+            notif = row.notification
+            send_email, chat_id = preferences.channels(notif.event_type, notif.user)
+            if send_email:
+                email_items.append((row.id, notif.user, notif.title, notif.message))
+            if chat_id:
+                telegram_tasks.append((row.id, (notif, chat_id)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # все письма — одной задачей: она держит SMTP-сессию на пачку
+        email_future = pool.submit(send_notification_emails, email_items)
+        telegram_results = dict(
+            zip(
+                [row_id for row_id, _ in telegram_tasks],
+                pool.map(_send_telegram, [task for _, task in telegram_tasks]),
+            )
+        )
+        email_results = email_future.result()
+
+    now = timezone.now()
+    counts = {"sent": 0, "failed": 0, "retry": 0, "skipped": 0}
+    finished_notifications = []
+
+    for row in rows:
+        notif = row.notification
+        row.locked_at = None
+
+        outcomes = {}
+        if row.id in email_results:
+            outcomes["email"] = email_results[row.id]
+        if row.id in telegram_results:
+            outcomes["telegram"] = telegram_results[row.id]
+        any_attempt = bool(outcomes)
+        any_success = any(outcomes.values())
+        failed_channels = [channel for channel, ok in outcomes.items() if not ok]
+        row.last_error = (
+            "Ошибка доставки: " + ", ".join(failed_channels) + "."
+            if failed_channels
+            else ""
+        )
+
+        if not any_attempt:
+            # доставлять некуда — уведомление остаётся только внутренним
+            row.status = "done"
+            row.processed_at = now
+            counts["skipped"] += 1
+        elif any_success:
+            row.status = "done"
+            row.processed_at = now
+            notif.status = "sent"
+            notif.sent_at = now
+            finished_notifications.append(notif)
+            counts["sent"] += 1
+        elif row.attempts >= MAX_ATTEMPTS:
+            row.status = "failed"
+            row.processed_at = now
+            notif.status = "failed"
+            notif.sent_at = now
+            finished_notifications.append(notif)
+            counts["failed"] += 1
+        else:
+            row.status = "pending"
+            row.next_attempt_at = now + RETRY_BASE * (2 ** (row.attempts - 1))
+            counts["retry"] += 1
+
+    with transaction.atomic():
+        NotificationOutbox.objects.bulk_update(
+            rows,
+            ["status", "locked_at", "processed_at", "next_attempt_at", "last_error"],
+        )
+        if finished_notifications:
+            Notification.objects.bulk_update(finished_notifications, ["status", "sent_at"])
+
+    return counts
@@ -1,31 +1,88 @@
 # notifications/email_utils.py
-from django.core.mail import send_mail
+import logging
+import smtplib
+
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 
 
+logger = logging.getLogger(__name__)
+
+# сколько писем отправляем через одно SMTP-соединение
+EMAIL_BATCH_SIZE = getattr(settings, "NOTIFICATION_EMAIL_BATCH_SIZE", 50)
+
+
 def send_notification_email(user, title: str, message: str) -> bool:
     """
-    Простая отправка письма на email пользователя.
-    Возвращает True, если попытка отправки прошла без исключений.
-    Для dev с console backend письма будут просто выводиться в консоль.
+    Отправка одного письма на email пользователя — пачка из одного
+    элемента send_notification_emails. True, если письмо ушло.
     """
+    return send_notification_emails([(None, user, title, message)])[None]
+
+
+def build_notification_email(user, title, message):
+    """EmailMessage для уведомления или None, если у пользователя нет email."""
     email = getattr(user, "email", None)
     if not email:
-        return False
-
-    subject = title or "Уведомление от коворкинга"
-    body = message or ""
-
-    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None)
-
-    try:
-        send_mail(
-            subject,
-            body,
-            from_email,
-            [email],
-            fail_silently=False,  # пусть кидает исключение, мы его поймаем сверху
-        )
-        return True
-    except Exception:
-        return False
+        return None
+    return EmailMessage(
+        subject=title or "Уведомление от коворкинга",
+        body=message or "",
+        from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
+        to=[email],
+    )
+
+
+def send_notification_emails(items, batch_size=None):
+    """
+    Пакетная отправка писем: items — список (key, user, title, message).
+
+    Письма уходят пачками по batch_size через одно соединение
+    get_connection() на пачку (одна SMTP-сессия вместо сессии на письмо).
+    Каждое письмо отправляется отдельным send_messages, поэтому ошибка
+    одного получателя не роняет остальных; при обрыве соединения оно
+    открывается заново.
+
+    Возвращает dict {key: True/False}.
+    """
+    batch_size = batch_size or EMAIL_BATCH_SIZE
+    results = {}
+
+    messages = []
+    for key, user, title, message in items:
+        email = build_notification_email(user, title, message)
+        if email is None:
+            results[key] = False
+        else:
+            messages.append((key, email))
+
+    for offset in range(0, len(messages), batch_size):
+        batch = messages[offset:offset + batch_size]
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as exc:
+            logger.warning("[Email] Cannot open connection: %s", exc)
+            results.update((key, False) for key, _ in batch)
+            continue
+
+        try:
+            for idx, (key, email) in enumerate(batch):
+                try:
+                    results[key] = connection.send_messages([email]) == 1
+                except smtplib.SMTPServerDisconnected as exc:
+                    logger.warning("[Email] Disconnected on %s: %s", email.to, exc)
+                    results[key] = False
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        results.update((k, False) for k, _ in batch[idx + 1:])
+                        break
+                except Exception as exc:
+                    logger.warning("[Email] Failed for %s: %s", email.to, exc)
+                    results[key] = False
+        finally:
+            connection.close()
+
+    return results
@@ -0,0 +1,74 @@
+# notifications/events.py
+"""
+Подписки на события уведомлений в виде битовой маски.
+
+Бит события — 1 << (позиция в Notification.EVENT_TYPE_CHOICES).
+Маска пользователя хранится в UserNotificationSettings.notify_mask,
+поэтому проверка подписки — одна операция &, а выбрать подписчиков
+можно прямо в SQL (notify_mask & bit <> 0).
+
+Новые типы событий добавлять только в конец EVENT_TYPE_CHOICES:
+перестановка сдвинет биты уже сохранённых масок.
+"""
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+from .models import Notification
+
+
+EVENT_BITS = {
+    code: 1 << index
+    for index, (code, _) in enumerate(Notification.EVENT_TYPE_CHOICES)
+}
+
+ALL_EVENTS_MASK = sum(EVENT_BITS.values())
+
+
+def event_bit(event_type):
+    """Бит события или 0 для неизвестного типа."""
+    return EVENT_BITS.get(event_type, 0)
+
+
+def mask_from_types(event_types):
+    """Маска из списка кодов событий; неизвестные коды игнорируются."""
+    mask = 0
+    for code in event_types:
+        mask |= event_bit(code)
+    return mask
+
+
+def types_from_mask(mask):
+    """Коды событий маски в порядке EVENT_TYPE_CHOICES."""
+    return [code for code, bit in EVENT_BITS.items() if mask & bit]
+
+
+def is_subscribed(settings, event_type):
+    """
+    Подписан ли пользователь на событие. settings=None (настроек нет)
+    значит «всё по умолчанию» — подписан на всё.
+    """
+    mask = ALL_EVENTS_MASK if settings is None else settings.notify_mask
+    return bool(mask & event_bit(event_type))
+
+
+def subscribed_user_ids(user_ids, event_type):
+    """
+    id пользователей из user_ids, подписанных на событие, — одним запросом.
+    Пользователи без UserNotificationSettings считаются подписанными.
+    """
+    from django.contrib.auth.models import User
+
+    bit = event_bit(event_type)
+    if not bit:
+        return set()
+
+    return set(
+        User.objects.filter(id__in=user_ids)
+        .annotate(
+            _event_bit=Coalesce(
+                F("notification_settings__notify_mask"), Value(ALL_EVENTS_MASK)
+            ).bitand(bit)
+        )
+        .exclude(_event_bit=0)
+        .values_list("id", flat=True)
+    )
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications import delivery
+
+
+class Command(BaseCommand):
+    help = (
+        "Доставляет уведомления из outbox по email и Telegram. "
+        "Несколько экземпляров можно запускать параллельно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Разобрать очередь и выйти",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Пауза между опросами пустой очереди, секунды",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=delivery.BATCH_SIZE,
+            help="Сколько уведомлений забирать за раз",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=delivery.MAX_WORKERS,
+            help="Сколько отправок выполнять параллельно",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            rows = delivery.claim_batch(options["batch_size"])
+            if not rows:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            counts = delivery.deliver_batch(rows, max_workers=options["workers"])
+            self.stdout.write(
+                f"Отправлено: {counts['sent']}, ошибок: {counts['failed']}, "
+                f"повтор: {counts['retry']}, без каналов: {counts['skipped']}."
+            )
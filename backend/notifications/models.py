@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from bookings.models import Booking
 from issues.models import Issue
@@ -94,8 +95,60 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # лента уведомлений пользователя (NotificationViewSet)
+            models.Index(fields=["user", "-created_at"], name="notif_user_created_idx"),
+            # лента администратора
+            models.Index(fields=["-created_at"], name="notif_created_idx"),
+        ]
+
     def __str__(self):
         return (
             f"Notification #{self.id} → {self.user.username} "
             f"({self.event_type}, {self.channel})"
         )
+
+
+class NotificationOutbox(models.Model):
+    """
+    Очередь доставки уведомлений по внешним каналам (email / Telegram).
+
+    Строка создаётся в той же транзакции, что и Notification, — если
+    транзакция откатится, письмо не уйдёт. Отправляет команда
+    deliver_notifications (notifications/delivery.py).
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Ожидает доставки"),
+        ("processing", "Доставляется"),
+        ("done", "Доставлено / доставлять некуда"),
+        ("failed", "Не доставлено"),
+    ]
+
+    notification = models.OneToOneField(
+        Notification,
+        on_delete=models.CASCADE,
+        related_name="outbox",
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # выборка воркера: ожидающие/зависшие строки по времени попытки
+            models.Index(
+                fields=["next_attempt_at"],
+                name="outbox_pending_idx",
+                condition=models.Q(status__in=["pending", "processing"]),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Outbox #{self.id} for notification #{self.notification_id} ({self.status})"
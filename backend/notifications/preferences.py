@@ -0,0 +1,91 @@
+# notifications/preferences.py
+"""
+Настройки доставки уведомлений для пачки получателей.
+
+PreferenceResolver читает UserNotificationSettings и UserProfile
+(telegram_chat_id) для всех ещё не загруженных пользователей одним
+запросом на модель и держит их в памяти. Живёт в пределах одной
+пачки outbox / запроса / задачи: внутри preference_scope() его
+подхватывают should_send_email / should_send_telegram, так что
+обращения по одному пользователю тоже идут через кэш.
+"""
+import contextvars
+from contextlib import contextmanager
+
+
+class PreferenceResolver:
+    def __init__(self):
+        self._settings = {}
+        self._chat_ids = {}
+        self._loaded = set()
+
+    def prefetch(self, users):
+        """Загружает настройки и chat_id пользователей, которых ещё нет в кэше."""
+        from users.models import UserNotificationSettings, UserProfile
+
+        user_ids = {
+            getattr(user, "id", user) for user in users if user is not None
+        } - self._loaded
+        if not user_ids:
+            return
+
+        for s in UserNotificationSettings.objects.filter(user_id__in=user_ids):
+            self._settings[s.user_id] = s
+        self._chat_ids.update(
+            UserProfile.objects.filter(user_id__in=user_ids).values_list(
+                "user_id", "telegram_chat_id"
+            )
+        )
+        self._loaded |= user_ids
+
+    def settings_for(self, user):
+        """UserNotificationSettings пользователя или None, если их нет."""
+        self.prefetch([user])
+        return self._settings.get(user.id)
+
+    def chat_id_for(self, user):
+        """telegram_chat_id из профиля или None."""
+        self.prefetch([user])
+        return self._chat_ids.get(user.id)
+
+    def channels(self, event_type, user):
+        """
+        Каналы доставки события: (send_email, chat_id или None).
+        """
+        from .utils import should_send_email, should_send_telegram
+
+        settings = self.settings_for(user)
+        chat_id = self.chat_id_for(user)
+        send_email = should_send_email(event_type, user, settings=settings)
+        if not should_send_telegram(event_type, user, settings=settings, chat_id=chat_id):
+            chat_id = None
+        return send_email, chat_id
+
+
+_current = contextvars.ContextVar("notification_preferences", default=None)
+
+
+@contextmanager
+def preference_scope(users=()):
+    """
+    Общий PreferenceResolver на время блока; users загружаются сразу.
+    Вложенный scope переиспользует внешний.
+    """
+    resolver = _current.get()
+    if resolver is not None:
+        resolver.prefetch(users)
+        yield resolver
+        return
+
+    resolver = PreferenceResolver()
+    resolver.prefetch(users)
+    token = _current.set(resolver)
+    try:
+        yield resolver
+    finally:
+        _current.reset(token)
+
+
+def current_resolver():
+    """Резолвер активного preference_scope() или None."""
+    return _current.get()
@@ -1,37 +1,262 @@
+"""
+Клиент Telegram Bot API для рассылки уведомлений.
+
+- одна keep-alive сессия requests на процесс (get_client());
+- ограничение скорости token bucket'ами: общий (TELEGRAM_GLOBAL_RATE,
+  по умолчанию 30 сообщений/с) и на каждый чат (TELEGRAM_PER_CHAT_RATE, 1/с);
+- повтор с экспоненциальной задержкой на 429 (с учётом retry_after из ответа),
+  5xx и сетевые ошибки;
+- пакетная отправка send_many: сообщения разных чатов чередуются, чтобы
+  лимит одного чата не тормозил остальных.
+
+Адрес API задаётся TELEGRAM_API_BASE_URL — в тестах туда подставляется
+локальный stub-сервер.
+"""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+
 import requests
 from django.conf import settings
 
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE_URL = "https://api.telegram.org"
+
+
 def get_bot_token():
     return getattr(settings, "TELEGRAM_BOT_TOKEN", None)
 
 
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity в запасе.
+    acquire() ждёт, пока появится токен. Потокобезопасен.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(now - self._updated, 0.0)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """Забирает токен; возвращает, сколько секунд нужно подождать до него."""
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            self._sleep(wait)
+
+    @property
+    def idle(self):
+        """Бакет полон — его можно выбросить без потери ограничения."""
+        with self._lock:
+            self._refill(self._clock())
+            return self._tokens >= self.capacity
+
+
+class TelegramClient:
+    # сколько бакетов чатов держим, прежде чем чистить полные (неактивные)
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(
+        self,
+        token=None,
+        base_url=None,
+        global_rate=None,
+        per_chat_rate=None,
+        max_retries=4,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        timeout=5,
+        session=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.token = token if token is not None else get_bot_token()
+        self.base_url = (
+            base_url
+            or getattr(settings, "TELEGRAM_API_BASE_URL", None)
+            or DEFAULT_API_BASE_URL
+        ).rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+        self._clock = clock
+        self._sleep = sleep
+        self._per_chat_rate = (
+            per_chat_rate
+            if per_chat_rate is not None
+            else getattr(settings, "TELEGRAM_PER_CHAT_RATE", 1)
+        )
+        self._global = TokenBucket(
+            global_rate
+            if global_rate is not None
+            else getattr(settings, "TELEGRAM_GLOBAL_RATE", 30),
+            clock=clock,
+            sleep=sleep,
+        )
+        self._chats = OrderedDict()
+        self._chats_lock = threading.Lock()
+
+    # ---------------------------------------------------------------- limits
+
+    def _chat_bucket(self, chat_id):
+        with self._chats_lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                    for key in [k for k, b in self._chats.items() if b.idle]:
+                        del self._chats[key]
+                bucket = TokenBucket(
+                    self._per_chat_rate, capacity=1, clock=self._clock, sleep=self._sleep
+                )
+                self._chats[chat_id] = bucket
+            return bucket
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay *= random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            delay = max(delay, float(retry_after))
+        self._sleep(delay)
+
+    # ------------------------------------------------------------------ API
+
+    def call(self, method, payload, chat_id=None):
+        """
+        Вызов метода Bot API с лимитами и повторами.
+        Возвращает разобранный JSON-ответ или None при неудаче.
+        """
+        if not self.token:
+            logger.warning("[Telegram] No TELEGRAM_BOT_TOKEN in settings.")
+            return None
+
+        url = f"{self.base_url}/bot{self.token}/{method}"
+
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                self._chat_bucket(chat_id).acquire()
+            self._global.acquire()
+
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                logger.warning("[Telegram] %s: %s", method, exc)
+                if attempt < self.max_retries:
+                    self._backoff(attempt)
+                continue
+
+            if response.status_code == 429:
+                retry_after = None
+                try:
+                    retry_after = response.json().get("parameters", {}).get("retry_after")
+                except ValueError:
+                    pass
+                logger.warning("[Telegram] 429, retry_after=%s", retry_after)
+                if attempt < self.max_retries:
+                    self._backoff(attempt, retry_after)
+                continue
+
+            if response.status_code >= 500:
+                logger.warning("[Telegram] %s: HTTP %s", method, response.status_code)
+                if attempt < self.max_retries:
+                    self._backoff(attempt)
+                continue
+
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+
+            if response.status_code != 200 or not data or not data.get("ok"):
+                # 4xx кроме 429 (чат не найден, бот заблокирован) — повтор не поможет
+                logger.warning("[Telegram] Failed: %s", response.text)
+                return None
+            return data
+
+        return None
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode
+            or getattr(settings, "TELEGRAM_DEFAULT_PARSE_MODE", "HTML"),
+        }
+        return self.call("sendMessage", payload, chat_id=chat_id) is not None
+
+    def send_many(self, messages, parse_mode=None):
+        """
+        Пакетная отправка: messages — список (chat_id, text).
+        Сообщения разных чатов идут вперемешку (по кругу), порядок внутри
+        чата сохраняется. Возвращает список bool в порядке messages.
+        """
+        queues = defaultdict(deque)
+        for idx, (chat_id, text) in enumerate(messages):
+            queues[chat_id].append((idx, text))
+
+        results = [False] * len(messages)
+        while queues:
+            for chat_id in list(queues):
+                idx, text = queues[chat_id].popleft()
+                results[idx] = self.send_message(chat_id, text, parse_mode=parse_mode)
+                if not queues[chat_id]:
+                    del queues[chat_id]
+        return results
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Общий клиент процесса (одна сессия и общие лимиты на все потоки)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient()
+    return _client
+
+
 def send_telegram_message(chat_id: str, text: str) -> bool:
     """
-    Простая отправка сообщения в Telegram.
+    Отправка сообщения в Telegram через общий клиент.
     Возвращает True/False, без выброса исключений.
     """
-
-    token = get_bot_token()
-    if not token:
-        print("[Telegram] No TELEGRAM_BOT_TOKEN in settings.")
+    try:
+        return get_client().send_message(chat_id, text)
+    except Exception as e:
+        logger.exception("[Telegram] Exception: %s", e)
         return False
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML",
-    }
 
+def send_telegram_messages(messages):
+    """Пакетная отправка [(chat_id, text), ...] → [bool, ...]."""
     try:
-        r = requests.post(url, json=payload, timeout=5)
-        if r.status_code != 200:
-            print("[Telegram] Failed:", r.text)
-            return False
-        data = r.json()
-        return bool(data.get("ok"))
+        return get_client().send_many(messages)
     except Exception as e:
-        print("[Telegram] Exception:", e)
-        return False
-        
+        logger.exception("[Telegram] Exception: %s", e)
+        return [False] * len(messages)
@@ -1,3 +1,413 @@
-from django.test import TestCase
+import json
+import socketserver
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import delivery, email_utils
+from .email_utils import send_notification_email, send_notification_emails
+from .events import mask_from_types
+from .models import NotificationOutbox
+from .preferences import current_resolver, preference_scope
+from .telegram import TelegramClient, TokenBucket
+from .utils import create_notification, create_notifications_bulk
+from users.models import UserNotificationSettings, UserProfile
+
+
+class _StubTelegram(BaseHTTPRequestHandler):
+    """
+    Stub Bot API: отвечает по очереди из server.replies
+    (status, body), дальше — 200 ok. Принятые запросы пишет в server.received.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.received.append((self.path, payload))
+
+        if self.server.replies:
+            status, body = self.server.replies.pop(0)
+        else:
+            status, body = 200, {"ok": True, "result": {}}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelegramClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubTelegram)
+        self.server.replies = []
+        self.server.received = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.sleeps = []
+        self.client = TelegramClient(
+            token="TEST",
+            base_url=f"http://127.0.0.1:{self.server.server_port}",
+            global_rate=1000,
+            per_chat_rate=1000,
+            sleep=self.sleeps.append,
+        )
+
+    def test_send_message(self):
+        self.assertTrue(self.client.send_message(42, "hello"))
+        path, payload = self.server.received[0]
+        self.assertEqual(path, "/botTEST/sendMessage")
+        self.assertEqual(payload["chat_id"], 42)
+        self.assertEqual(payload["text"], "hello")
+
+    def test_retries_429_with_retry_after(self):
+        self.server.replies = [
+            (429, {"ok": False, "parameters": {"retry_after": 3}}),
+        ]
+        self.assertTrue(self.client.send_message(42, "hello"))
+        self.assertEqual(len(self.server.received), 2)
+        self.assertIn(3.0, [round(s, 3) for s in self.sleeps])
+
+    def test_retries_5xx_then_gives_up(self):
+        self.server.replies = [(502, {"ok": False})] * (self.client.max_retries + 1)
+        self.assertFalse(self.client.send_message(42, "hello"))
+        self.assertEqual(len(self.server.received), self.client.max_retries + 1)
+
+    def test_client_error_is_not_retried(self):
+        self.server.replies = [(403, {"ok": False, "description": "bot was blocked"})]
+        self.assertFalse(self.client.send_message(42, "hello"))
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_send_many_interleaves_chats(self):
+        results = self.client.send_many([(1, "a1"), (1, "a2"), (2, "b1")])
+        self.assertEqual(results, [True, True, True])
+        chats = [payload["chat_id"] for _, payload in self.server.received]
+        self.assertEqual(chats, [1, 2, 1])
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_waits_when_empty(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=1, capacity=1, clock=lambda: now[0])
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 1.0)
+
+        now[0] = 5.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+
+class _StubSMTP(socketserver.StreamRequestHandler):
+    """
+    Минимальный SMTP-сервер: принимает всё, кроме адресов из
+    server.rejected (550 на RCPT). Сессии пишет в server.sessions,
+    принятые письма — в server.messages.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.sessions += 1
+        self.reply("220 stub")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip().strip("<>")
+                if address in self.server.rejected:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline().rstrip(b"\r\n") != b".":
+                    pass
+                self.server.messages.append(recipients)
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:  # RSET, NOOP
+                self.reply("250 OK")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _user(email):
+    return SimpleNamespace(email=email)
+
+
+class EmailBatchLocmemTests(SimpleTestCase):
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_batches_share_connection(self):
+        items = [(i, _user(f"u{i}@example.com"), f"T{i}", "body") for i in range(5)]
+        items.append((99, _user(""), "no email", "body"))
+
+        with mock.patch.object(
+            email_utils, "get_connection", wraps=email_utils.get_connection
+        ) as get_connection:
+            results = send_notification_emails(items, batch_size=2)
+
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual(results, {0: True, 1: True, 2: True, 3: True, 4: True, 99: False})
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ["u0@example.com"])
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_single_email_uses_batch(self):
+        self.assertTrue(send_notification_email(_user("a@example.com"), "T", "body"))
+        self.assertFalse(send_notification_email(_user(""), "T", "body"))
+        self.assertEqual([m.to for m in mail.outbox], [["a@example.com"]])
+
+
+class EmailBatchSMTPTests(SimpleTestCase):
+    def setUp(self):
+        self.server = _SMTPServer(("127.0.0.1", 0), _StubSMTP)
+        self.server.sessions = 0
+        self.server.messages = []
+        self.server.rejected = {"bad@example.com"}
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        override = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.server.server_address[1],
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_one_session_per_batch_and_failures_per_message(self):
+        items = [
+            ("a", _user("a@example.com"), "A", "body"),
+            ("bad", _user("bad@example.com"), "B", "body"),
+            ("c", _user("c@example.com"), "C", "body"),
+        ]
+        results = send_notification_emails(items, batch_size=10)
+
+        self.assertEqual(results, {"a": True, "bad": False, "c": True})
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual(
+            self.server.messages, [["a@example.com"], ["c@example.com"]]
+        )
+
+    def test_batch_size_caps_session(self):
+        items = [(i, _user(f"u{i}@example.com"), "T", "body") for i in range(5)]
+        results = send_notification_emails(items, batch_size=2)
+
+        self.assertTrue(all(results.values()))
+        self.assertEqual(self.server.sessions, 3)
+        self.assertEqual(len(self.server.messages), 5)
+
+    def test_unreachable_server_marks_batch_failed(self):
+        with override_settings(EMAIL_PORT=1):
+            results = send_notification_emails(
+                [("a", _user("a@example.com"), "A", "body")]
+            )
+        self.assertEqual(results, {"a": False})
+
+
+def _payload():
+    return {"event_type": "booking_cancelled", "title": "Заголовок", "message": "Текст"}
+
+
+class OutboxSubscriptionTests(TestCase):
+    def setUp(self):
+        self.subscribed = User.objects.create(username="a", email="a@example.com")
+        self.unsubscribed = User.objects.create(username="b", email="b@example.com")
+        UserNotificationSettings.objects.create(
+            user=self.unsubscribed, notify_mask=mask_from_types(["booking_created"])
+        )
+
+    def test_single_and_bulk_agree(self):
+        for user in (self.subscribed, self.unsubscribed):
+            create_notification(user=user, **_payload())
+        create_notifications_bulk(
+            [(self.subscribed, _payload()), (self.unsubscribed, _payload())]
+        )
+
+        self.assertEqual(
+            sorted(
+                NotificationOutbox.objects.values_list(
+                    "notification__user__username", flat=True
+                )
+            ),
+            ["a", "a"],
+        )
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class OutboxDeliveryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="client", email="client@example.com")
+        self.notification = create_notification(user=self.user, **_payload())
+        self.row = NotificationOutbox.objects.get(notification=self.notification)
+
+    def deliver(self, email_ok):
+        """Забирает пачку и доставляет её с заданным исходом отправки писем."""
+        with mock.patch.object(
+            delivery,
+            "send_notification_emails",
+            side_effect=lambda items: {key: email_ok for key, *_ in items},
+        ):
+            rows = delivery.claim_batch()
+            before = timezone.now()
+            counts = delivery.deliver_batch(rows)
+            after = timezone.now()
+        self.row.refresh_from_db()
+        return rows, counts, before, after
+
+    def make_due(self):
+        NotificationOutbox.objects.filter(id=self.row.id).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_claim_locks_rows(self):
+        rows = delivery.claim_batch()
+
+        self.assertEqual([row.id for row in rows], [self.row.id])
+        self.assertEqual((rows[0].status, rows[0].attempts), ("processing", 1))
+        self.assertEqual(delivery.claim_batch(), [])
+
+        # строка брошенного воркера забирается снова после LEASE
+        NotificationOutbox.objects.filter(id=self.row.id).update(
+            locked_at=timezone.now() - delivery.LEASE - timedelta(seconds=1)
+        )
+        self.assertEqual([row.attempts for row in delivery.claim_batch()], [2])
+
+    def test_success_marks_sent(self):
+        _, counts, _, _ = self.deliver(email_ok=True)
+
+        self.assertEqual(counts["sent"], 1)
+        self.assertEqual(self.row.status, "done")
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, "sent")
+
+    def test_failures_back_off_exponentially(self):
+        for attempt in range(1, delivery.MAX_ATTEMPTS):
+            with self.subTest(attempt=attempt):
+                _, counts, before, after = self.deliver(email_ok=False)
+
+                self.assertEqual(counts["retry"], 1)
+                self.assertEqual((self.row.status, self.row.attempts), ("pending", attempt))
+                self.assertEqual(self.row.last_error, "Ошибка доставки: email.")
+                delay = delivery.RETRY_BASE * 2 ** (attempt - 1)
+                self.assertGreaterEqual(self.row.next_attempt_at, before + delay)
+                self.assertLessEqual(self.row.next_attempt_at, after + delay)
+
+                # до next_attempt_at строка не забирается
+                self.assertEqual(delivery.claim_batch(), [])
+                self.make_due()
+
+        _, counts, _, _ = self.deliver(email_ok=False)
+
+        self.assertEqual(counts["failed"], 1)
+        self.assertEqual(
+            (self.row.status, self.row.attempts), ("failed", delivery.MAX_ATTEMPTS)
+        )
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, "failed")
+
+
+class PreferenceResolverTests(TestCase):
+    def make_users(self, count):
+        """count получателей с outbox-строкой; у каждого второго есть Telegram."""
+        users = []
+        first = User.objects.count()
+        for i in range(count):
+            user = User.objects.create(
+                username=f"user{first + i}", email=f"user{first + i}@example.com"
+            )
+            if i % 2:
+                UserNotificationSettings.objects.create(user=user, notify_telegram=True)
+                UserProfile.objects.create(user=user, telegram_chat_id=1000 + user.id)
+            create_notification(user=user, **_payload())
+            users.append(user)
+        return users
+
+    def deliver(self):
+        """Доставляет одну пачку outbox; возвращает выполненные запросы."""
+        rows = delivery.claim_batch()
+        with mock.patch.object(
+            delivery,
+            "send_notification_emails",
+            side_effect=lambda items: {key: True for key, *_ in items},
+        ), mock.patch.object(delivery, "send_telegram_message", return_value=True):
+            with CaptureQueriesContext(connection) as ctx:
+                counts = delivery.deliver_batch(rows)
+        self.assertEqual(counts["sent"], len(rows))
+        return [query["sql"] for query in ctx.captured_queries]
+
+    def test_deliver_batch_query_count_does_not_grow(self):
+        self.make_users(3)
+        small = self.deliver()
+        self.make_users(6)
+        large = self.deliver()
+
+        self.assertEqual(len(small), len(large))
+        for queries in (small, large):
+            settings_queries = [
+                sql for sql in queries if UserNotificationSettings._meta.db_table in sql
+            ]
+            profile_queries = [sql for sql in queries if UserProfile._meta.db_table in sql]
+            self.assertEqual((len(settings_queries), len(profile_queries)), (1, 1))
+
+    def test_prefetched_users_are_not_queried_again(self):
+        users = self.make_users(4)
+
+        with self.assertNumQueries(2):
+            with preference_scope(users) as resolver:
+                pass
+        with self.assertNumQueries(0):
+            for user in users:
+                resolver.channels("booking_cancelled", user)
+                resolver.settings_for(user)
+
+    def test_scope_is_reset_on_exit(self):
+        self.assertIsNone(current_resolver())
+
+        with preference_scope() as outer:
+            self.assertIs(current_resolver(), outer)
+            with preference_scope() as inner:
+                self.assertIs(inner, outer)
+            self.assertIs(current_resolver(), outer)
+        self.assertIsNone(current_resolver())
+
+        with self.assertRaises(RuntimeError):
+            with preference_scope():
+                raise RuntimeError
+        self.assertIsNone(current_resolver())
@@ -1,9 +1,9 @@
 # notifications/utils.py
 from django.utils import timezone
 
-from .models import Notification
-from .email_utils import send_notification_email
-from .telegram import send_telegram_message
+from .events import is_subscribed, subscribed_user_ids
+from .models import Notification, NotificationOutbox
+from .preferences import current_resolver
 
 
 # Полный список событий, для которых вообще пытаемся что-то отправлять
@@ -40,7 +40,12 @@ def _get_user_notification_settings(user):
     """
     Аккуратно достаём настройки, чтобы не ловить циклические импорты.
     Если настроек нет — возвращаем None.
+    Внутри preference_scope() берём из общего кэша пачки.
     """
+    resolver = current_resolver()
+    if resolver is not None:
+        return resolver.settings_for(user)
+
     try:
         from users.models import UserNotificationSettings
     except Exception:
@@ -52,13 +57,18 @@ def _get_user_notification_settings(user):
         return None
 
 
-def should_send_email(event_type: str, user) -> bool:
+# «настройки не переданы — достать самим»; None означает «настроек нет»
+_UNSET = object()
+
+
+def should_send_email(event_type: str, user, settings=_UNSET) -> bool:
     """
-    Сейчас не используем notify_types — только галочку notify_email.
     Логика:
       - у пользователя должен быть email;
       - событие должно быть в EVENTS_SUPPORTED;
-      - либо нет настроек, либо notify_email=True.
+      - либо нет настроек, либо notify_email=True и бит события
+        есть в notify_mask.
+    settings можно передать заранее (пакетная отправка), иначе читаем из БД.
     """
     if not user or not getattr(user, "email", None):
         return False
@@ -66,33 +76,44 @@ def should_send_email(event_type: str, user) -> bool:
     if event_type not in EVENTS_SUPPORTED:
         return False
 
-    settings = _get_user_notification_settings(user)
+    if settings is _UNSET:
+        settings = _get_user_notification_settings(user)
     if settings and not settings.notify_email:
         return False
+    if not is_subscribed(settings, event_type):
+        return False
 
     return True
 
 
-def should_send_telegram(event_type: str, user) -> bool:
+def should_send_telegram(event_type: str, user, settings=_UNSET, chat_id=_UNSET) -> bool:
     """
     Аналогично email, но:
       - требуется user.profile.telegram_chat_id;
-      - галочка notify_telegram.
+      - галочка notify_telegram и бит события в notify_mask.
     """
     if not user:
         return False
 
-    profile = getattr(user, "profile", None)
-    chat_id = getattr(profile, "telegram_chat_id", None)
+    if chat_id is _UNSET:
+        resolver = current_resolver()
+        if resolver is not None:
+            chat_id = resolver.chat_id_for(user)
+        else:
+            profile = getattr(user, "profile", None)
+            chat_id = getattr(profile, "telegram_chat_id", None)
     if not chat_id:
         return False
 
     if event_type not in EVENTS_SUPPORTED:
         return False
 
-    settings = _get_user_notification_settings(user)
+    if settings is _UNSET:
+        settings = _get_user_notification_settings(user)
     if settings and not settings.notify_telegram:
         return False
+    if not is_subscribed(settings, event_type):
+        return False
 
     return True
 
@@ -112,12 +133,14 @@ def create_notification(
     """
     Универсальный помощник для создания записей Notification.
 
-    Делает три вещи:
-      1) создаёт запись в БД (internal log);
-      2) если надо — шлёт email;
-      3) если надо — шлёт Telegram.
+    Пишет запись в БД (internal log) и, если событие вообще может уйти
+    наружу и пользователь на него подписан (notify_mask), строку
+    NotificationOutbox — в транзакции вызывающего кода. Правило то же,
+    что у create_notifications_bulk.
+    Email и Telegram отправляет отдельный воркер (notifications/delivery.py,
+    команда deliver_notifications), поэтому здесь нет сетевых запросов.
 
-    Статус Notification обновляем так:
+    Статус Notification воркер обновляет так:
       - если хотя бы один канал успешно ушёл → status='sent';
       - если пытались что-то отправить и всё упало → status='failed';
       - если ни один канал не должен отправляться → остаётся 'pending'.
@@ -134,30 +157,63 @@ def create_notification(
         status=status,
     )
 
-    any_attempt = False
-    any_success = False
-
-    # --- E-MAIL ---
-    if should_send_email(event_type, user):
-        any_attempt = True
-        ok = send_notification_email(user, title, message)
-        if ok:
-            any_success = True
-
-    # --- TELEGRAM ---
-    if should_send_telegram(event_type, user):
-        any_attempt = True
-        profile = getattr(user, "profile", None)
-        chat_id = getattr(profile, "telegram_chat_id", None)
-        if chat_id:
-            ok = send_telegram_message(chat_id, f"<b>{title}</b>\n\n{message}")
-            if ok:
-                any_success = True
-
-    # --- обновляем статус ---
-    if any_attempt:
-        notif.sent_at = timezone.now()
-        notif.status = "sent" if any_success else "failed"
-        notif.save(update_fields=["status", "sent_at"])
+    if event_type in EVENTS_SUPPORTED and is_subscribed(
+        _get_user_notification_settings(user), event_type
+    ):
+        NotificationOutbox.objects.create(notification=notif)
 
     return notif
+
+
+def create_notifications_bulk(entries):
+    """
+    Пакетный вариант create_notification.
+
+    entries — список (user, payload), где payload — те же именованные
+    аргументы, что у create_notification (event_type, title, message,
+    channel, booking, issue, service_order, status).
+
+    Уведомления и строки outbox вставляются двумя bulk_create. Строки
+    outbox создаются только для подписанных на событие пользователей —
+    они выбираются в SQL по notify_mask, одним запросом на тип события.
+    Возвращает список Notification в порядке entries.
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+
+    notifications = Notification.objects.bulk_create(
+        [
+            Notification(
+                user=user,
+                event_type=payload["event_type"],
+                title=payload["title"],
+                message=payload["message"],
+                channel=payload.get("channel", "internal"),
+                booking=payload.get("booking"),
+                issue=payload.get("issue"),
+                service_order=payload.get("service_order"),
+                status=payload.get("status", "pending"),
+            )
+            for user, payload in entries
+        ]
+    )
+
+    users_by_event = {}
+    for notif in notifications:
+        if notif.event_type in EVENTS_SUPPORTED:
+            users_by_event.setdefault(notif.event_type, set()).add(notif.user_id)
+    subscribed = {
+        event_type: subscribed_user_ids(user_ids, event_type)
+        for event_type, user_ids in users_by_event.items()
+    }
+
+    NotificationOutbox.objects.bulk_create(
+        [
+            NotificationOutbox(notification=notif)
+            for notif in notifications
+            if notif.user_id in subscribed.get(notif.event_type, ())
+        ]
+    )
+
+    return notifications
@@ -0,0 +1,607 @@
+import datetime
+import heapq
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.db.models import (
+    Count,
+    DateTimeField,
+    DurationField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FilteredRelation,
+    Max,
+    Min,
+    OuterRef,
+    Q,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from bookings import occupancy
+from bookings.models import Booking
+from issues.models import ResourceOutage
+from resources.models import Resource
+
+
+# статусы броней, которые занимают ресурс
+BUSY_STATUSES = ["active", "conflicted"]
+
+
+def base_capacity_of(resource):
+    """Базовая вместимость ресурса (None → одно место)."""
+    return resource.capacity if resource.capacity is not None else 1
+
+
+def _events(bookings, outages, start_dt, end_dt):
+    """
+    Отсортированные события (момент, Δзагрузки, Δуменьшения) для sweep-line:
+    брони и outage обрезаются по [start_dt, end_dt), пустые отбрасываются.
+    """
+    events = []
+
+    for b_start, b_end in bookings:
+        s = max(b_start, start_dt)
+        e = min(b_end, end_dt)
+        if s < e:
+            events.append((s, 1, 0))
+            events.append((e, -1, 0))
+
+    for o_start, o_end, reduction in outages:
+        s = max(o_start, start_dt)
+        e = min(o_end, end_dt)
+        if s < e and reduction:
+            events.append((s, 0, reduction))
+            events.append((e, 0, -reduction))
+
+    events.sort(key=lambda ev: ev[0])
+    return events
+
+
+def _steps(bookings, outages, start_dt, end_dt):
+    """
+    Ступени загрузки на [start_dt, end_dt): (момент, load, reduction) после
+    применения всех событий этого момента. Интервалы полуоткрытые: бронь,
+    закончившаяся в moment, не конфликтует с начавшейся в moment.
+    """
+    events = _events(bookings, outages, start_dt, end_dt)
+
+    load = 0
+    reduction = 0
+    i = 0
+    while i < len(events):
+        moment = events[i][0]
+        while i < len(events) and events[i][0] == moment:
+            load += events[i][1]
+            reduction += events[i][2]
+            i += 1
+
+        if moment >= end_dt:
+            break
+        yield moment, load, reduction
+
+
+def sweep_occupancy(base_capacity, bookings, outages, start_dt, end_dt):
+    """
+    Sweep-line по интервалу [start_dt, end_dt).
+
+    bookings — список (start, end) пересекающихся броней;
+    outages  — список (start, end, capacity_reduction).
+
+    Из одного отсортированного потока событий считаем:
+      - peak_load — максимум ОДНОВРЕМЕННЫХ броней;
+      - peak_reduction — максимум одновременного уменьшения capacity по outage;
+      - min_free — минимум (base_capacity - reduction(t) - load(t)) по интервалу.
+
+    Брони, идущие друг за другом, не складываются: 10 коротких броней подряд
+    в общем зале дают peak_load = 1.
+    """
+    peak_load = 0
+    peak_reduction = 0
+    min_free = base_capacity
+
+    for _, load, reduction in _steps(bookings, outages, start_dt, end_dt):
+        peak_load = max(peak_load, load)
+        peak_reduction = max(peak_reduction, reduction)
+        min_free = min(min_free, base_capacity - reduction - load)
+
+    return peak_load, peak_reduction, min_free
+
+
+def fetch_timelines(
+    resource_ids, start_dt, end_dt, exclude_booking_ids=None, with_booking_ids=False
+):
+    """
+    Брони и outage для набора ресурсов на интервал [start_dt, end_dt)
+    за два запроса.
+
+    Возвращает (bookings_by_resource, outages_by_resource):
+      bookings_by_resource[resource_id] = [(start, end), ...]
+        (с with_booking_ids — [(booking_id, start, end), ...]);
+      outages_by_resource[resource_id] = [(start, end, capacity_reduction), ...]
+    """
+    bookings_by_resource = defaultdict(list)
+    outages_by_resource = defaultdict(list)
+
+    if not resource_ids:
+        return bookings_by_resource, outages_by_resource
+
+    bookings_qs = Booking.objects.filter(
+        resource_id__in=resource_ids,
+        status__in=BUSY_STATUSES,
+        period__overlap=DateTimeTZRange(start_dt, end_dt),
+    )
+    if exclude_booking_ids:
+        bookings_qs = bookings_qs.exclude(id__in=exclude_booking_ids)
+
+    for booking_id, resource_id, b_start, b_end in bookings_qs.values_list(
+        "id", "resource_id", "start_datetime", "end_datetime"
+    ):
+        if with_booking_ids:
+            bookings_by_resource[resource_id].append((booking_id, b_start, b_end))
+        else:
+            bookings_by_resource[resource_id].append((b_start, b_end))
+
+    outages_qs = ResourceOutage.objects.filter(
+        resource_id__in=resource_ids,
+        period__overlap=DateTimeTZRange(start_dt, end_dt),
+    )
+    for resource_id, o_start, o_end, reduction in outages_qs.values_list(
+        "resource_id", "start_datetime", "end_datetime", "capacity_reduction"
+    ):
+        outages_by_resource[resource_id].append((o_start, o_end, reduction or 0))
+
+    return bookings_by_resource, outages_by_resource
+
+
+class AvailabilityQuery(NamedTuple):
+    """Вопрос «свободен ли resource на [start_dt, end_dt)», без учёта брони exclude_booking_id."""
+
+    resource: Resource
+    start_dt: datetime.datetime
+    end_dt: datetime.datetime
+    exclude_booking_id: Optional[int] = None
+
+
+class AvailabilityResult(NamedTuple):
+    effective_capacity: int   # base_capacity минус пиковое уменьшение по outage
+    free_capacity: int        # минимум свободных мест по интервалу
+    peak_load: int            # пиковое число одновременных броней
+    reason: str               # "ok" | "outage" | "full"
+
+    @property
+    def available(self):
+        return self.free_capacity > 0
+
+
+class AvailabilityService:
+    """
+    Единое правило доступности ресурса на интервал.
+
+    Ресурс свободен на [start, end), если в каждый момент интервала
+    base_capacity - уменьшение по outage - число активных броней > 0.
+    Outage уменьшают capacity на capacity_reduction (ресурс на одного
+    при любом outage выпадает целиком), брони считаются по пиковой
+    одновременной загрузке, а не суммарно.
+
+    evaluate() отвечает на пачку вопросов по разным ресурсам, интервалам
+    и исключаемым броням двумя запросами: брони и outage всех ресурсов
+    на общий охватывающий интервал, дальше — sweep-line по каждому вопросу.
+    """
+
+    def evaluate(self, queries):
+        """Список AvailabilityResult в порядке queries."""
+        queries = [AvailabilityQuery(*q) for q in queries]
+        if not queries:
+            return []
+
+        bookings_by_resource, outages_by_resource = fetch_timelines(
+            {q.resource.id for q in queries},
+            min(q.start_dt for q in queries),
+            max(q.end_dt for q in queries),
+            with_booking_ids=True,
+        )
+
+        results = []
+        for q in queries:
+            bookings = [
+                (b_start, b_end)
+                for booking_id, b_start, b_end in bookings_by_resource.get(q.resource.id, [])
+                if booking_id != q.exclude_booking_id
+            ]
+            results.append(
+                self._result(
+                    base_capacity_of(q.resource),
+                    bookings,
+                    outages_by_resource.get(q.resource.id, []),
+                    q.start_dt,
+                    q.end_dt,
+                )
+            )
+        return results
+
+    @staticmethod
+    def _result(base_capacity, bookings, outages, start_dt, end_dt):
+        peak_load, peak_reduction, min_free = sweep_occupancy(
+            base_capacity, bookings, outages, start_dt, end_dt
+        )
+
+        effective_capacity = base_capacity - peak_reduction
+        if effective_capacity <= 0:
+            return AvailabilityResult(0, 0, 0, "outage")  # полностью недоступен
+
+        free_capacity = max(min_free, 0)
+        reason = "ok" if free_capacity > 0 else "full"
+        return AvailabilityResult(effective_capacity, free_capacity, peak_load, reason)
+
+    def evaluate_one(self, resource, start_dt, end_dt, exclude_booking_id=None):
+        return self.evaluate(
+            [AvailabilityQuery(resource, start_dt, end_dt, exclude_booking_id)]
+        )[0]
+
+    def is_available(self, resource, start_dt, end_dt, exclude_booking_id=None):
+        return self.evaluate_one(
+            resource, start_dt, end_dt, exclude_booking_id
+        ).available
+
+    def free_resources(self, resources, start_dt, end_dt, exclude_booking_id=None):
+        """Ресурсы из resources, свободные на весь интервал (порядок сохраняется)."""
+        resources = list(resources)
+        results = self.evaluate(
+            [
+                AvailabilityQuery(res, start_dt, end_dt, exclude_booking_id)
+                for res in resources
+            ]
+        )
+        return [res for res, result in zip(resources, results) if result.available]
+
+
+availability_service = AvailabilityService()
+
+
+def compute_capacities(resources, start_dt, end_dt, exclude_booking_ids=None):
+    """
+    Пакетный расчёт вместимости набора ресурсов на интервал [start_dt, end_dt)
+    через AvailabilityService.
+
+    Возвращает dict:
+    {
+      resource_id: (effective_capacity, free_capacity, overlap_count),
+      ...
+    }
+    где overlap_count — пиковое число одновременных броней.
+    """
+    resources = list(resources)
+    excluded = set(exclude_booking_ids or [])
+    if len(excluded) > 1:
+        raise ValueError("compute_capacities: можно исключить не больше одной брони")
+    exclude_booking_id = next(iter(excluded), None)
+
+    results = availability_service.evaluate(
+        [AvailabilityQuery(res, start_dt, end_dt, exclude_booking_id) for res in resources]
+    )
+    return {
+        res.id: (result.effective_capacity, result.free_capacity, result.peak_load)
+        for res, result in zip(resources, results)
+    }
+
+
+def first_saturation(base_capacity, bookings, outages, start_dt, end_dt):
+    """
+    Первый момент на [start_dt, end_dt), когда у ресурса не остаётся
+    свободной вместимости (base_capacity - reduction(t) - load(t) <= 0),
+    или None, если такого нет.
+
+    bookings / outages — как в sweep_occupancy; брони и outage, начавшиеся
+    раньше start_dt и ещё идущие, учитываются с момента start_dt.
+    """
+    for moment, load, reduction in _steps(bookings, outages, start_dt, end_dt):
+        if base_capacity - reduction - load <= 0:
+            return moment
+
+    return None
+
+
+def extension_limits(resources, start_dt, end_dt, exclude_booking_id=None):
+    """
+    До какого момента каждый ресурс из resources свободен, начиная
+    со start_dt, в пределах [start_dt, end_dt).
+
+    Брони и outage всех ресурсов грузятся двумя запросами, дальше
+    по каждому ресурсу ищется первое насыщение (first_saturation):
+    общий зал занят, только когда загрузка с учётом outage
+    выбирает всю вместимость.
+
+    Возвращает dict {resource_id: max_end}, где max_end == end_dt —
+    ресурс свободен на весь интервал, max_end == start_dt — занят сразу.
+    """
+    resources = list(resources)
+    if not resources:
+        return {}
+
+    bookings_by_resource, outages_by_resource = fetch_timelines(
+        [res.id for res in resources],
+        start_dt,
+        end_dt,
+        exclude_booking_ids=[exclude_booking_id] if exclude_booking_id else None,
+    )
+
+    limits = {}
+    for res in resources:
+        saturated_at = first_saturation(
+            base_capacity_of(res),
+            bookings_by_resource.get(res.id, []),
+            outages_by_resource.get(res.id, []),
+            start_dt,
+            end_dt,
+        )
+        limits[res.id] = end_dt if saturated_at is None else saturated_at
+
+    return limits
+
+
+def free_capacity_heatmap(resources, days):
+    """
+    Матрица свободной вместимости «ресурс × 15-минутный слот» на список дней.
+
+    Все брони и outage диапазона грузятся двумя запросами, дальше по каждой
+    паре (ресурс, день) строятся массивы загрузки и уменьшения capacity
+    (bookings.occupancy.build_counts) и поэлементно вычитаются из базовой
+    вместимости.
+
+    Возвращает dict {resource_id: [[free по слотам дня], ...]} в порядке days.
+    """
+    resources = list(resources)
+    days = list(days)
+    if not resources or not days:
+        return {res.id: [] for res in resources}
+
+    range_start = occupancy.day_start(days[0])
+    range_end = occupancy.slot_start(days[-1], occupancy.SLOTS_PER_DAY)
+
+    bookings_by_resource, outages_by_resource = fetch_timelines(
+        [res.id for res in resources], range_start, range_end
+    )
+
+    result = {}
+    for res in resources:
+        base_capacity = base_capacity_of(res)
+        bookings = bookings_by_resource.get(res.id, [])
+        outages = outages_by_resource.get(res.id, [])
+
+        rows = []
+        for day in days:
+            load = occupancy.build_counts(day, bookings)
+            reduction = occupancy.build_counts(
+                day,
+                [(o_start, o_end) for o_start, o_end, _ in outages],
+                weights=[red for _, _, red in outages],
+            )
+            rows.append(
+                [
+                    max(base_capacity - red - busy, 0)
+                    for busy, red in zip(load, reduction)
+                ]
+            )
+        result[res.id] = rows
+
+    return result
+
+
+def find_free_slots(resources, start_from, duration, horizon_days, limit):
+    """
+    Ближайшие limit стартов, с которых ресурс свободен на duration.
+
+    Для каждого ресурса строим отсортированный список свободных окон
+    по дням горизонта: загрузка броней берётся из сохранённых слотовых
+    массивов (bookings.occupancy), outage уменьшают capacity, окна не
+    выходят за рабочие часы. Списки окон всех ресурсов сливаются через
+    heapq.merge, поэтому дни считаются лениво — ровно до limit результатов.
+
+    Возвращает список (start_dt, end_dt, resource).
+    """
+    resources = list(resources)
+    if not resources or limit <= 0:
+        return []
+
+    slot = datetime.timedelta(minutes=occupancy.SLOT_MINUTES)
+    duration_slots = -(-duration // slot)  # ceil
+
+    first_day = timezone.localtime(start_from).date()
+    days = [first_day + datetime.timedelta(days=i) for i in range(horizon_days)]
+
+    resource_ids = [res.id for res in resources]
+    load_counts = occupancy.get_counts(resource_ids, days)
+
+    outages_by_resource = defaultdict(list)
+    outages_qs = ResourceOutage.objects.filter(
+        resource_id__in=resource_ids,
+        period__overlap=DateTimeTZRange(
+            occupancy.day_start(days[0]),
+            occupancy.slot_start(days[-1], occupancy.SLOTS_PER_DAY),
+        ),
+    )
+    for resource_id, o_start, o_end, reduction in outages_qs.values_list(
+        "resource_id", "start_datetime", "end_datetime", "capacity_reduction"
+    ):
+        outages_by_resource[resource_id].append((o_start, o_end, reduction or 0))
+
+    def gaps_of(res):
+        base_capacity = base_capacity_of(res)
+        outages = outages_by_resource.get(res.id, [])
+
+        for day in days:
+            load = load_counts[(res.id, day)]
+            reduction = occupancy.build_counts(
+                day,
+                [(o_start, o_end) for o_start, o_end, _ in outages],
+                weights=[red for _, _, red in outages],
+            )
+            free = [
+                base_capacity - red - busy for busy, red in zip(load, reduction)
+            ]
+            from_slot = (
+                occupancy.first_slot_from(day, start_from) if day == first_day else 0
+            )
+            for first, _ in occupancy.free_runs(free, duration_slots, from_slot):
+                yield occupancy.slot_start(day, first), res.id
+
+    resources_by_id = {res.id: res for res in resources}
+    result = []
+    for start_dt, resource_id in heapq.merge(*(gaps_of(res) for res in resources)):
+        result.append((start_dt, start_dt + duration, resources_by_id[resource_id]))
+        if len(result) >= limit:
+            break
+
+    return result
+
+
+def best_fit_resource(candidates, start_dt, end_dt, day_start, day_end):
+    """
+    Свободный ресурс из candidates с наименьшим свободным окном вокруг
+    [start_dt, end_dt) в пределах рабочего дня [day_start, day_end).
+
+    Занятость проверяется на ВЕСЬ интервал (он может тянуться на несколько
+    дней): ресурсы с пересекающейся бронью или outage отсекаются
+    подзапросами NOT EXISTS. Окно — от окончания предыдущей брони
+    (или начала дня) до начала следующей (или конца дня) — считается
+    по броням рабочего дня, присоединённым через FilteredRelation.
+    Всё одним запросом, при равных окнах выигрывает меньший id.
+    Ресурсы с пустым окном (интервал вне рабочего дня) не подходят.
+
+    Возвращает Resource с аннотацией free_window (timedelta) или None,
+    если свободных ресурсов нет.
+    """
+    day_start_value = Value(day_start, output_field=DateTimeField())
+    day_end_value = Value(day_end, output_field=DateTimeField())
+    interval = DateTimeTZRange(start_dt, end_dt)
+
+    busy = Booking.objects.filter(
+        resource_id=OuterRef("pk"),
+        status__in=BUSY_STATUSES,
+        period__overlap=interval,
+    )
+    out_of_service = ResourceOutage.objects.filter(
+        resource_id=OuterRef("pk"),
+        capacity_reduction__gt=0,
+        period__overlap=interval,
+    )
+
+    return (
+        candidates.filter(~Exists(busy), ~Exists(out_of_service))
+        .annotate(
+            day_bookings=FilteredRelation(
+                "bookings",
+                condition=Q(
+                    bookings__status__in=BUSY_STATUSES,
+                    bookings__period__overlap=DateTimeTZRange(day_start, day_end),
+                ),
+            ),
+        )
+        .annotate(
+            prev_end=Max(
+                "day_bookings__end_datetime",
+                filter=Q(day_bookings__end_datetime__lte=start_dt),
+            ),
+            next_start=Min(
+                "day_bookings__start_datetime",
+                filter=Q(day_bookings__start_datetime__gte=end_dt),
+            ),
+        )
+        .annotate(
+            free_window=ExpressionWrapper(
+                Least(Coalesce(F("next_start"), day_end_value), day_end_value)
+                - Greatest(Coalesce(F("prev_end"), day_start_value), day_start_value),
+                output_field=DurationField(),
+            )
+        )
+        .filter(free_window__gt=datetime.timedelta(0))
+        .order_by("free_window", "id")
+        .first()
+    )
+
+
+def free_units_by_type(type_ids, start_dt, end_dt):
+    """
+    Свободные единицы (оборудование и т.п.) по типам на интервал
+    [start_dt, end_dt) — за три запроса при любом числе типов:
+    кандидаты, затем AvailabilityService (брони и outage).
+
+    Возвращает dict {type_id: [Resource, ...]} в порядке id.
+    """
+    type_ids = sorted(set(type_ids))
+    result = {type_id: [] for type_id in type_ids}
+    if not type_ids:
+        return result
+
+    candidates = list(
+        Resource.objects.filter(type_id__in=type_ids, status="active").order_by("id")
+    )
+    if not candidates:
+        return result
+
+    for res in availability_service.free_resources(candidates, start_dt, end_dt):
+        result[res.type_id].append(res)
+
+    return result
+
+
+def plan_equipment(requests, start_dt, end_dt):
+    """
+    План выдачи оборудования на интервал для всей «корзины» сразу.
+
+    requests — список (TypeInfo, quantity); одинаковые типы суммируются.
+    Число запросов к БД не зависит от числа строк (см. free_units_by_type).
+
+    Возвращает (plan, shortage):
+      plan — [{"type": TypeInfo, "resources": [Resource, ...]}, ...]
+             в порядке первого упоминания типа, или None при нехватке;
+      shortage — [{"type", "needed", "available", "total"}, ...] по всем
+             типам, где свободных единиц меньше запрошенного
+             (total — сколько вообще активных единиц типа свободно или нет).
+    """
+    needed = {}
+    types = {}
+    for equipment_type, quantity in requests:
+        types.setdefault(equipment_type.id, equipment_type)
+        needed[equipment_type.id] = needed.get(equipment_type.id, 0) + quantity
+
+    if not needed:
+        return [], []
+
+    free = free_units_by_type(needed, start_dt, end_dt)
+
+    shortage = []
+    for type_id, quantity in needed.items():
+        if len(free[type_id]) < quantity:
+            shortage.append(
+                {
+                    "type": types[type_id],
+                    "needed": quantity,
+                    "available": len(free[type_id]),
+                }
+            )
+
+    if shortage:
+        # сколько единиц типа есть вообще — чтобы отличить «нет такого
+        # оборудования» от «всё занято»; запрос только в случае нехватки
+        totals = dict(
+            Resource.objects.filter(
+                type_id__in=[item["type"].id for item in shortage], status="active"
+            )
+            .values("type_id")
+            .annotate(total=Count("id"))
+            .values_list("type_id", "total")
+        )
+        for item in shortage:
+            item["total"] = totals.get(item["type"].id, 0)
+        return None, shortage
+
+    plan = [
+        {"type": types[type_id], "resources": free[type_id][:quantity]}
+        for type_id, quantity in needed.items()
+    ]
+    return plan, []
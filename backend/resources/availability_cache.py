@@ -0,0 +1,164 @@
+# backend/resources/availability_cache.py
+"""
+Кэш ответов «свободные ресурсы категории на интервал».
+
+Ключ ответа — (категория, start, end) плюс «штамп» из поколений:
+  - поколение каталога (ресурсы/типы/категории) — меняется при их сохранении;
+  - поколения типов ресурсов категории: для интервала внутри одного дня —
+    поколение пары (тип, день), для многодневного — поколение типа.
+
+Запись брони или outage меняет поколение своего типа и пар (тип, день)
+своих дней, поэтому она не сбрасывает кэш остальных категорий, а
+однодневные ответы — и кэш остальных дат. Многодневные ответы
+сбрасываются любой записью их типов: так штамп любого ответа — одно
+поколение на тип, и попадание стоит два чтения общего кэша (каталог и
+поколения типов) независимо от длины интервала. Старые записи не
+удаляются — просто перестают совпадать по ключу и истекают по TTL.
+
+Поколения лежат в общем кэше (resources/versions.py) — сброс виден всем
+воркерам. Сами ответы и счётчики попаданий/промахов/инвалидаций — в кэше
+процесса: ответ с чужим штампом просто не найдётся.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from bookings.occupancy import days_between
+
+from . import versions
+
+
+RESULT_KEY = "availability:result:{category}:{start}:{end}:{stamp}"
+TYPE_KEY = "availability:gen:type:{type_id}"
+TYPE_DAY_KEY = "availability:gen:type:{type_id}:{day}"
+CATALOG_KEY = "availability:gen:catalog"
+CATEGORY_TYPES_KEY = "availability:types:{category}:{catalog}"
+STATS_KEY = "availability:stats:{name}"
+
+STATS_NAMES = ("hits", "misses", "invalidations", "bypass")
+
+# интервалы длиннее (например, месячная аренда) не кэшируем:
+# такие ответы сбрасывает почти любая запись их типов
+MAX_CACHED_DAYS = 62
+
+
+def _ttl():
+    return getattr(settings, "AVAILABILITY_CACHE_TTL", 300)
+
+
+def _count(name, delta=1):
+    key = STATS_KEY.format(name=name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def _generations(keys):
+    """Текущие значения поколений; отсутствующие заводим."""
+    return versions.current_many(keys)
+
+
+def _catalog_generation():
+    return _generations([CATALOG_KEY])[0]
+
+
+def _category_type_ids(category, catalog_generation):
+    """id типов категории (category=None — все типы); кэшируются по поколению каталога."""
+    from .models import ResourceType
+
+    key = CATEGORY_TYPES_KEY.format(category=category or "*", catalog=catalog_generation)
+    type_ids = cache.get(key)
+    if type_ids is None:
+        qs = ResourceType.objects.all()
+        if category:
+            qs = qs.filter(category__code=category)
+        type_ids = sorted(qs.values_list("id", flat=True))
+        cache.set(key, type_ids, timeout=_ttl())
+    return type_ids
+
+
+def _result_key(category, start_dt, end_dt):
+    days = days_between(start_dt, end_dt)
+    if len(days) > MAX_CACHED_DAYS:
+        return None
+
+    catalog_generation = _catalog_generation()
+    type_ids = _category_type_ids(category, catalog_generation)
+    if len(days) == 1:
+        day = days[0].isoformat()
+        keys = [TYPE_DAY_KEY.format(type_id=type_id, day=day) for type_id in type_ids]
+    else:
+        keys = [TYPE_KEY.format(type_id=type_id) for type_id in type_ids]
+    generations = _generations(keys)
+
+    stamp = hashlib.md5(
+        ":".join(str(g) for g in [catalog_generation, *generations]).encode()
+    ).hexdigest()
+    return RESULT_KEY.format(
+        category=category or "*",
+        start=start_dt.isoformat(),
+        end=end_dt.isoformat(),
+        stamp=stamp,
+    )
+
+
+def get_or_compute(category, start_dt, end_dt, compute):
+    """
+    Ответ из кэша или compute() с сохранением.
+    category — код категории или None (все категории).
+    """
+    key = _result_key(category, start_dt, end_dt)
+    if key is None:
+        _count("bypass")
+        return compute()
+
+    result = cache.get(key)
+    if result is not None:
+        _count("hits")
+        return result
+
+    _count("misses")
+    result = compute()
+    cache.set(key, result, timeout=_ttl())
+    return result
+
+
+def invalidate(type_id, start_dt, end_dt):
+    """
+    Сброс ответов, которые зависят от типа type_id: однодневных — на днях
+    интервала, многодневных — всех.
+    """
+    if type_id is None:
+        return
+    versions.bump_many(
+        [
+            TYPE_KEY.format(type_id=type_id),
+            *(
+                TYPE_DAY_KEY.format(type_id=type_id, day=day.isoformat())
+                for day in days_between(start_dt, end_dt)
+            ),
+        ]
+    )
+    _count("invalidations")
+
+
+def invalidate_catalog():
+    """Сброс всех ответов — изменился состав ресурсов/типов/категорий."""
+    versions.bump(CATALOG_KEY)
+    _count("invalidations")
+
+
+def stats():
+    keys = [STATS_KEY.format(name=name) for name in STATS_NAMES]
+    values = cache.get_many(keys)
+    result = {name: values.get(key, 0) for name, key in zip(STATS_NAMES, keys)}
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = round(result["hits"] / lookups, 4) if lookups else None
+    return result
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format(name=name) for name in STATS_NAMES])
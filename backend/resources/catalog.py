@@ -0,0 +1,131 @@
+# backend/resources/catalog.py
+"""
+Каталог ресурсов в памяти процесса.
+
+Категории и типы (с тарифами) меняются редко — только через админку, —
+а читаются в каждом ответе с бронями и доступностью. Каждый воркер
+держит один неизменяемый снимок каталога на версию; версия лежит в общем
+кэше (resources/versions.py) и меняется сигналами после коммита любой
+записи (resources/signals.py). При чтении версия сверяется с локальной
+и при расхождении снимок перечитывается двумя запросами.
+"""
+import threading
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Optional
+
+from . import versions
+
+
+VERSION_KEY = "resources:catalog:version"
+
+
+@dataclass(frozen=True)
+class CategoryInfo:
+    id: int
+    code: str
+    name: str
+
+
+@dataclass(frozen=True)
+class TypeInfo:
+    id: int
+    category: CategoryInfo
+    name: str
+    description: Optional[str]
+    hourly_rate: Optional[Decimal]
+    daily_rate: Optional[Decimal]
+    monthly_rate: Optional[Decimal]
+
+    @property
+    def category_id(self):
+        return self.category.id
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога одной версии."""
+
+    def __init__(self, version, categories, types, type_data):
+        self.version = version
+        self.categories = MappingProxyType(categories)   # id -> CategoryInfo
+        self.types = MappingProxyType(types)             # id -> TypeInfo
+        # id типа -> готовый ResourceTypeSerializer(...).data
+        self._type_data = MappingProxyType(type_data)
+
+    def type_data(self, type_id):
+        return self._type_data.get(type_id)
+
+    @classmethod
+    def load(cls, version):
+        from .models import ResourceCategory, ResourceType
+        from .serializers import ResourceTypeSerializer
+
+        categories = {
+            c.id: CategoryInfo(id=c.id, code=c.code, name=c.name)
+            for c in ResourceCategory.objects.all()
+        }
+
+        types = {}
+        type_data = {}
+        for t in ResourceType.objects.select_related("category"):
+            category = categories.get(t.category_id)
+            if category is None:
+                # тип с категорией, созданной между запросами, — попадёт в следующую версию
+                continue
+            types[t.id] = TypeInfo(
+                id=t.id,
+                category=category,
+                name=t.name,
+                description=t.description,
+                hourly_rate=t.hourly_rate,
+                daily_rate=t.daily_rate,
+                monthly_rate=t.monthly_rate,
+            )
+            type_data[t.id] = ResourceTypeSerializer(t).data
+
+        return cls(version, categories, types, type_data)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def bump_version():
+    """Новая версия каталога для всех процессов."""
+    return versions.bump(VERSION_KEY)
+
+
+def get_snapshot():
+    """Актуальный снимок каталога (перечитывается при смене версии)."""
+    global _snapshot
+
+    version = versions.current(VERSION_KEY)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = CatalogSnapshot.load(version)
+        return _snapshot
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_type(type_id):
+    """TypeInfo по id (строка из запроса тоже подходит) или None."""
+    return get_snapshot().types.get(_as_id(type_id))
+
+
+def type_data(type_id):
+    """
+    Сериализованный тип (формат ResourceTypeSerializer) из снимка или None.
+    Словарь общий для всех ответов — не изменять.
+    """
+    return get_snapshot().type_data(type_id)
@@ -0,0 +1,39 @@
+# backend/resources/checks.py
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .versions import SHARED_CACHE_ALIAS
+
+
+# backend'ы, которые не видны другим процессам
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Версии каталога, индексов интервалов и поколения кэша доступности
+    должны быть общими для всех воркеров — иначе сброс в одном процессе
+    не дойдёт до остальных и они будут отдавать устаревшие данные.
+    """
+    config = settings.CACHES.get(SHARED_CACHE_ALIAS)
+    if config is None:
+        return [
+            Error(
+                f"В CACHES нет алиаса '{SHARED_CACHE_ALIAS}'.",
+                hint="Настройте общий кэш: DatabaseCache или RedisCache.",
+                id="resources.E001",
+            )
+        ]
+    if config.get("BACKEND") in PROCESS_LOCAL_BACKENDS:
+        return [
+            Error(
+                f"Кэш '{SHARED_CACHE_ALIAS}' не общий для процессов: {config['BACKEND']}.",
+                hint="Используйте DatabaseCache или RedisCache.",
+                id="resources.E002",
+            )
+        ]
+    return []
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from . import catalog
 from .models import ResourceCategory, ResourceType, Resource
 
 
@@ -28,8 +30,37 @@ class ResourceTypeSerializer(serializers.ModelSerializer):
         ]
 
 
+class CatalogTypeField(serializers.Field):
+    """
+    Вложенный тип ресурса из снимка каталога (resources.catalog)
+    вместо ResourceTypeSerializer по каждому объекту.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        kwargs.setdefault("source", "*")
+        super().__init__(**kwargs)
+
+    def _snapshot(self):
+        # один снимок (и одно чтение версии из общего кэша) на весь ответ:
+        # context общий у корневого сериализатора и всех вложенных
+        context = self.context
+        snapshot = context.get("_catalog_snapshot")
+        if snapshot is None:
+            snapshot = catalog.get_snapshot()
+            context["_catalog_snapshot"] = snapshot
+        return snapshot
+
+    def to_representation(self, resource):
+        data = self._snapshot().type_data(resource.type_id)
+        if data is None:
+            # тип ещё не попал в снимок (например, создан в этой же транзакции)
+            data = ResourceTypeSerializer(resource.type).data
+        return data
+
+
 class ResourceSerializer(serializers.ModelSerializer):
-    type = ResourceTypeSerializer(read_only=True)
+    type = CatalogTypeField()
     type_id = serializers.PrimaryKeyRelatedField(
         source="type", queryset=ResourceType.objects.all(), write_only=True
     )
@@ -0,0 +1,24 @@
+# backend/resources/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import availability_cache, catalog
+from .models import Resource, ResourceCategory, ResourceType
+
+
+@receiver(post_save, sender=ResourceCategory)
+@receiver(post_delete, sender=ResourceCategory)
+@receiver(post_save, sender=ResourceType)
+@receiver(post_delete, sender=ResourceType)
+def catalog_changed(sender, instance, **kwargs):
+    # новая версия снимка каталога во всех процессах
+    transaction.on_commit(catalog.bump_version)
+    transaction.on_commit(availability_cache.invalidate_catalog)
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def resource_changed(sender, instance, **kwargs):
+    # состав/статус/capacity ресурсов влияет на любой ответ доступности
+    transaction.on_commit(availability_cache.invalidate_catalog)
@@ -1,3 +1,797 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from bookings import occupancy
+from bookings.models import Booking
+from issues.models import ResourceOutage
+
+from . import availability_cache, catalog
+from .availability import (
+    AvailabilityQuery,
+    AvailabilityResult,
+    availability_service,
+    best_fit_resource,
+    extension_limits,
+    plan_equipment,
+    sweep_occupancy,
+)
+from .views import HEATMAP_MAX_DAYS, ResourceViewSet, collect_available_resources
+from .models import Resource, ResourceCategory, ResourceType
+from .versions import shared_cache
+
+
+def at(hour, minute=0):
+    return datetime.datetime(2030, 1, 10, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+class SweepOccupancyTests(SimpleTestCase):
+    def test_touching_bookings_do_not_stack(self):
+        bookings = [(at(9), at(10)), (at(10), at(11)), (at(11), at(12))]
+        peak_load, peak_reduction, min_free = sweep_occupancy(
+            3, bookings, [], at(9), at(12)
+        )
+        self.assertEqual((peak_load, peak_reduction, min_free), (1, 0, 2))
+
+    def test_overlapping_bookings_stack(self):
+        bookings = [(at(9), at(11)), (at(10), at(12)), (at(10, 30), at(10, 45))]
+        peak_load, _, min_free = sweep_occupancy(5, bookings, [], at(9), at(12))
+        self.assertEqual(peak_load, 3)
+        self.assertEqual(min_free, 2)
+
+    def test_bookings_outside_interval_are_clipped(self):
+        bookings = [(at(7), at(9)), (at(12), at(13)), (at(8), at(9, 30))]
+        peak_load, _, min_free = sweep_occupancy(1, bookings, [], at(9), at(12))
+        self.assertEqual(peak_load, 1)
+        self.assertEqual(min_free, 0)
+
+        peak_load, _, min_free = sweep_occupancy(1, bookings, [], at(9, 30), at(12))
+        self.assertEqual((peak_load, min_free), (0, 1))
+
+    def test_outage_reduces_free_capacity_where_it_overlaps(self):
+        bookings = [(at(9), at(12))]
+        outages = [(at(10), at(11), 2)]
+        peak_load, peak_reduction, min_free = sweep_occupancy(
+            3, bookings, outages, at(9), at(12)
+        )
+        self.assertEqual((peak_load, peak_reduction, min_free), (1, 2, 0))
+
+    def test_outage_touching_booking_counts_separately(self):
+        # бронь до 10:00 и outage с 10:00 не складываются в один момент
+        bookings = [(at(9), at(10))]
+        outages = [(at(10), at(11), 1)]
+        _, peak_reduction, min_free = sweep_occupancy(
+            2, bookings, outages, at(9), at(11)
+        )
+        self.assertEqual(peak_reduction, 1)
+        self.assertEqual(min_free, 1)
+
+    def test_concurrent_outages_sum(self):
+        outages = [(at(9), at(11), 1), (at(10), at(12), 2), (at(11), at(12), 0)]
+        _, peak_reduction, min_free = sweep_occupancy(4, [], outages, at(9), at(12))
+        self.assertEqual(peak_reduction, 3)
+        self.assertEqual(min_free, 1)
+
+    def test_empty_interval_is_fully_free(self):
+        self.assertEqual(sweep_occupancy(2, [], [], at(9), at(10)), (0, 0, 2))
+
+
+class NextFreeSlotTests(TestCase):
+    URL = "/api/resources/next-free-slot/"
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        self.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.desk_a = Resource.objects.create(type=self.desk_type, name="Стол A")
+        self.desk_b = Resource.objects.create(type=self.desk_type, name="Стол B")
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+    def local(self, hour, day=None):
+        return timezone.make_aware(
+            datetime.datetime.combine(day or self.day, datetime.time(hour=hour)),
+            timezone.get_current_timezone(),
+        )
+
+    def book(self, resource, start_hour, end_hour):
+        return Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(start_hour),
+            end_datetime=self.local(end_hour),
+            status="active",
+        )
+
+    def fetch(self, **params):
+        params.setdefault("resource_type_id", self.desk_type.id)
+        params.setdefault("duration_minutes", 60)
+        params.setdefault("from", self.local(6).isoformat())
+        return self.client.get(self.URL, params)
+
+    def test_skips_bookings_and_outages(self):
+        self.book(self.desk_a, 6, 10)
+        self.book(self.desk_b, 6, 8)
+        ResourceOutage.objects.create(
+            resource=self.desk_b,
+            start_datetime=self.local(8),
+            end_datetime=self.local(9),
+        )
+
+        response = self.fetch(limit=3)
+        self.assertEqual(response.status_code, 200, response.data)
+        options = [
+            (item["resource_id"], item["start_datetime"])
+            for item in response.data["options"]
+        ]
+        next_day = self.day + datetime.timedelta(days=1)
+        self.assertEqual(
+            options,
+            [
+                (self.desk_b.id, self.local(9)),
+                (self.desk_a.id, self.local(10)),
+                (self.desk_a.id, self.local(6, next_day)),
+            ],
+        )
+
+    def test_window_shorter_than_duration_is_skipped(self):
+        self.book(self.desk_a, 6, 22)
+        self.book(self.desk_b, 7, 23)
+
+        response = self.fetch(duration_minutes=120, limit=1)
+        self.assertEqual(response.status_code, 200, response.data)
+        option = response.data["options"][0]
+        self.assertEqual(option["resource_id"], self.desk_a.id)
+        self.assertEqual(
+            option["start_datetime"], self.local(6, self.day + datetime.timedelta(days=1))
+        )
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.fetch(resource_type_id="abc").status_code, 400)
+        self.assertEqual(self.fetch(duration_minutes=20).status_code, 400)
+        self.assertEqual(self.fetch(limit=0).status_code, 400)
+
+
+class HeatmapTests(TestCase):
+    URL = "/api/resources/heatmap/"
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        self.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        monitor_type = ResourceType.objects.create(category=equipment, name="Монитор")
+        self.desk = Resource.objects.create(type=self.desk_type, name="Стол")
+        self.hall = Resource.objects.create(type=hall_type, name="Зал", capacity=3)
+        Resource.objects.create(type=self.desk_type, name="На ремонте", status="maintenance")
+        Resource.objects.create(type=monitor_type, name="Монитор")
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+    def local(self, hour, minute=0):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time(hour=hour, minute=minute)),
+            timezone.get_current_timezone(),
+        )
+
+    def slot(self, hour, minute=0):
+        return ((hour - 6) * 60 + minute) // occupancy.SLOT_MINUTES
+
+    def book(self, resource, start_dt, end_dt):
+        Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=start_dt,
+            end_datetime=end_dt,
+            status="active",
+        )
+
+    def fetch(self, **params):
+        params.setdefault("start_date", self.day.isoformat())
+        return self.client.get(self.URL, params)
+
+    def test_free_capacity_by_slot(self):
+        self.book(self.hall, self.local(9), self.local(10))
+        self.book(self.hall, self.local(9, 30), self.local(11))
+        ResourceOutage.objects.create(
+            resource=self.hall,
+            start_datetime=self.local(12),
+            end_datetime=self.local(13),
+            capacity_reduction=2,
+        )
+        ResourceOutage.objects.create(
+            resource=self.desk,
+            start_datetime=self.local(14),
+            end_datetime=self.local(15),
+        )
+        next_day = self.day + datetime.timedelta(days=1)
+
+        response = self.fetch(end_date=next_day.isoformat())
+
+        self.assertEqual(response.status_code, 200, response.data)
+        data = response.data
+        self.assertEqual(data["slots_per_day"], occupancy.SLOTS_PER_DAY)
+        self.assertEqual(data["dates"], [self.day.isoformat(), next_day.isoformat()])
+        self.assertEqual(
+            [item["id"] for item in data["resources"]], [self.desk.id, self.hall.id]
+        )
+
+        (desk_today, desk_tomorrow), (hall_today, hall_tomorrow) = data["free"]
+
+        expected_hall = [3] * occupancy.SLOTS_PER_DAY
+        for first, last, free in (
+            (self.slot(9), self.slot(9, 30), 2),
+            (self.slot(9, 30), self.slot(10), 1),
+            (self.slot(10), self.slot(11), 2),
+            (self.slot(12), self.slot(13), 1),
+        ):
+            expected_hall[first:last] = [free] * (last - first)
+        self.assertEqual(hall_today, expected_hall)
+
+        expected_desk = [1] * occupancy.SLOTS_PER_DAY
+        expected_desk[self.slot(14):self.slot(15)] = [0] * 4
+        self.assertEqual(desk_today, expected_desk)
+
+        self.assertEqual(hall_tomorrow, [3] * occupancy.SLOTS_PER_DAY)
+        self.assertEqual(desk_tomorrow, [1] * occupancy.SLOTS_PER_DAY)
+
+    def test_resource_type_filter(self):
+        response = self.fetch(resource_type_id=self.desk_type.id)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([item["id"] for item in response.data["resources"]], [self.desk.id])
+
+    def test_max_days(self):
+        last = self.day + datetime.timedelta(days=HEATMAP_MAX_DAYS - 1)
+        response = self.fetch(end_date=last.isoformat())
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data["dates"]), HEATMAP_MAX_DAYS)
+
+        response = self.fetch(end_date=(last + datetime.timedelta(days=1)).isoformat())
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.fetch(resource_type_id="abc").status_code, 400)
+        self.assertEqual(self.fetch(start_date="2030-13-01").status_code, 400)
+        self.assertEqual(self.client.get(self.URL).status_code, 400)
+        yesterday = self.day - datetime.timedelta(days=1)
+        self.assertEqual(self.fetch(end_date=yesterday.isoformat()).status_code, 400)
+
+
+class PlanEquipmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        monitor_type = ResourceType.objects.create(category=equipment, name="Монитор")
+        lamp_type = ResourceType.objects.create(category=equipment, name="Лампа")
+        projector_type = ResourceType.objects.create(category=equipment, name="Проектор")
+
+        self.monitors = [
+            Resource.objects.create(type=monitor_type, name=f"Монитор {i}")
+            for i in range(4)
+        ]
+        self.lamps = [
+            Resource.objects.create(type=lamp_type, name=f"Лампа {i}") for i in range(2)
+        ]
+
+        self.monitor = catalog.get_type(monitor_type.id)
+        self.lamp = catalog.get_type(lamp_type.id)
+        self.projector = catalog.get_type(projector_type.id)
+
+        self.start_dt = timezone.now() + datetime.timedelta(days=1)
+        self.end_dt = self.start_dt + datetime.timedelta(hours=2)
+
+    def book(self, resource):
+        Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="equipment",
+            time_format="hour",
+            start_datetime=self.start_dt - datetime.timedelta(hours=1),
+            end_datetime=self.start_dt + datetime.timedelta(hours=1),
+            status="active",
+        )
+
+    def test_plan_merges_types_and_skips_busy_units(self):
+        self.book(self.monitors[0])
+        ResourceOutage.objects.create(
+            resource=self.monitors[2],
+            start_datetime=self.end_dt - datetime.timedelta(minutes=30),
+            end_datetime=self.end_dt + datetime.timedelta(hours=1),
+        )
+
+        plan, shortage = plan_equipment(
+            [(self.lamp, 1), (self.monitor, 1), (self.monitor, 1)],
+            self.start_dt,
+            self.end_dt,
+        )
+
+        self.assertEqual(shortage, [])
+        self.assertEqual(
+            [(item["type"], item["resources"]) for item in plan],
+            [
+                (self.lamp, self.lamps[:1]),
+                (self.monitor, [self.monitors[1], self.monitors[3]]),
+            ],
+        )
+
+    def test_shortage_reports_available_and_total(self):
+        self.book(self.lamps[0])
+
+        plan, shortage = plan_equipment(
+            [(self.monitor, 2), (self.lamp, 2), (self.projector, 1)],
+            self.start_dt,
+            self.end_dt,
+        )
+
+        self.assertIsNone(plan)
+        self.assertEqual(
+            shortage,
+            [
+                {"type": self.lamp, "needed": 2, "available": 1, "total": 2},
+                {"type": self.projector, "needed": 1, "available": 0, "total": 0},
+            ],
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        # кандидаты, брони, outage — при любом числе строк корзины
+        with self.assertNumQueries(3):
+            plan_equipment([(self.monitor, 1)], self.start_dt, self.end_dt)
+        with self.assertNumQueries(3):
+            plan_equipment(
+                [(self.monitor, 1), (self.lamp, 2), (self.monitor, 3)],
+                self.start_dt,
+                self.end_dt,
+            )
+
+    def test_empty_request(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(plan_equipment([], self.start_dt, self.end_dt), ([], []))
+
+
+class BestFitResourceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.desk_a = Resource.objects.create(type=desk_type, name="Стол A")
+        self.desk_b = Resource.objects.create(type=desk_type, name="Стол B")
+        self.candidates = Resource.objects.filter(type=desk_type)
+
+    def book(self, resource, start_dt, end_dt):
+        Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=start_dt,
+            end_datetime=end_dt,
+            status="active",
+        )
+
+    def test_prefers_tightest_window(self):
+        self.book(self.desk_b, at(7), at(9))
+        self.book(self.desk_b, at(12), at(14))
+
+        best = best_fit_resource(self.candidates, at(9), at(11), at(6), at(23))
+
+        self.assertEqual(best, self.desk_b)
+        self.assertEqual(best.free_window, datetime.timedelta(hours=3))
+
+    def test_skips_empty_window(self):
+        # у стола A окно «до конца дня» отрицательное: бронь кончается
+        # позже границы дня — такой стол не должен выигрывать сортировку
+        self.book(self.desk_a, at(8), at(10, 30))
+
+        best = best_fit_resource(self.candidates, at(11), at(12), at(6), at(10))
+
+        self.assertEqual(best, self.desk_b)
+        self.assertIsNone(
+            best_fit_resource(
+                self.candidates.filter(id=self.desk_a.id), at(11), at(12), at(6), at(10)
+            )
+        )
+
+
+class AvailabilityServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        self.free_desk = Resource.objects.create(type=desk_type, name="Свободный")
+        self.busy_desk = Resource.objects.create(type=desk_type, name="Занятый")
+        self.broken_desk = Resource.objects.create(type=desk_type, name="Сломанный")
+        self.hall = Resource.objects.create(type=hall_type, name="Зал", capacity=3)
+        self.closed_hall = Resource.objects.create(type=hall_type, name="Закрыт", capacity=3)
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.own = self.book(self.busy_desk, 9, 11)
+        self.book(self.hall, 9, 11)
+        self.book(self.hall, 10, 12)
+        self.outage(self.hall, 10, 30, 11, 0, reduction=1)
+        self.outage(self.broken_desk, 9, 30, 10, 0, reduction=1)
+        self.outage(self.closed_hall, 6, 0, 23, 0, reduction=5)
+
+    def local(self, hour, minute=0):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time(hour=hour, minute=minute)),
+            timezone.get_current_timezone(),
+        )
+
+    def book(self, resource, start_hour, end_hour):
+        return Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(start_hour),
+            end_datetime=self.local(end_hour),
+            status="active",
+        )
+
+    def outage(self, resource, start_hour, start_minute, end_hour, end_minute, reduction):
+        ResourceOutage.objects.create(
+            resource=resource,
+            start_datetime=self.local(start_hour, start_minute),
+            end_datetime=self.local(end_hour, end_minute),
+            capacity_reduction=reduction,
+        )
+
+    def test_batch_costs_two_queries(self):
+        queries = [
+            AvailabilityQuery(self.free_desk, self.local(9), self.local(10)),
+            AvailabilityQuery(self.busy_desk, self.local(10), self.local(12)),
+            AvailabilityQuery(self.busy_desk, self.local(10), self.local(12), self.own.id),
+            AvailabilityQuery(self.busy_desk, self.local(11), self.local(12)),
+            AvailabilityQuery(self.broken_desk, self.local(9), self.local(10)),
+            AvailabilityQuery(self.hall, self.local(9), self.local(12)),
+            AvailabilityQuery(self.hall, self.local(12), self.local(13)),
+            AvailabilityQuery(self.closed_hall, self.local(9), self.local(10)),
+        ]
+
+        # брони и outage всех ресурсов пачки — по одному запросу
+        with self.assertNumQueries(2):
+            results = availability_service.evaluate(queries)
+
+        self.assertEqual(
+            results,
+            [
+                AvailabilityResult(1, 1, 0, "ok"),
+                AvailabilityResult(1, 0, 1, "full"),
+                AvailabilityResult(1, 1, 0, "ok"),
+                # касание в 11:00 — не пересечение
+                AvailabilityResult(1, 1, 0, "ok"),
+                AvailabilityResult(0, 0, 0, "outage"),
+                # в 10:30–11:00 две брони и outage на одно место из трёх
+                AvailabilityResult(2, 0, 2, "full"),
+                AvailabilityResult(3, 3, 0, "ok"),
+                AvailabilityResult(0, 0, 0, "outage"),
+            ],
+        )
+
+    def test_empty_batch_makes_no_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(availability_service.evaluate([]), [])
+
+
+class ExtensionLimitsTests(TestCase):
+    """Продление брони 9:00–12:00 до конца рабочего дня (23:00)."""
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        self.own_desk = Resource.objects.create(type=desk_type, name="Свой")
+        self.booked_desk = Resource.objects.create(type=desk_type, name="С бронью")
+        self.broken_desk = Resource.objects.create(type=desk_type, name="С outage")
+        self.busy_desk = Resource.objects.create(type=desk_type, name="Занят сейчас")
+        self.hall = Resource.objects.create(type=hall_type, name="Зал", capacity=2)
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.own = self.book(self.own_desk, 9, 12)
+        self.book(self.own_desk, 23, 24)
+        self.book(self.booked_desk, 14, 15)
+        self.book(self.booked_desk, 16, 17)
+        ResourceOutage.objects.create(
+            resource=self.broken_desk,
+            start_datetime=self.local(13),
+            end_datetime=self.local(20),
+        )
+        self.book(self.busy_desk, 11, 13)
+        # зал на двоих насыщается, когда вторая бронь перекрывает первую
+        self.book(self.hall, 13, 16)
+        self.book(self.hall, 15, 17)
+
+    def local(self, hour):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time()),
+            timezone.get_current_timezone(),
+        ) + datetime.timedelta(hours=hour)
+
+    def book(self, resource, start_hour, end_hour):
+        return Booking.objects.create(
+            user=self.user,
+            resource=resource,
+            booking_type="workspace",
+            time_format="hour",
+            start_datetime=self.local(start_hour),
+            end_datetime=self.local(end_hour),
+            status="active",
+        )
+
+    def test_limits(self):
+        resources = [
+            self.own_desk,
+            self.booked_desk,
+            self.broken_desk,
+            self.busy_desk,
+            self.hall,
+        ]
+
+        with self.assertNumQueries(2):
+            limits = extension_limits(
+                resources, self.local(12), self.local(23), exclude_booking_id=self.own.id
+            )
+
+        self.assertEqual(
+            limits,
+            {
+                # свободен до конца дня: бронь с 23:00 уже за интервалом
+                self.own_desk.id: self.local(23),
+                self.booked_desk.id: self.local(14),
+                self.broken_desk.id: self.local(13),
+                self.busy_desk.id: self.local(12),
+                self.hall.id: self.local(15),
+            },
+        )
+
+    def test_own_booking_is_excluded_only_when_requested(self):
+        limits = extension_limits([self.own_desk], self.local(10), self.local(23))
+        self.assertEqual(limits, {self.own_desk.id: self.local(10)})
+
+        limits = extension_limits(
+            [self.own_desk], self.local(10), self.local(23), exclude_booking_id=self.own.id
+        )
+        self.assertEqual(limits, {self.own_desk.id: self.local(23)})
+
+    def test_empty_resources(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(extension_limits([], self.local(12), self.local(23)), {})
+
+
+class AvailabilityCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        availability_cache.reset_stats()
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        equipment = ResourceCategory.objects.create(code="equipment", name="Оборудование")
+        self.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        for name in ("Зал", "Переговорная", "Кабинка"):
+            ResourceType.objects.create(category=workspace, name=name)
+        ResourceType.objects.create(category=equipment, name="Монитор")
+
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.computed = []
+
+    def local(self, hour, days=0):
+        return timezone.make_aware(
+            datetime.datetime.combine(
+                self.day + datetime.timedelta(days=days), datetime.time(hour=hour)
+            ),
+            timezone.get_current_timezone(),
+        )
+
+    def lookup(self, category, start_dt, end_dt):
+        """get_or_compute, который запоминает, какие ответы пришлось считать."""
+        label = (category, start_dt, end_dt)
+
+        def compute():
+            self.computed.append(label)
+            return [label]
+
+        return availability_cache.get_or_compute(category, start_dt, end_dt, compute)
+
+    def test_hit_costs_two_shared_reads(self):
+        intervals = {
+            "one day": (self.local(9), self.local(10)),
+            "many days": (self.local(9), self.local(18, days=20)),
+        }
+        for label, (start, end) in intervals.items():
+            with self.subTest(label):
+                self.lookup("workspace", start, end)
+                # поколение каталога и поколения всех типов — по одному get_many
+                with self.assertNumQueries(2):
+                    self.assertEqual(
+                        self.lookup("workspace", start, end), [("workspace", start, end)]
+                    )
+
+    def test_invalidation_scope(self):
+        day_one = ("workspace", self.local(9), self.local(10))
+        day_two = ("workspace", self.local(9, days=1), self.local(10, days=1))
+        other_category = ("equipment", self.local(9), self.local(10))
+        both_days = ("workspace", self.local(9), self.local(10, days=1))
+        lookups = (day_one, day_two, other_category, both_days)
+        for args in lookups:
+            self.lookup(*args)
+        self.computed.clear()
+
+        availability_cache.invalidate(self.desk_type.id, self.local(12), self.local(13))
+        for args in lookups:
+            self.lookup(*args)
+
+        # тот же тип в тот же день и многодневные ответы типа — заново,
+        # другой день и другая категория — из кэша
+        self.assertEqual(self.computed, [day_one, both_days])
+
+    def test_catalog_invalidation_resets_everything(self):
+        args = ("equipment", self.local(9), self.local(10))
+        self.lookup(*args)
+        availability_cache.invalidate_catalog()
+        self.lookup(*args)
+        self.assertEqual(self.computed, [args, args])
+
+    def test_stats_counters(self):
+        args = ("workspace", self.local(9), self.local(10))
+        self.lookup(*args)
+        self.lookup(*args)
+        self.lookup(*args)
+        self.lookup(
+            "workspace",
+            self.local(9),
+            self.local(9, days=availability_cache.MAX_CACHED_DAYS + 1),
+        )
+        availability_cache.invalidate(self.desk_type.id, self.local(9), self.local(10))
+        availability_cache.invalidate(None, self.local(9), self.local(10))
+
+        self.assertEqual(
+            availability_cache.stats(),
+            {"hits": 2, "misses": 1, "invalidations": 1, "bypass": 1, "hit_rate": 0.6667},
+        )
+
+        availability_cache.reset_stats()
+        self.assertEqual(
+            availability_cache.stats(),
+            {"hits": 0, "misses": 0, "invalidations": 0, "bypass": 0, "hit_rate": None},
+        )
+
+
+class CollectAvailableResourcesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        for i in range(10):
+            Resource.objects.create(type=desk_type, name=f"Стол {i}")
+            Resource.objects.create(type=hall_type, name=f"Зал {i}", capacity=5)
+
+        self.start_dt = timezone.now() + datetime.timedelta(days=1)
+        self.end_dt = self.start_dt + datetime.timedelta(hours=1)
+        catalog.get_snapshot()
+
+    def test_catalog_snapshot_is_read_once_per_list(self):
+        # ресурсы, брони, outage и одна версия каталога на весь список
+        with self.assertNumQueries(4):
+            results = collect_available_resources(
+                Resource.objects.order_by("id"), self.start_dt, self.end_dt
+            )
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0]["type"]["name"], "Стол")
+        self.assertEqual(results[1]["free_capacity"], 5)
+
+
+class AvailableQueryCountTests(TestCase):
+    """Число запросов /available/ не зависит от числа ресурсов."""
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        self.user = User.objects.create(username="client")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workspace = ResourceCategory.objects.create(code="workspace", name="Рабочие места")
+        self.desk_type = ResourceType.objects.create(category=workspace, name="Стол")
+        self.hall_type = ResourceType.objects.create(category=workspace, name="Зал")
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        self.hour = 8
+
+    def add_resources(self, count):
+        for i in range(count):
+            desk = Resource.objects.create(type=self.desk_type, name=f"Стол {i}")
+            hall = Resource.objects.create(type=self.hall_type, name=f"Зал {i}", capacity=3)
+            ResourceOutage.objects.create(
+                resource=desk,
+                start_datetime=self.at(7),
+                end_datetime=self.at(20),
+            )
+            Booking.objects.create(
+                user=self.user,
+                resource=hall,
+                booking_type="workspace",
+                time_format="hour",
+                start_datetime=self.at(6),
+                end_datetime=self.at(22),
+                status="active",
+            )
+
+    def at(self, hour):
+        return timezone.make_aware(
+            datetime.datetime.combine(self.day, datetime.time(hour=hour)),
+            timezone.get_current_timezone(),
+        )
+
+    def params(self):
+        # новый интервал на каждый вызов — ответ не берётся из кэша доступности
+        self.hour += 1
+        return {
+            "booking_type": "workspace",
+            "start_datetime": self.at(self.hour).isoformat(),
+            "end_datetime": self.at(self.hour + 1).isoformat(),
+        }
+
+    def call_legacy(self):
+        response = self.client.get("/api/resources/available/", self.params())
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def call_action(self):
+        request = APIRequestFactory().get("/api/resources/available/", self.params())
+        force_authenticate(request, user=self.user)
+        response = ResourceViewSet.as_view({"get": "available"})(request)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def count_queries(self, call, resources):
+        self.add_resources(resources)
+        call()  # прогрев: снимок каталога, типы категории
+        with CaptureQueriesContext(connection) as ctx:
+            data = call()
+        self.assertEqual(len(data), Resource.objects.filter(type=self.hall_type).count())
+        return len(ctx.captured_queries)
+
+    def test_legacy_view_constant_queries(self):
+        small = self.count_queries(self.call_legacy, 5)
+        large = self.count_queries(self.call_legacy, 5)
+        self.assertEqual(small, large)
+
+    def test_viewset_action_constant_queries(self):
+        small = self.count_queries(self.call_action, 5)
+        large = self.count_queries(self.call_action, 5)
+        self.assertEqual(small, large)
@@ -0,0 +1,56 @@
+# backend/resources/versions.py
+"""
+Версии закэшированных в памяти данных, общие для всех процессов.
+
+Снимок каталога, индексы интервалов и ответы кэша доступности помечаются
+версией из общего кэша (CACHES["shared"]). Запись после коммита ставит
+новую версию — случайное число, а не incr: так не нужен атомарный
+инкремент (у DatabaseCache его нет), и две параллельные записи не
+могут получить одинаковую версию. Читатель сравнивает свою версию
+с общей и при расхождении перечитывает данные.
+"""
+import secrets
+
+from django.core.cache import caches
+
+
+SHARED_CACHE_ALIAS = "shared"
+
+
+def shared_cache():
+    return caches[SHARED_CACHE_ALIAS]
+
+
+def _fresh():
+    return secrets.randbits(63)
+
+
+def current(key):
+    """Текущая версия ключа; если её нет — заводим."""
+    return current_many([key])[0]
+
+
+def current_many(keys):
+    """Версии набора ключей одним запросом к кэшу (плюс заведение отсутствующих)."""
+    cache = shared_cache()
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        # add не перезапишет версию, заведённую параллельно другим процессом,
+        # поэтому итог перечитываем одним get_many
+        for key in missing:
+            cache.add(key, _fresh(), timeout=None)
+        values.update(cache.get_many(missing))
+    # ключ могли вытеснить сразу после add — разовая версия просто не совпадёт
+    return [values[key] if key in values else _fresh() for key in keys]
+
+
+def bump(key):
+    """Новая версия ключа для всех процессов."""
+    version = _fresh()
+    shared_cache().set(key, version, timeout=None)
+    return version
+
+
+def bump_many(keys):
+    shared_cache().set_many({key: _fresh() for key in keys}, timeout=None)
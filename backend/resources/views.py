@@ -13,54 +13,66 @@ from django.utils import timezone
 import datetime
 import calendar
 
-from bookings.models import Booking
+from bookings import occupancy
+from bookings.utils import WORKDAY_START_HOUR
+from . import availability_cache
+from .availability import (
+    availability_service,
+    compute_capacities,
+    find_free_slots,
+    free_capacity_heatmap,
+)
 from .models import Resource, ResourceCategory, ResourceType
 from .serializers import (
     ResourceCategorySerializer,
     ResourceTypeSerializer,
     ResourceSerializer,
 )
-from issues.models import ResourceOutage
+
+
+# максимальный диапазон тепловой карты за один запрос
+HEATMAP_MAX_DAYS = 31
+
+# поиск ближайших свободных стартов
+NEXT_FREE_SLOT_DEFAULT_DAYS = 7
+NEXT_FREE_SLOT_MAX_DAYS = 31
+NEXT_FREE_SLOT_DEFAULT_LIMIT = 5
+NEXT_FREE_SLOT_MAX_LIMIT = 50
 
 
 # ==========================================================
-# ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ — вычисление effective_capacity
+# ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ — вычисление effective_capacity
 # ==========================================================
 
 def get_effective_capacity(resource, start_dt, end_dt):
     """Возвращает (effective_capacity, free_capacity, overlap_count)."""
+    result = availability_service.evaluate_one(resource, start_dt, end_dt)
+    return result.effective_capacity, result.free_capacity, result.peak_load
 
-    # базовая вместимость
-    base_capacity = resource.capacity if resource.capacity is not None else 1
 
-    # уменьшение по outage
-    outages = ResourceOutage.objects.filter(
-        resource=resource,
-        start_datetime__lt=end_dt,
-        end_datetime__gt=start_dt,
-    )
-
-    total_reduction = sum(o.capacity_reduction or 0 for o in outages)
-    effective_capacity = base_capacity - total_reduction
+def collect_available_resources(qs, start_dt, end_dt):
+    """
+    Список свободных ресурсов из qs на интервал [start_dt, end_dt)
+    в формате ResourceSerializer + effective_capacity / free_capacity.
 
-    if effective_capacity <= 0:
-        return 0, 0, 0  # полностью недоступен
+    Вместимость считается пакетно, поэтому число запросов
+    не зависит от количества ресурсов.
+    """
+    # вложенный тип сериализатор берёт из снимка каталога — join не нужен
+    resources = list(qs)
+    capacities = compute_capacities(resources, start_dt, end_dt)
 
-    # пересекающиеся активные брони
-    overlapping = Booking.objects.filter(
-        resource=resource,
-        status__in=["active", "conflicted"],
-        start_datetime__lt=end_dt,
-        end_datetime__gt=start_dt,
-    )
+    free = [res for res in resources if capacities[res.id][1] > 0]
 
-    overlap_count = overlapping.count()
-    free_capacity = max(effective_capacity - overlap_count, 0)
+    # many=True: у всех элементов один context, а значит, один снимок
+    # каталога (и одно чтение его версии) на весь список
+    results = list(ResourceSerializer(free, many=True).data)
+    for res, data in zip(free, results):
+        effective_capacity, free_capacity, _ = capacities[res.id]
+        data["effective_capacity"] = effective_capacity
+        data["free_capacity"] = free_capacity
 
-    if free_capacity <= 0:
-        return effective_capacity, 0, overlap_count
-
-    return effective_capacity, free_capacity, overlap_count
+    return results
 
 
 
@@ -79,11 +91,7 @@ class ResourceTypeViewSet(viewsets.ModelViewSet):
 
 
 class ResourceViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Resource.objects.select_related("type", "type__category")
-        .all()
-        .order_by("id")
-    )
+    queryset = Resource.objects.all().order_by("id")
     serializer_class = ResourceSerializer
     permission_classes = [IsAdminUser]
 
@@ -169,19 +177,245 @@ class ResourceViewSet(viewsets.ModelViewSet):
         if booking_type:
             qs = qs.filter(type__category__code=booking_type)
 
-        results = []
+        return Response(
+            availability_cache.get_or_compute(
+                booking_type or None,
+                start_dt,
+                end_dt,
+                lambda: collect_available_resources(qs, start_dt, end_dt),
+            )
+        )
+
+    @action(
+        detail=False,
+        methods=["get", "delete"],
+        url_path="availability-cache-stats",
+        permission_classes=[IsAdminUser],
+    )
+    def availability_cache_stats(self, request):
+        """
+        Статистика кэша доступности (только админ):
+        hits / misses / invalidations / bypass и hit_rate.
+        DELETE — обнулить счётчики.
+        """
+        if request.method == "DELETE":
+            availability_cache.reset_stats()
+        return Response(availability_cache.stats())
+
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="heatmap",
+        permission_classes=[IsAuthenticated],
+    )
+    def heatmap(self, request):
+        """
+        Тепловая карта свободной вместимости: ресурсы × 15-минутные слоты.
+
+        Параметры:
+          - booking_type — код категории (по умолчанию workspace);
+          - resource_type_id — необязательный фильтр по типу;
+          - start_date — первый день, YYYY-MM-DD;
+          - end_date — последний день включительно (по умолчанию = start_date).
+
+        Ответ компактный — массивы вместо объектов на каждую ячейку:
+        {
+          "slot_minutes": 15,
+          "day_start": "06:00",
+          "slots_per_day": 68,
+          "dates": ["2025-11-25", ...],
+          "resources": [{"id": 1, "name": "...", "type_id": 2, "capacity": null}, ...],
+          "free": [            # по ресурсам в порядке resources
+            [[1, 1, 0, ...],   # по дням в порядке dates, по слоту на элемент
+             ...],
+            ...
+          ]
+        }
+        """
+        booking_type = request.query_params.get("booking_type", "workspace")
+        resource_type_id = request.query_params.get("resource_type_id")
+        start_date_str = request.query_params.get("start_date")
+        end_date_str = request.query_params.get("end_date") or start_date_str
+
+        if not start_date_str:
+            return Response({"detail": "start_date обязателен."}, status=400)
+
+        if resource_type_id:
+            try:
+                resource_type_id = int(resource_type_id)
+            except ValueError:
+                return Response(
+                    {"detail": "resource_type_id должен быть целым числом."},
+                    status=400,
+                )
+
+        try:
+            start_date = datetime.date.fromisoformat(start_date_str)
+            end_date = datetime.date.fromisoformat(end_date_str)
+        except ValueError:
+            return Response(
+                {"detail": "Некорректная дата. Ожидается YYYY-MM-DD."},
+                status=400,
+            )
+
+        if end_date < start_date:
+            return Response(
+                {"detail": "end_date не может быть раньше start_date."},
+                status=400,
+            )
+
+        days_count = (end_date - start_date).days + 1
+        if days_count > HEATMAP_MAX_DAYS:
+            return Response(
+                {"detail": f"Диапазон не может превышать {HEATMAP_MAX_DAYS} дней."},
+                status=400,
+            )
+
+        days = [start_date + datetime.timedelta(days=i) for i in range(days_count)]
+
+        qs = Resource.objects.filter(status="active").order_by("id")
+        if booking_type:
+            qs = qs.filter(type__category__code=booking_type)
+        if resource_type_id:
+            qs = qs.filter(type_id=resource_type_id)
+
+        resources = list(qs)
+        free = free_capacity_heatmap(resources, days)
+
+        return Response(
+            {
+                "slot_minutes": occupancy.SLOT_MINUTES,
+                "day_start": f"{WORKDAY_START_HOUR:02d}:00",
+                "slots_per_day": occupancy.SLOTS_PER_DAY,
+                "dates": [d.isoformat() for d in days],
+                "resources": [
+                    {
+                        "id": res.id,
+                        "name": res.name,
+                        "type_id": res.type_id,
+                        "capacity": res.capacity,
+                    }
+                    for res in resources
+                ],
+                "free": [free[res.id] for res in resources],
+            }
+        )
+
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="next-free-slot",
+        permission_classes=[IsAuthenticated],
+    )
+    def next_free_slot(self, request):
+        """
+        Ближайшие свободные старты для типа (или категории) ресурсов.
+
+        Параметры:
+          - resource_type_id или booking_type (код категории);
+          - duration_minutes — длительность, кратная 15 минутам;
+          - horizon_days — на сколько дней вперёд искать (по умолчанию 7);
+          - limit — сколько вариантов вернуть (по умолчанию 5);
+          - from — не раньше этого момента (ISO 8601, по умолчанию сейчас).
+
+        Ответ:
+        {
+          "options": [
+            {"resource_id": 3, "resource_name": "...",
+             "start_datetime": "...", "end_datetime": "..."},
+            ...
+          ]
+        }
+        """
+        params = request.query_params
+        resource_type_id = params.get("resource_type_id")
+        booking_type = params.get("booking_type")
+
+        if not resource_type_id and not booking_type:
+            return Response(
+                {"detail": "Нужно передать resource_type_id или booking_type."},
+                status=400,
+            )
+
+        if resource_type_id:
+            try:
+                resource_type_id = int(resource_type_id)
+            except ValueError:
+                return Response(
+                    {"detail": "resource_type_id должен быть целым числом."},
+                    status=400,
+                )
+
+        try:
+            duration_minutes = int(params.get("duration_minutes", ""))
+            horizon_days = int(params.get("horizon_days", NEXT_FREE_SLOT_DEFAULT_DAYS))
+            limit = int(params.get("limit", NEXT_FREE_SLOT_DEFAULT_LIMIT))
+        except ValueError:
+            return Response(
+                {"detail": "duration_minutes, horizon_days и limit должны быть целыми числами."},
+                status=400,
+            )
+
+        if duration_minutes <= 0 or duration_minutes % occupancy.SLOT_MINUTES != 0:
+            return Response(
+                {"detail": "duration_minutes должен быть положительным и кратным 15."},
+                status=400,
+            )
 
-        for res in qs:
-            effective_capacity, free_capacity, overlap_count = \
-                get_effective_capacity(res, start_dt, end_dt)
+        if not (1 <= horizon_days <= NEXT_FREE_SLOT_MAX_DAYS):
+            return Response(
+                {"detail": f"horizon_days должен быть от 1 до {NEXT_FREE_SLOT_MAX_DAYS}."},
+                status=400,
+            )
 
-            if free_capacity > 0:
-                data = ResourceSerializer(res).data
-                data["effective_capacity"] = effective_capacity
-                data["free_capacity"] = free_capacity
-                results.append(data)
+        if not (1 <= limit <= NEXT_FREE_SLOT_MAX_LIMIT):
+            return Response(
+                {"detail": f"limit должен быть от 1 до {NEXT_FREE_SLOT_MAX_LIMIT}."},
+                status=400,
+            )
 
-        return Response(results)
+        start_from = timezone.now()
+        from_str = params.get("from")
+        if from_str:
+            from_dt = parse_datetime(from_str)
+            if from_dt is None:
+                return Response(
+                    {"detail": "Неверный формат from, ожидается ISO 8601."},
+                    status=400,
+                )
+            if timezone.is_naive(from_dt):
+                from_dt = timezone.make_aware(from_dt)
+            start_from = max(start_from, from_dt)
+
+        qs = Resource.objects.filter(status="active").order_by("id")
+        if resource_type_id:
+            qs = qs.filter(type_id=resource_type_id)
+        else:
+            qs = qs.filter(type__category__code=booking_type)
+
+        slots = find_free_slots(
+            qs,
+            start_from,
+            datetime.timedelta(minutes=duration_minutes),
+            horizon_days,
+            limit,
+        )
+
+        return Response(
+            {
+                "options": [
+                    {
+                        "resource_id": res.id,
+                        "resource_name": res.name,
+                        "start_datetime": start_dt,
+                        "end_datetime": end_dt,
+                    }
+                    for start_dt, end_dt, res in slots
+                ]
+            }
+        )
 
 
 # СТАРЫЙ ЭНДПОИНТ Логика аналогична available().
@@ -225,16 +459,11 @@ class ResourceAvailableView(APIView):
             status="active",
         )
 
-        results = []
-
-        for res in qs:
-            effective_capacity, free_capacity, overlap_count = \
-                get_effective_capacity(res, start_dt, end_dt)
-
-            if free_capacity > 0:
-                data = ResourceSerializer(res).data
-                data["effective_capacity"] = effective_capacity
-                data["free_capacity"] = free_capacity
-                results.append(data)
-
-        return Response(results)
+        return Response(
+            availability_cache.get_or_compute(
+                booking_type,
+                start_dt,
+                end_dt,
+                lambda: collect_available_resources(qs, start_dt, end_dt),
+            )
+        )
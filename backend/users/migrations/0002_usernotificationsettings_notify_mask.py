@@ -0,0 +1,104 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+import users.models
+
+
+# снимок Notification.EVENT_TYPE_CHOICES на момент миграции
+EVENT_TYPES = [
+    "booking_created",
+    "booking_extended",
+    "booking_cancelled",
+    "booking_reassigned",
+    "booking_conflicted",
+    "issue_created",
+    "issue_confirmed",
+    "issue_rejected",
+    "service_order_created",
+]
+EVENT_BITS = {code: 1 << index for index, code in enumerate(EVENT_TYPES)}
+ALL_EVENTS_MASK = sum(EVENT_BITS.values())
+
+OLD_DEFAULT = "booking_created,booking_updated,booking_cancelled,reminder"
+
+# старые типы, которых нет среди событий
+LEGACY_TYPES = {
+    "booking_updated": (
+        EVENT_BITS["booking_extended"]
+        | EVENT_BITS["booking_reassigned"]
+        | EVENT_BITS["booking_conflicted"]
+    ),
+    "reminder": 0,
+}
+
+
+# Преобразование notify_types → notify_mask теряет часть информации:
+#   - пустая строка и нетронутое OLD_DEFAULT дают подписку на всё;
+#   - booking_updated разворачивается в три бита и назад возвращается
+#     кодами booking_extended / booking_reassigned / booking_conflicted;
+#   - reminder и неизвестные коды отбрасываются, порядок кодов не хранится.
+# Обратно маска переводится без потерь: mask → notify_types → mask даёт
+# ту же маску (пустая маска записывается как "reminder" — пустая строка
+# вернулась бы подпиской на всё). Проверяется в users/tests.py.
+
+
+def types_to_mask(value):
+    codes = [code.strip() for code in (value or "").split(",") if code.strip()]
+    if not codes or ",".join(codes) == OLD_DEFAULT:
+        # значение по умолчанию никто не выбирал осознанно — подписываем на всё
+        return ALL_EVENTS_MASK
+
+    mask = 0
+    for code in codes:
+        mask |= EVENT_BITS.get(code, LEGACY_TYPES.get(code, 0))
+    return mask
+
+
+def mask_to_types(mask):
+    return ",".join(code for code, bit in EVENT_BITS.items() if mask & bit)
+
+
+def forwards(apps, schema_editor):
+    Settings = apps.get_model("users", "UserNotificationSettings")
+    rows = list(Settings.objects.only("id", "notify_types"))
+    for row in rows:
+        row.notify_mask = types_to_mask(row.notify_types)
+    Settings.objects.bulk_update(rows, ["notify_mask"], batch_size=1000)
+
+
+def mask_to_old_types(mask):
+    if mask == ALL_EVENTS_MASK:
+        return OLD_DEFAULT
+    # reminder → 0: так отписка от всего переживает повторную миграцию вперёд
+    return mask_to_types(mask) or "reminder"
+
+
+def backwards(apps, schema_editor):
+    Settings = apps.get_model("users", "UserNotificationSettings")
+    rows = list(Settings.objects.only("id", "notify_mask"))
+    for row in rows:
+        row.notify_types = mask_to_old_types(row.notify_mask)
+    Settings.objects.bulk_update(rows, ["notify_types"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usernotificationsettings",
+            name="notify_mask",
+            field=models.IntegerField(
+                default=users.models.default_notify_mask,
+                help_text="Битовая маска типов уведомлений, на которые подписан пользователь",
+            ),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name="usernotificationsettings",
+            name="notify_types",
+        ),
+    ]
@@ -19,16 +19,24 @@ class UserProfile(models.Model):
         return f"{self.user.username} ({self.role})"
 
 
+def default_notify_mask():
+    """По умолчанию пользователь подписан на все события."""
+    from notifications.events import ALL_EVENTS_MASK
+
+    return ALL_EVENTS_MASK
+
+
 class UserNotificationSettings(models.Model):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name="notification_settings"
     )
     notify_email = models.BooleanField(default=True)
     notify_telegram = models.BooleanField(default=False)
-    notify_types = models.CharField(
-        max_length=255,
-        default="booking_created,booking_updated,booking_cancelled,reminder",
-        help_text="Список типов уведомлений через запятую",
+    # бит события — 1 << позиция в Notification.EVENT_TYPE_CHOICES
+    # (см. notifications/events.py)
+    notify_mask = models.IntegerField(
+        default=default_notify_mask,
+        help_text="Битовая маска типов уведомлений, на которые подписан пользователь",
     )
 
     def __str__(self):
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 
+from notifications.events import EVENT_BITS, mask_from_types, types_from_mask
+
 from .models import UserProfile, UserNotificationSettings
 
 
@@ -111,8 +113,18 @@ class UserMeSerializer(serializers.Serializer):
 
     notify_email = serializers.BooleanField(required=False)
     notify_telegram = serializers.BooleanField(required=False)
+    # коды событий через запятую; хранятся битовой маской notify_mask
     notify_types = serializers.CharField(allow_blank=True, required=False)
 
+    def validate_notify_types(self, value):
+        codes = [code.strip() for code in value.split(",") if code.strip()]
+        unknown = [code for code in codes if code not in EVENT_BITS]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Неизвестные типы уведомлений: {', '.join(unknown)}."
+            )
+        return codes
+
     def to_representation(self, instance):
         """
         instance — это словарь {"user": ..., "profile": ..., "settings": ...}
@@ -131,7 +143,7 @@ class UserMeSerializer(serializers.Serializer):
             "company": profile.company or "",
             "notify_email": settings.notify_email,
             "notify_telegram": settings.notify_telegram,
-            "notify_types": settings.notify_types or "",
+            "notify_types": ",".join(types_from_mask(settings.notify_mask)),
         }
 
     def update(self, instance, validated_data):
@@ -165,7 +177,7 @@ class UserMeSerializer(serializers.Serializer):
         if "notify_telegram" in validated_data:
             settings.notify_telegram = validated_data["notify_telegram"]
         if "notify_types" in validated_data:
-            settings.notify_types = validated_data["notify_types"]
+            settings.notify_mask = mask_from_types(validated_data["notify_types"])
         settings.save()
 
         return instance
@@ -1,3 +1,93 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
 
-# Create your tests here.
+
+BEFORE = [("users", "0001_initial")]
+AFTER = [("users", "0002_usernotificationsettings_notify_mask")]
+
+OLD_DEFAULT = "booking_created,booking_updated,booking_cancelled,reminder"
+
+
+# снимок типов событий из миграции 0002 (бит — позиция в списке)
+EVENT_TYPES = [
+    "booking_created",
+    "booking_extended",
+    "booking_cancelled",
+    "booking_reassigned",
+    "booking_conflicted",
+    "issue_created",
+    "issue_confirmed",
+    "issue_rejected",
+    "service_order_created",
+]
+
+
+def bits(*codes):
+    return sum(1 << EVENT_TYPES.index(code) for code in codes)
+
+
+ALL = bits(*EVENT_TYPES)
+
+
+class NotifyMaskMigrationTests(TransactionTestCase):
+    """users/0002: notify_types → notify_mask и обратно."""
+
+    # старое значение → ожидаемая маска
+    FORWARD = {
+        OLD_DEFAULT: ALL,
+        "": ALL,
+        "booking_created,booking_cancelled": bits("booking_created", "booking_cancelled"),
+        "booking_updated": bits(
+            "booking_extended", "booking_reassigned", "booking_conflicted"
+        ),
+        "reminder": 0,
+        " issue_created , unknown": bits("issue_created"),
+    }
+
+    def setUp(self):
+        self.users = {
+            value: User.objects.create(username=f"user{index}")
+            for index, value in enumerate(self.FORWARD)
+        }
+
+    def tearDown(self):
+        self.migrate(None)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        if targets is None:
+            targets = executor.loader.graph.leaf_nodes()
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def settings_model(self, apps):
+        return apps.get_model("users", "UserNotificationSettings")
+
+    def test_forward_mapping_and_round_trip(self):
+        Settings = self.settings_model(self.migrate(BEFORE))
+        for value, user in self.users.items():
+            Settings.objects.create(user_id=user.id, notify_types=value)
+
+        Settings = self.settings_model(self.migrate(AFTER))
+        masks = dict(Settings.objects.values_list("user_id", "notify_mask"))
+        for value, user in self.users.items():
+            with self.subTest(notify_types=value):
+                self.assertEqual(masks[user.id], self.FORWARD[value])
+
+        Settings = self.settings_model(self.migrate(BEFORE))
+        types = dict(Settings.objects.values_list("user_id", "notify_types"))
+        self.assertEqual(types[self.users[OLD_DEFAULT].id], OLD_DEFAULT)
+        self.assertEqual(
+            types[self.users["booking_updated"].id],
+            "booking_extended,booking_reassigned,booking_conflicted",
+        )
+        self.assertEqual(types[self.users["reminder"].id], "reminder")
+
+        # маска после повторной миграции вперёд не меняется
+        Settings = self.settings_model(self.migrate(AFTER))
+        self.assertEqual(
+            dict(Settings.objects.values_list("user_id", "notify_mask")), masks
+        )